@@ -1,7 +1,8 @@
 from ast import literal_eval
+from collections import deque
 from functools import partial
 from random import random
-from time import sleep
+from time import sleep, time
 from types import FunctionType
 
 import importlib
@@ -11,25 +12,36 @@ import os
 import sys
 import pkg_resources
 import re
+import weakref
 import yaml
-import json
+from PyWebRunner import js as scripts
+from PyWebRunner import script as script_plans
+from PyWebRunner import timing
+from PyWebRunner import launch
+from PyWebRunner import proxy as proxies
+from PyWebRunner.profiler import TransportProfiler
+from PyWebRunner.transport import PooledRemoteConnection
+from PyWebRunner.locator import locate
+from PyWebRunner.poll import get_strategy
 from PyWebRunner.utils import (which, Timeout, fix_firefox, fix_chrome,
-                               fix_gecko, prompt, download_file)
+                               fix_gecko, prompt, download_file, env_flag)
 from xvfbwrapper import Xvfb
 from selenium import webdriver
 from selenium.common.exceptions import (NoSuchElementException, NoSuchWindowException,
                                         NoAlertPresentException, WebDriverException,
-                                        TimeoutException)
+                                        TimeoutException, StaleElementReferenceException)
 from selenium.webdriver.common.action_chains import ActionChains
 from selenium.webdriver.common.alert import Alert
-from selenium.webdriver.common.by import By
 from selenium.webdriver.common.desired_capabilities import DesiredCapabilities
 from selenium.webdriver.common.keys import Keys
-from selenium.webdriver.remote.remote_connection import LOGGER as s_logger
-from selenium.webdriver.support.ui import Select, WebDriverWait
+from selenium.webdriver.remote.remote_connection import LOGGER as s_logger, RemoteConnection
+from selenium.webdriver.support.ui import Select
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.remote.webelement import WebElement
 
+# How many of the latest clicks and waits click_waits and wait_polls keep.
+RECENT = 1000
+
 
 class WebRunner(object):
     """
@@ -46,6 +58,14 @@ class WebRunner(object):
     # Variables for configuration
     browser = None
     extra_verbose = False
+    # Last script timeout sent to the driver (see _async_js)
+    _script_timeout = None
+    # PyWebRunner.timing.CommandTimer when commands are being timed.
+    timer = None
+    # PyWebRunner.profiler.TransportProfiler when wire commands are being profiled.
+    profiler = None
+    # PyWebRunner.proxy.Proxy when requests are being blocked.
+    proxy = None
     silence = open(os.devnull, 'w')
 
     def __init__(self, **kwargs):
@@ -60,6 +80,16 @@ class WebRunner(object):
         width = kwargs.get('width', 1440)
         height = kwargs.get('height', 1200)
         self.default_offset = kwargs.get('default_offset', 0)
+        fast_click = kwargs.get('fast_click', False)
+        fast_fill = kwargs.get('fast_fill', False)
+        time_commands = kwargs.get('time_commands', False)
+        profile = kwargs.get('profile', False)
+        keep_alive = kwargs.get('keep_alive', True)
+        wait_backend = kwargs.get('wait_backend', 'poll')
+        poll = kwargs.get('poll', 'fixed')
+        launch_profile = kwargs.get('launch_profile', 'default')
+        block = kwargs.get('block')
+        proxy_address = kwargs.get('proxy_address')
 
         desired_capabilities = kwargs.get('desired_capabilities', 'CHROME')
         command_executor = kwargs.get('command_executor', 'http://127.0.0.1:4444/wd/hub')
@@ -86,6 +116,16 @@ class WebRunner(object):
         self.driver = os.environ.get('WR_DRIVER', driver).lower()
         # This is for headless running.
         self.xvfb = os.environ.get('WR_XVFB', xvfb)
+        # Browser arguments and preferences: 'default' or 'lean'. (See PyWebRunner.launch)
+        self.launch_profile = os.environ.get('WR_LAUNCH_PROFILE', launch_profile)
+        # Resource types, hosts and URL globs the browser doesn't load. (See PyWebRunner.proxy)
+        # Any list (even an empty one) routes the browser through a blocking proxy.
+        self.block = block
+        if os.environ.get('WR_BLOCK') is not None:
+            self.block = [rule for rule in os.environ['WR_BLOCK'].split(',') if rule]
+        # host:port of a proxy that is already running (shared by several runners).
+        # With block, the runner's own blocking proxy sends the other requests on to it.
+        self.proxy_address = os.environ.get('WR_PROXY', proxy_address)
         # Use MooTools instead of jQuery
         self.mootools = os.environ.get('WR_MOOTOOLS', mootools)
         # Global timeout option for all wait_* functions
@@ -95,14 +135,48 @@ class WebRunner(object):
         # XVFB virtual monitor width
         self.height = os.environ.get('WR_HEIGHT', height)
         self.js_errorcollector = True
+        # Use the single in-browser readiness check for click()
+        self.fast_click = env_flag('WR_FAST_CLICK', fast_click)
+        # Set form fields with one script (fill, fill_form and set_values)
+        self.fast_fill = env_flag('WR_FAST_FILL', fast_fill)
+        # Seconds the latest fast clicks waited for their element: [(selector, seconds), ...]
+        self.click_waits = deque(maxlen=RECENT)
+        # 'poll' checks wait conditions from here. 'browser' waits in the page. (See _wait_for_condition)
+        self.wait_backend = os.environ.get('WR_WAIT_BACKEND', wait_backend)
+        # How often waits check their condition: 'fixed', 'backoff' or seconds. (See PyWebRunner.poll)
+        self.poll = os.environ.get('WR_POLL', poll)
+        # Polls and seconds the latest waits took: [(condition, polls, seconds), ...]
+        self.wait_polls = deque(maxlen=RECENT)
 
         self.desired_capabilities = os.environ.get(
             'WR_DESIRED_CAPABILITIES', desired_capabilities)
         self.command_executor = os.environ.get(
             'WR_COMMAND_EXECUTOR', command_executor)
+        # Talk to the driver over pooled keep-alive connections (see PyWebRunner.transport)
+        self.keep_alive = env_flag('WR_KEEP_ALIVE', keep_alive)
 
         self.yaml_funcs = {}
         self.yaml_vars = {}
+        # {plan: [(step, method), ...]} See _run_plan
+        self._bound_plans = weakref.WeakKeyDictionary()
+        # {selector: element} handles found by get_element and the waits.
+        # Forgotten after every command that may change the page. (See forget_elements)
+        self._elements = {}
+
+        # Settings a script may change that reset() puts back.
+        self._initial_settings = {
+            'timeout': self.timeout,
+            'default_offset': self.default_offset,
+        }
+
+        # Record the wall time, round trips and wait polls of every command.
+        # The profiler needs the timer to know which command is running.
+        profile = env_flag('WR_PROFILE', profile)
+        if env_flag('WR_TIME_COMMANDS', time_commands) or profile:
+            self.timer = timing.CommandTimer()
+            timing.instrument(self, self.timer)
+        if profile:
+            self.profiler = TransportProfiler(self.timer)
 
         if os.environ.get('skip_xvfb'):
             self.xvfb = False
@@ -135,114 +209,242 @@ class WebRunner(object):
             new tests.
 
         """
-        if self.xvfb:
-            try:
-                print("\nStarting XVFB display...")
-                self.display = Xvfb(width=self.width, height=self.height, colordepth=16)
-                try:
-                    self.display.start()
-                except OSError:
-                    self.xvfb = False
-                    print("\nUnable to start XVFB. Try running `./build/selenium.sh`")
-            except EnvironmentError:
-                print("\nSkipping XVFB run since it is not present.")
-                self.xvfb = False
+        headless = self.driver.endswith('-headless')
+        if self.xvfb and headless:
+            print("\nSkipping XVFB since {} runs headless.".format(self.driver))
+        elif self.xvfb:
+            self._start_xvfb()
 
         print("\nStarting browser ({})...".format(self.driver))
+        self._script_timeout = None
+        self._elements.clear()
+
+        self._start_proxy()
 
         if self.driver == "phantomjs":
             self.browser = webdriver.PhantomJS()
         elif self.driver == "chrome" or self.driver == 'chrome-headless':
-            if not which('chromedriver'):
-                fix_chrome()
+            self._start_chrome(headless)
+        elif self.driver == "opera":
+            self.browser = webdriver.Opera()
+        elif self.driver == "ie":
+            self.browser = webdriver.Ie()
+        elif self.driver == "remote":
+            self._start_remote()
+        elif self.driver in ('firefox', 'gecko', 'firefox-headless', 'gecko-headless'):
+            self._start_firefox(headless)
+        else:
+            raise UserWarning('No valid driver detected.')
 
-            from selenium.webdriver.chrome.options import Options
-            chrome_options = Options()
+        if self.browser:
+            self._setup_browser()
 
-            # Set the width and height from arguments
-            chrome_options.add_argument('--window-size={}x{}'.format(self.width, self.height))
+    def _start_proxy(self):
+        '''
+        Starts the runner's own blocking proxy when it has block rules.
+        '''
+        if self.block is not None and self.proxy is None:
+            self.proxy = proxies.Proxy(block=self.block, upstream_proxy=self.proxy_address).start()
 
-            if self.driver == 'chrome-headless':
-                chrome_options.add_argument("--headless")
+    def _start_xvfb(self):
+        '''
+        Starts the XVFB display, or turns xvfb off when it can't.
+        '''
+        try:
+            print("\nStarting XVFB display...")
+            self.display = Xvfb(width=self.width, height=self.height, colordepth=16)
             try:
-                extension = pkg_resources.resource_filename('PyWebRunner', "../../../../extensions/JSErrorCollector.crx")
-                chrome_options.add_extension(extension)
-            except IOError:
-                self.js_errorcollector = False
+                self.display.start()
+            except OSError:
+                self.xvfb = False
+                print("\nUnable to start XVFB. Try running `./build/selenium.sh`")
+        except EnvironmentError:
+            print("\nSkipping XVFB run since it is not present.")
+            self.xvfb = False
 
-            try:
-                self.browser = webdriver.Chrome(chrome_options=chrome_options)
-            except WebDriverException:
-                print("Chrome could not start. Downloading latest webdriver...")
-                fix_chrome()
-                self.browser = webdriver.Chrome(chrome_options=chrome_options)
+    def _start_chrome(self, headless):
+        '''
+        Starts a local Chrome.
+        '''
+        if not which('chromedriver'):
+            fix_chrome()
 
-        elif self.driver == "opera":
-            self.browser = webdriver.Opera()
-        elif self.driver == "ie":
-            self.browser = webdriver.Ie()
-        elif self.driver == "remote":
-            if isinstance(self.desired_capabilities, dict):
-                dc = self.desired_capabilities
-            else:
-                dcu = self.desired_capabilities.upper()
+        chrome_options = self._chrome_options(headless)
+        try:
+            self.browser = webdriver.Chrome(chrome_options=chrome_options)
+        except WebDriverException:
+            print("Chrome could not start. Downloading latest webdriver...")
+            fix_chrome()
+            self.browser = webdriver.Chrome(chrome_options=chrome_options)
 
-                if dcu == 'IE':
-                    dcu = 'INTERNETEXPLORER'
+    def _chrome_options(self, headless):
+        '''
+        The Chrome options: the window size, the arguments of the launch
+        profile and the proxy, and the JSErrorCollector extension.
+        '''
+        from selenium.webdriver.chrome.options import Options
+        chrome_options = Options()
 
-                dc = getattr(DesiredCapabilities, dcu)
+        # Set the width and height from arguments
+        chrome_options.add_argument('--window-size={}x{}'.format(self.width, self.height))
+        arguments = launch.chrome_arguments(self.launch_profile)
+        proxy_settings = self._proxy_settings()
+        if proxy_settings:
+            arguments += proxies.chrome_arguments(*proxy_settings)
+        if headless:
+            arguments.append("--headless")
+        for argument in arguments:
+            chrome_options.add_argument(argument)
 
-            self.browser = webdriver.Remote(
-                command_executor=self.command_executor,
-                desired_capabilities=dc
-            )
+        try:
+            extension = pkg_resources.resource_filename('PyWebRunner', "../../../../extensions/JSErrorCollector.crx")
+            chrome_options.add_extension(extension)
+        except IOError:
+            self.js_errorcollector = False
+        return chrome_options
+
+    def _start_remote(self):
+        '''
+        Connects to a remote browser (Selenium Grid, Sauce Labs...).
+        '''
+        if isinstance(self.desired_capabilities, dict):
+            dc = self.desired_capabilities
+        else:
+            dcu = self.desired_capabilities.upper()
+
+            if dcu == 'IE':
+                dcu = 'INTERNETEXPLORER'
+
+            dc = getattr(DesiredCapabilities, dcu)
+
+        dc = self._launch_capabilities(dc)
+        command_executor = self.command_executor
+        if self.keep_alive and not isinstance(command_executor, RemoteConnection):
+            command_executor = PooledRemoteConnection(command_executor)
+
+        self.browser = webdriver.Remote(
+            command_executor=command_executor,
+            desired_capabilities=dc
+        )
+
+    def _start_firefox(self, headless):
+        '''
+        Starts a local Firefox, through geckodriver for 'gecko' and the
+        headless drivers.
+        '''
+        fp = self._firefox_profile()
+        # Only Firefox 56+ runs headless, and those need geckodriver.
+        if self.driver == 'gecko' or headless:
+            from selenium.webdriver.firefox.options import Options
+            firefox_options = Options()
+            if headless:
+                firefox_options.add_argument('-headless')
+            if not (which('wires') or which('geckodriver')):
+                print('"wires" or "geckodriver" not found in path.')
+                fix_gecko()
+            caps = DesiredCapabilities.FIREFOX
+            caps['marionette'] = True
+            self.browser = webdriver.Firefox(firefox_profile=fp, capabilities=caps,
+                                             firefox_options=firefox_options)
+            return
+
+        try:
+            with Timeout(self.driver_init_timeout):
+                self.browser = webdriver.Firefox(firefox_profile=fp)
+        except (Timeout.Timeout, WebDriverException):
+            if not self.browser:
+                fix_firefox()
 
-        elif self.driver in ('firefox', 'gecko'):
-            # Get rid of the annoying start page by setting preferences
-            fp = webdriver.FirefoxProfile()
-            # Download from: https://github.com/mguillem/JSErrorCollector/raw/master/dist/JSErrorCollector.xpi
-            try:
-                extension = pkg_resources.resource_filename('PyWebRunner', "../../../../extensions/JSErrorCollector.xpi")
-                fp.add_extension(extension)
-            except IOError:
-                self.js_errorcollector = False
-            fp.set_preference("browser.startup.homepage_override.mstone", "ignore")
-            fp.set_preference("startup.homepage_welcome_url.additional", "about:blank")
-            if self.driver == 'gecko':
                 if which('wires') or which('geckodriver'):
                     caps = DesiredCapabilities.FIREFOX
                     caps['marionette'] = True
                     self.browser = webdriver.Firefox(firefox_profile=fp, capabilities=caps)
+                    self.browser.switch_to_window(self.browser.window_handles[0])
                 else:
-                    print('"wires" or "geckodriver" not found in path.')
-                    fix_gecko()
-                    caps = DesiredCapabilities.FIREFOX
-                    caps['marionette'] = True
-                    self.browser = webdriver.Firefox(firefox_profile=fp, capabilities=caps)
-                    # sys.exit(1)
-            else:
-                # self.browser = webdriver.Firefox(firefox_profile=fp)
-                try:
-                    with Timeout(self.driver_init_timeout):
-                        self.browser = webdriver.Firefox(firefox_profile=fp)
-                except (Timeout.Timeout, WebDriverException):
-                    if not self.browser:
-                        fix_firefox()
-
-                        if which('wires') or which('geckodriver'):
-                            caps = DesiredCapabilities.FIREFOX
-                            caps['marionette'] = True
-                            self.browser = webdriver.Firefox(firefox_profile=fp, capabilities=caps)
-                            self.browser.switch_to_window(self.browser.window_handles[0])
-                        else:
-                            print('"wires" or "geckodriver" not found in path. Exiting.')
-                            sys.exit(1)
-        else:
-            raise UserWarning('No valid driver detected.')
+                    print('"wires" or "geckodriver" not found in path. Exiting.')
+                    sys.exit(1)
+
+    def _firefox_profile(self):
+        '''
+        The Firefox profile: the preferences of the launch profile and the
+        proxy, and the JSErrorCollector extension.
+        '''
+        # Get rid of the annoying start page by setting preferences
+        fp = webdriver.FirefoxProfile()
+        # Download from: https://github.com/mguillem/JSErrorCollector/raw/master/dist/JSErrorCollector.xpi
+        try:
+            extension = pkg_resources.resource_filename('PyWebRunner', "../../../../extensions/JSErrorCollector.xpi")
+            fp.add_extension(extension)
+        except IOError:
+            self.js_errorcollector = False
+        fp.set_preference("browser.startup.homepage_override.mstone", "ignore")
+        fp.set_preference("startup.homepage_welcome_url.additional", "about:blank")
+        for name, value in sorted(launch.firefox_preferences(self.launch_profile).items()):
+            fp.set_preference(name, value)
+        proxy_settings = self._proxy_settings()
+        if proxy_settings:
+            for name, value in sorted(proxies.firefox_preferences(*proxy_settings).items()):
+                fp.set_preference(name, value)
+        return fp
+
+    def _setup_browser(self):
+        '''
+        Gets a freshly started browser ready for WebRunner.
+        '''
+        # Have the browser create WebRunnerElements instead of its own elements.
+        self.browser._web_element_cls = WebRunnerElement.for_class(self.browser._web_element_cls)
+
+        # Local drivers build their own connection. Swap it for a pooled one.
+        if self.keep_alive and not isinstance(self.browser.command_executor, PooledRemoteConnection):
+            self.browser.command_executor = PooledRemoteConnection.replace(self.browser.command_executor)
 
         # Raise window automatically
-        if self.browser:
-            self.focus_window()
+        self.focus_window()
+
+        if self.profiler is not None:
+            self.profiler.install(self.browser)
+
+    def _launch_capabilities(self, capabilities):
+        '''
+        Adds the arguments or preferences of the launch profile (and the
+        proxy) to the desired capabilities of a remote Chrome or Firefox.
+
+        Returns
+        -------
+        dict
+            A copy of capabilities.
+
+        '''
+        capabilities = dict(capabilities)
+        proxy_settings = self._proxy_settings()
+        if proxy_settings:
+            # The remote browser must be able to reach the proxy.
+            capabilities['proxy'] = proxies.capabilities(proxy_settings[0])
+        browser_name = capabilities.get('browserName')
+        if browser_name == 'chrome':
+            arguments = launch.chrome_arguments(self.launch_profile)
+            if arguments:
+                options = dict(capabilities.get('chromeOptions') or {})
+                options['args'] = list(options.get('args') or []) + arguments
+                capabilities['chromeOptions'] = options
+        elif browser_name == 'firefox':
+            preferences = launch.firefox_preferences(self.launch_profile)
+            if preferences:
+                options = dict(capabilities.get('moz:firefoxOptions') or {})
+                options['prefs'] = dict(options.get('prefs') or {}, **preferences)
+                capabilities['moz:firefoxOptions'] = options
+        return capabilities
+
+    def _proxy_settings(self):
+        '''
+        The (address, block rules) the browser should use, or None
+        when it doesn't go through a proxy.
+        '''
+        if self.proxy:
+            return self.proxy.address, self.proxy.rules
+        if self.proxy_address:
+            return self.proxy_address, proxies.BlockRules()
+        return None
 
     def stop(self):
         '''
@@ -257,10 +459,86 @@ class WebRunner(object):
         '''
         print("\nStopping the browser...")
         self.browser.quit()
+        if isinstance(self.browser.command_executor, PooledRemoteConnection):
+            self.browser.command_executor.close()
+        if self.proxy:
+            self.proxy.stop()
+            self.proxy = None
         if self.xvfb:
             print("\nStopping the XVFB display...")
             self.display.stop()
 
+    def block_resources(self, *rules):
+        '''
+        Stops the browser from loading more resources, for instance
+        images or analytics scripts no assertion looks at.
+
+        Parameters
+        ----------
+        rules: str
+            Resource types (image, font, media, stylesheet, script), host
+            names (blocked with their subdomains) or URL globs.
+            (See PyWebRunner.proxy)
+
+        Returns
+        -------
+        int
+            How many requests have been blocked so far.
+
+        '''
+        if self.proxy is None:
+            raise UserWarning('block_resources needs a browser started with the block option '
+                              'and its own proxy. (block=[] starts it without blocking anything.)')
+        if len(rules) == 1 and isinstance(rules[0], list):
+            rules = rules[0]
+        self.proxy.rules.add(rules)
+        return self.proxy.stats['blocked']
+
+    def is_alive(self):
+        '''
+        Checks whether the browser is still running and answering commands.
+
+        Returns
+        -------
+        bool
+            False if the browser was never started, has been stopped or crashed.
+
+        '''
+        if not self.browser:
+            return False
+        try:
+            self.browser.current_window_handle
+            return True
+        except Exception:
+            return False
+
+    def reset(self):
+        '''
+        Puts a running browser back into a clean state so it can be reused
+        for another script without restarting it.
+
+        Closes any extra windows, clears cookies and storage for the current
+        page, forgets script variables and recorded click waits and wait polls,
+        restores the timeout and default offset and navigates to about:blank.
+
+        '''
+        self.close_all_other_windows()
+        self.delete_all_cookies()
+        try:
+            self.js('window.localStorage && window.localStorage.clear();'
+                    'window.sessionStorage && window.sessionStorage.clear();')
+        except WebDriverException:
+            # Storage is not available on some pages (about:blank, data: urls...)
+            pass
+        self.yaml_vars = {}
+        self.click_waits.clear()
+        self.wait_polls.clear()
+        self.timeout = self._initial_settings['timeout']
+        self.default_offset = self._initial_settings['default_offset']
+        if self.proxy:
+            self.proxy.rules = proxies.BlockRules(self.block)
+        self.go('about:blank')
+
     # Helper functions:
     def wait_for(self, method, **kwargs):
         '''
@@ -280,6 +558,7 @@ class WebRunner(object):
         Goes one step back in the browser's history.
         Just a convenient wrapper around the browser's back command
         '''
+        self._elements.clear()
         self.browser.back()
 
     def forward(self):
@@ -287,9 +566,10 @@ class WebRunner(object):
         Goes one step forward in the browser's history.
         Just a convenient wrapper around the browser's forward command
         '''
+        self._elements.clear()
         self.browser.forward()
 
-    def click(self, selector, elem=None):
+    def click(self, selector, elem=None, fast=None, **kwargs):
         '''
         Clicks an element.
 
@@ -297,16 +577,46 @@ class WebRunner(object):
         ----------
         selector: str
             A CSS selector to search for. This can be any valid CSS selector..
+        fast: bool
+            Check presence, visibility, enabled state and scroll position in a
+            single in-browser check that is polled until the element is ready.
+            Defaults to WebRunner.fast_click
+        kwargs:
+            Passed on to _wait_for
 
         '''
-        self.wait_for_presence(selector)
-        self.scroll_to_element(selector)
-        self.wait_for_clickable(selector)
+        if fast is None:
+            fast = self.fast_click
 
-        if not elem:
-            elem = self.get_element(selector)
+        if fast:
+            self._fast_click(selector, elem, **kwargs)
+            return
+
+        self.wait_for_presence(selector, **kwargs)
+        self.scroll_to_element(selector)
+        self.wait_for_clickable(selector, **kwargs)
 
+        if elem:
+            elem.click()
+        else:
+            self._on_element(selector, lambda elem: elem.click())
+        # The click may have changed the page.
+        self._elements.clear()
+
+    def _fast_click(self, selector, elem=None, **kwargs):
+        '''
+        Polls scripts.CLICK_READY until the element can be clicked, then clicks it.
+        The time spent waiting is recorded in click_waits.
+        '''
+        kwargs.setdefault('poll_frequency', 0.05)
+        kwargs.setdefault('message', 'Timed out waiting for {} to be clickable'.format(selector))
+        start = time()
+        elem = self._wait_for(
+            lambda browser: browser.execute_script(scripts.CLICK_READY, elem, selector, self.default_offset),
+            **kwargs)
+        self.click_waits.append((selector, time() - start))
         elem.click()
+        self._elements.clear()
 
     def maximize_window(self):
         '''
@@ -347,7 +657,8 @@ class WebRunner(object):
         ]
         '''
         if self.driver in ('Chrome', 'Firefox'):
-            return self.js('return window.JSErrorCollector_errors ? window.JSErrorCollector_errors.pump() : []')
+            return self.browser.execute_script(
+                'return window.JSErrorCollector_errors ? window.JSErrorCollector_errors.pump() : []')
         else:
             print("Checking for JS errors with this method only works in Firefox or Chrome")
             return []
@@ -454,61 +765,75 @@ class WebRunner(object):
             A dict where the key is a method of this class.
 
         '''
-        pre_parse_regex = '\(\(([^}]+)\)\)'  # Grab things wrapped like so: (( something ))
-        if verbose:
-            print('Processing command: {}'.format(yaml.dump(command)))
-
-        for k in command:
-            if hasattr(self, k):
-                if type(command[k]) is list:
-                    # Loop over the arguments and pre-parse them.
-                    for index, item in enumerate(command[k]):
-                        if type(item) is not list:
-                            if type(item) is not dict:
-                                to_parse = [i.strip() for i in re.findall(pre_parse_regex, str(item))]
-                                if to_parse:
-                                    tp = self._parse_item(to_parse[0])
-                                    command[k][index] = tp
-                        else:
-                            for subindex, subitem in enumerate(item):
-                                to_parse = [si.strip() for si in re.findall(pre_parse_regex, subitem)]
-                                if to_parse:
-                                    tp = self._parse_item(to_parse[0])
-                                    command[k][index][subindex] = tp
-
-                    if type(command[k][0]) is list:
-                        getattr(self, k)(command[k])
-                    else:
-                        getattr(self, k)(*command[k])
-                else:
-                    getattr(self, k)(command[k])
+        plan = script_plans.compile_script([command])
+        for step, method in script_plans.bind(plan, self):
+            if verbose and step.dump:
+                print('Processing command: {}'.format(step.dump))
+            self._run_step(step, method)
+
+    def _run_step(self, step, method):
+        '''
+        Internal method for running a single step of a compiled script.
+
+        Parameters
+        ----------
+
+        step: PyWebRunner.script.Step
+            The compiled command.
+        method: callable or None
+            The method of this class the step calls. (See PyWebRunner.script.bind)
+
+        '''
+        if method is not None:
+            script_plans.call(step, method, self._parse_item)
+        elif step.key == 'import':
+            self._import(step.args)
+        elif step.key in ('value_of', 'text_of'):
+            if not self.yaml_vars.get(step.key):
+                self.yaml_vars[step.key] = []
+            if step.key == 'value_of':
+                value = self.get_value(step.args)
             else:
-                if k == 'import':
-                    self._import(command[k])
-                elif k in ('value_of', 'text_of'):
-                    if not self.yaml_vars.get(k):
-                        self.yaml_vars[k] = []
-                    if k == 'value_of':
-                        value = self.get_value(command[k])
-                    elif k == 'text_of':
-                        value = self.get_text(command[k])
-                    self.yaml_vars[k].append(value)
+                value = self.get_text(step.args)
+            self.yaml_vars[step.key].append(value)
+
+    def _run_plan(self, plan, errors=True, verbose=False, stop_on_error=True):
+        '''
+        Internal method for running every step of a compiled script.
+        '''
+        # Method lookups are resolved once per plan and runner.
+        bound = self._bound_plans.get(plan)
+        if bound is None:
+            bound = self._bound_plans[plan] = script_plans.bind(plan, self)
+
+        for step, method in bound:
+            if verbose:
+                if step.label:
+                    print(step.label)
+                if step.dump:
+                    print('Processing command: {}'.format(step.dump))
+            try:
+                self._run_step(step, method)
+            except Exception as e:
+                self._print_command_error(step.command, getattr(e, 'message', repr(e)))
+                if stop_on_error:
+                    self.stop()
+                if errors:
+                    raise
 
     def _load_yaml_file(self, filepath):
-        with open(filepath, 'r') as f:
-            if filepath.lower().endswith('yaml') or filepath.lower().endswith('yml'):
-                script = yaml.load(f)
-            elif filepath.lower().endswith('json'):
-                script = json.loads(f.read())
-            else:
-                print("Couldn't detect filetype from extension. Defaulting to YAML.")
-                script = yaml.load(f)
-        return script
+        return script_plans.load_file(filepath)
 
-    def command_script(self, filepath=None, script=None, errors=True, verbose=False):
+    def command_script(self, filepath=None, script=None, errors=True, verbose=False,
+                       stop_on_error=True):
         '''
         Runs a script of PyWebRunner command_script
 
+        The script is compiled into a plan first (see PyWebRunner.script).
+        Plans are cached by the content of the script so running the same
+        script again skips parsing and analysing it. Included files (which
+        may include other files) are expanded in place when compiling.
+
         Parameters
         ----------
         script: list of dicts
@@ -517,52 +842,28 @@ class WebRunner(object):
             Whether or not to call bail_out on error
         verbose:
             Print extra debugging information
+        stop_on_error: bool
+            Whether or not to stop the browser when a command fails.
+            Pass False when the browser is going to be reused (see SessionPool).
 
         '''
         self._import('random.randint')
         self._import('random.choice')
         self.yaml_funcs['prompt'] = prompt
         if not script and filepath:
-            script = self._load_yaml_file(filepath)
+            plan = script_plans.get_file_plan(filepath)
+        else:
+            plan = script_plans.get_plan(script)
 
-        for index, command in enumerate(script):
-            if type(command) is str:
-                if hasattr(self, command):
-                    try:
-                        getattr(self, command)()
-                    except Exception as e:
-                        self._print_command_error(command, getattr(e, 'message', repr(e)))
-                        self.stop()
-                        if errors:
-                            raise
-            else:
-                key = list(command.keys())[0]
-                digits = len(str(len(script)))
-                if verbose:
-                    print('({}) Parsing: {}: {}'.format(str(index + 1).zfill(digits), key, command[key]))
-
-                # If the include command is given, parse those commands in-place before
-                # continuing. This allows yaml scripts to include and use other yaml files.
-                if key == 'include':
-                    i_script = self._load_yaml_file(command[key])
-                    for i_index, i_command in enumerate(i_script):
-                        try:
-                            self._run_command(i_command, verbose=verbose)
-                        except Exception as e:
-                            self._print_command_error(i_command, getattr(e, 'message', repr(e)))
-                            self.stop()
-                            if errors:
-                                raise
+        if self.timer is None:
+            self._run_plan(plan, errors=errors, verbose=verbose, stop_on_error=stop_on_error)
+            return
 
-                else:
-                    # Run most commands with arguments.
-                    try:
-                        self._run_command(command, verbose=verbose)
-                    except Exception as e:
-                        self._print_command_error(command, getattr(e, 'message', repr(e)))
-                        self.stop()
-                        if errors:
-                            raise
+        self.timer.script = filepath
+        try:
+            self._run_plan(plan, errors=errors, verbose=verbose, stop_on_error=stop_on_error)
+        finally:
+            self.timer.script = None
 
     def _print_command_error(self, command, message):
         print("=" * 80)
@@ -618,6 +919,7 @@ class WebRunner(object):
         '''
         if not windex:
             windex = 0
+        self._elements.clear()
         self.browser.switch_to_window(self.browser.window_handles[windex])
 
     def focus_browser(self):
@@ -679,6 +981,8 @@ class WebRunner(object):
         for element in elements:
             if element.is_displayed:
                 element.click()
+        # The clicks may have changed the page.
+        self._elements.clear()
 
     def get_page_source(self):
         '''
@@ -687,7 +991,28 @@ class WebRunner(object):
         src = self.browser.page_source
         return src
 
-    def is_text_on_page(self, text):
+    def find_text_on_page(self, text, markup=True):
+        '''
+        Searches the page for text in the browser, so only the offset comes
+        back over the wire instead of the whole page source.
+
+        Parameters
+        ----------
+        text: str
+            The text to search for.
+        markup: bool
+            Search the HTML of the page (tags, attributes...), like
+            page_source. False searches only its text. Defaults to True
+
+        Returns
+        -------
+        int
+            The offset of the first match, -1 if there is none.
+
+        '''
+        return self.browser.execute_script(scripts.TEXT_OFFSET, text, bool(markup))
+
+    def is_text_on_page(self, text, markup=True):
         '''
         Finds text if it is present on the page.
 
@@ -695,17 +1020,12 @@ class WebRunner(object):
         ----------
         text: str
             The text to search for.
+        markup: bool
+            Search the HTML of the page, like page_source. False searches
+            only its text. Defaults to True
 
         '''
-        src = self.get_page_source()
-        # try:
-        #     src = src.encode('ascii', errors='ignore')
-        #     return bool(text in src)
-        # except TypeError:
-        index = src.find(text)
-        if index == -1:
-            return False
-        return True
+        return self.find_text_on_page(text, markup) != -1
 
     def scroll_browser(self, amount, direction='down'):
         '''
@@ -730,10 +1050,14 @@ class WebRunner(object):
 
         self.js(scroll_string)
 
-    def scroll_to_element(self, selector, offset=None, offset_selector=None):
+    def scroll_to_element(self, selector, offset=None, offset_selector=None, settle_timeout=2):
         '''
         Scrolls the given element into view.
 
+        The offset element is measured and the page is scrolled in the same
+        script, which then waits for scrolling to finish (scrollY unchanged
+        across several animation frames) before returning.
+
         Parameters
         ----------
         selector: str
@@ -743,20 +1067,22 @@ class WebRunner(object):
         offset_selector: str
             A selector whose corresponding element's height
             will be added to the offset
+        settle_timeout: number
+            Maximum number of seconds to wait for scrolling to finish.
+
+        Raises
+        ------
+        NoSuchElementException
+            When nothing matches selector or offset_selector.
         '''
         if offset is None:
             offset = self.default_offset
 
-        if offset_selector:
-            offset_el = self.get_element(offset_selector)
-            if offset_el:
-                offset += offset_el.size['height']
-
-        scroll_to_el = self.get_element(selector)
-
-        scroll_location = scroll_to_el.location['y'] - offset
-        self.js("window.scrollTo(0, arguments[0]);", scroll_location)
-        self.wait(0.5)  # no good way to wait for scrolling to finish
+        result = self._async_js(scripts.SCROLL_TO_SETTLED, selector, offset, offset_selector,
+                                int(settle_timeout * 1000), timeout=settle_timeout + 5)
+        if result is not True:
+            # The selector (or offset_selector) that matched nothing.
+            raise NoSuchElementException('Element not found: {}'.format(result))
 
     def set_select_by_text(self, select, text):
         '''
@@ -777,6 +1103,7 @@ class WebRunner(object):
 
         sel = Select(elem)
         sel.select_by_visible_text(text)
+        self._elements.clear()
 
     def set_select_by_value(self, select, value):
         '''
@@ -797,6 +1124,7 @@ class WebRunner(object):
 
         sel = Select(elem)
         sel.select_by_value(value)
+        self._elements.clear()
 
     def download(self, url, filepath):
         '''
@@ -852,6 +1180,8 @@ class WebRunner(object):
             action.perform()
         except WebDriverException:
             print("move_to isn't supported with this browser driver.")
+        # Hover handlers (and the click) may have changed the page.
+        self._elements.clear()
 
     def hover(self, selector, click=False):
         '''
@@ -892,7 +1222,7 @@ class WebRunner(object):
 
         return links
 
-    def get_links(self, what='a'):
+    def get_links(self, what='a', bulk=True):
         '''
         Gets links by CSS selector or WebElement list.
 
@@ -902,6 +1232,8 @@ class WebRunner(object):
             A CSS selector to search for. This can be any valid CSS selector.
             -- or --
             A list of previously selected WebElement instances.
+        bulk: bool
+            Read every href with a single script call. Defaults to True.
 
         Returns
         -------
@@ -909,13 +1241,60 @@ class WebRunner(object):
             A list of URL strings.
 
         '''
-        elems = self._selector_or_elements(what)
-        urls = []
-        for elem in elems:
-            href = elem.get_attribute('href')
-            if href:
-                urls.append(href)
-        return urls
+        return [href for href in self.get_attributes(what, 'href', bulk=bulk) if href]
+
+    def get_attributes(self, what, attribute, bulk=True):
+        '''
+        Gets an attribute from every element found by CSS selector or WebElement list.
+
+        Parameters
+        ----------
+        what: str or list of WebElement
+            A CSS/XPATH selector to search for.
+            -- or --
+            A list of previously selected WebElement instances.
+        attribute: str
+            The name of the attribute (or property) to read.
+        bulk: bool
+            Read every element with a single script call. Defaults to True.
+
+        Returns
+        -------
+        list of str
+            The attribute values in document order. (None where missing.)
+
+        '''
+        return self._read_all(what, 'attribute', attribute, bulk=bulk)
+
+    def _read_all(self, what, kind, attribute=None, bulk=True):
+        '''
+        Reads the text, value or an attribute of many elements.
+
+        With bulk set, everything is read in the page with one execute_script
+        call. Otherwise (or if the script fails) it falls back to asking
+        WebDriver about each element one at a time.
+        '''
+        if isinstance(what, WebElement):
+            what = [what]
+
+        if bulk:
+            try:
+                if isinstance(what, list):
+                    return self.browser.execute_script(scripts.READ_ALL, what, None, kind, attribute)
+                return self.browser.execute_script(scripts.READ_ALL, None, what, kind, attribute)
+            except WebDriverException:
+                pass
+
+        if isinstance(what, list):
+            elems = what
+        else:
+            elems = self.find_elements(what)
+
+        if kind == 'text':
+            return [e.text for e in elems]
+        elif kind == 'value':
+            return [e.get_attribute('value') for e in elems]
+        return [e.get_attribute(attribute) for e in elems]
 
     def get_elements(self, selector):
         '''
@@ -934,10 +1313,12 @@ class WebRunner(object):
         '''
         elems = self.find_elements(selector)
 
-        # Extend all the elements
         if elems:
-            _elems = [WebRunnerElement(elem._parent, elem._id, elem._w3c) for elem in elems]
-            return _elems
+            # Elements come back as WebRunnerElements already (see start).
+            # Others are extended in place rather than copied.
+            if not isinstance(elems[0], WebRunnerElement):
+                elems = [WebRunnerElement.extend(elem) for elem in elems]
+            return elems
         else:
             raise NoSuchElementException
 
@@ -953,15 +1334,54 @@ class WebRunner(object):
         Returns
         -------
         selenium.webdriver.remote.webelement.WebElement
-            A selenium element object.
+            A selenium element object. The handle is reused for the same
+            selector until the page changes. (See forget_elements)
 
         '''
+        elem = self._elements.get(selector)
+        if elem is not None:
+            return elem
+
         elem = self.find_element(selector)
         if elem:
-            return WebRunnerElement(elem._parent, elem._id, elem._w3c)
+            return self._remember(selector, elem)
         else:
             raise NoSuchElementException
 
+    def forget_elements(self):
+        '''
+        Forgets the element handles that get_element and the wait_for_*
+        methods keep for their selectors.
+
+        This happens on its own after every command that may change the page
+        (navigating, switching windows, clicking, hovering, typing, setting
+        values, js, closing alerts...) and when a handle turns out to be
+        stale. Call it after changing the page in other ways (through
+        WebRunner.browser, for example) or when the page changes on its own
+        if a selector may now match a different element.
+        '''
+        self._elements.clear()
+
+    def _remember(self, selector, elem):
+        '''
+        Keeps the element found for a selector. (See get_element)
+        '''
+        if isinstance(elem, WebElement):
+            elem = WebRunnerElement.extend(elem)
+            self._elements[selector] = elem
+        return elem
+
+    def _on_element(self, selector, action):
+        '''
+        Calls action with the element for selector. If the handle was stale,
+        finds the element again and calls action once more.
+        '''
+        try:
+            return action(self.get_element(selector))
+        except StaleElementReferenceException:
+            self._elements.pop(selector, None)
+            return action(self.get_element(selector))
+
     def get_text(self, selector=None, elem=None):
         '''
         Gets text from inside of an element by CSS selector.
@@ -977,12 +1397,11 @@ class WebRunner(object):
             The text from inside of a selenium element object.
 
         '''
-        if not elem:
-            elem = self.get_element(selector)
-
-        return elem.text
+        if elem:
+            return elem.text
+        return self._on_element(selector, lambda elem: elem.text)
 
-    def get_texts(self, selector):
+    def get_texts(self, selector, bulk=True):
         '''
         Gets all the text from all elements found by CSS selector.
 
@@ -990,6 +1409,8 @@ class WebRunner(object):
         ----------
         selector: str
             A CSS selector to search for. This can be any valid CSS selector.
+        bulk: bool
+            Read every element with a single script call. Defaults to True.
 
         Returns
         -------
@@ -997,10 +1418,33 @@ class WebRunner(object):
             A list of text strings from inside of all found selenium element objects.
 
         '''
-        elems = self.get_elements(selector)
-        texts = [e.text for e in elems]
+        texts = self._read_all(selector, 'text', bulk=bulk)
+        if not texts:
+            raise NoSuchElementException
         return texts
 
+    def get_values(self, selector, bulk=True):
+        '''
+        Gets the values of all elements found by CSS selector.
+
+        Parameters
+        ----------
+        selector: str
+            A CSS selector to search for. This can be any valid CSS selector.
+        bulk: bool
+            Read every element with a single script call. Defaults to True.
+
+        Returns
+        -------
+        list of str
+            A list of the values of all found elements.
+
+        '''
+        values = self._read_all(selector, 'value', bulk=bulk)
+        if not values:
+            raise NoSuchElementException
+        return values
+
     def get_value(self, selector):
         '''
         Gets value of an element by CSS selector.
@@ -1016,18 +1460,20 @@ class WebRunner(object):
             The value of a selenium element object.
 
         '''
-        elem = self.get_element(selector)
-        if self.driver == 'Gecko':
-            # Let's do this the stupid way because Mozilla thinks geckodriver is
-            # so incredibly amazing.
-            tag_name = elem.tag_name
-            if tag_name == 'select':
-                select = Select(elem)
-                return select.all_selected_options[0].get_attribute('value')
+        def read(elem):
+            if self.driver == 'Gecko':
+                # Let's do this the stupid way because Mozilla thinks geckodriver is
+                # so incredibly amazing.
+                tag_name = elem.tag_name
+                if tag_name == 'select':
+                    select = Select(elem)
+                    return select.all_selected_options[0].get_attribute('value')
+                else:
+                    return elem.get_attribute('value')
             else:
                 return elem.get_attribute('value')
-        else:
-            return elem.get_attribute('value')
+
+        return self._on_element(selector, read)
 
     def send_key(self, selector, key, wait_for='presence', **kwargs):
         '''
@@ -1117,6 +1563,7 @@ class WebRunner(object):
 
         if hasattr(Keys, key.upper()):
             elem.send_keys(getattr(Keys, key.upper()))
+            self._elements.clear()
 
     def drag_and_drop(self, from_selector, to_selector):
         '''
@@ -1137,8 +1584,9 @@ class WebRunner(object):
         from_element = self.get_element(from_selector)
         to_element = self.get_element(to_selector)
         ActionChains(self.browser).drag_and_drop(from_element, to_element).perform()
+        self._elements.clear()
 
-    def set_values(self, values, clear=True, blur=True, **kwargs):
+    def set_values(self, values, clear=True, blur=True, fast=None, keystrokes=(), **kwargs):
         '''
         Sets values of elements by CSS selectors.
 
@@ -1155,24 +1603,31 @@ class WebRunner(object):
             Whether or not we should blur the element after setting the value.
             Defaults to True
 
+        fast: bool
+            Set the values with a single script. (See fill_form)
+            Defaults to WebRunner.fast_fill
+
+        keystrokes: list of str
+            Selectors of the elements that must still be typed into.
+
         kwargs:
             passed on to wait_for_visible
 
         '''
-        if isinstance(values, dict):
-            # If the entire var is a dict, just use all the key/value pairs
-            for key in values:
-                self.set_value(key, values[key], clear=clear, blur=blur, **kwargs)
-        else:
-            # If not a dict it's a list/tuple of things (dicts or lists / tuples)
-            for row in values:
-                if isinstance(row, dict):
-                    # If it is a dict use it's key / value pairs.
-                    for key in row:
-                        self.set_value(key, row[key], clear=clear, blur=blur, **kwargs)
-                else:
-                    # Otherwise just use the list / tuple positions
-                    self.set_value(row[0], row[1], clear=clear, blur=blur, **kwargs)
+        pairs = self._value_pairs(values)
+
+        if fast is None:
+            fast = self.fast_fill
+
+        if fast and not kwargs.get('typing'):
+            indexes = [i for i, (key, value) in enumerate(pairs) if key not in keystrokes]
+            left = self._fast_fill([('css', pairs[i][0], pairs[i][1]) for i in indexes],
+                                   clear=clear, blur=blur)
+            filled = set(index for n, index in enumerate(indexes) if n not in left)
+            pairs = [pair for i, pair in enumerate(pairs) if i not in filled]
+
+        for key, value in pairs:
+            self.set_value(key, value, clear=clear, blur=blur, **kwargs)
 
     def wait(self, seconds=500):
         '''
@@ -1243,6 +1698,8 @@ class WebRunner(object):
 
         if blur:
             elem.send_keys(Keys.TAB)
+        # Input, change and blur handlers may have changed the page.
+        self._elements.clear()
 
     def set_selectize(self, selector, value, text=None, clear=True, blur=False):
         '''
@@ -1288,6 +1745,7 @@ class WebRunner(object):
 
         if blur:
             input_element.send_keys(Keys.TAB)
+            self._elements.clear()
         else:
             # Click the option for the given value
             self.click(selectize_control + ' .option[data-value="{}"]'.format(value))
@@ -1302,9 +1760,8 @@ class WebRunner(object):
             A CSS selector to search for. This can be any valid CSS selector.
 
         '''
-        elem = self.get_element(selector)
-        if elem:
-            elem.clear()
+        self._on_element(selector, lambda elem: elem.clear())
+        self._elements.clear()
 
     def current_url(self):
         '''
@@ -1328,6 +1785,7 @@ class WebRunner(object):
             The address (URL)
 
         '''
+        self._elements.clear()
         self.browser.get(address)
 
     def count(self, selector):
@@ -1363,10 +1821,7 @@ class WebRunner(object):
         '''
         elem = None
         try:
-            if selector.startswith('/'):
-                elem = self.browser.find_element_by_xpath(selector)
-            else:
-                elem = self.browser.find_element_by_css_selector(selector)
+            elem = self.browser.find_element(*locate(selector))
         except NoSuchElementException:
             pass
 
@@ -1389,10 +1844,7 @@ class WebRunner(object):
         '''
         elems = []
         try:
-            if selector.startswith('/'):
-                elems = self.browser.find_elements_by_xpath(selector)
-            else:
-                elems = self.browser.find_elements_by_css_selector(selector)
+            elems = self.browser.find_elements(*locate(selector))
         except NoSuchElementException:
             pass
 
@@ -1431,6 +1883,7 @@ class WebRunner(object):
         '''
         Refreshes the page using the selenium binding.
         '''
+        self._elements.clear()
         self.browser.refresh()
 
     def refresh_page(self, refresh_method="url"):
@@ -1444,6 +1897,7 @@ class WebRunner(object):
             Defaults to "url" which navigates to the current_url
 
         '''
+        self._elements.clear()
         if refresh_method == "url":
             self.browser.get(self.browser.current_url)
         elif refresh_method == "js":
@@ -1464,8 +1918,95 @@ class WebRunner(object):
             Returns the result of the JS evaluation.
 
         '''
+        # The script may change the page.
+        self._elements.clear()
         return self.browser.execute_script(js_str, *args)
 
+    def _async_js(self, js_str, *args, **kwargs):
+        '''
+        Run some asynchronous JavaScript and return the value passed to its callback.
+        (The callback is the last item in the arguments list.)
+
+        Parameters
+        ----------
+        js_str: str
+            A string containing some valid JavaScript to be ran on the page.
+        timeout: number
+            Seconds to wait for the callback. Defaults to WebRunner.timeout
+
+        '''
+        timeout = kwargs.get('timeout') or self.timeout
+        # Only send the timeout to the driver when it changes.
+        if self._script_timeout != timeout:
+            self.browser.set_script_timeout(timeout)
+            self._script_timeout = timeout
+        return self.browser.execute_async_script(js_str, *args)
+
+    def _fast_fill(self, rows, clear=True, blur=True):
+        '''
+        Fills fields with scripts.FILL in a single round trip.
+
+        Parameters
+        ----------
+        rows: list of tuple
+            (search method, selector, value) for every field.
+            Search methods are the keys of fill_form rows.
+        clear: bool
+            Replace the current values instead of appending to them.
+        blur: bool
+            Fire blur events after setting the values.
+
+        Returns
+        -------
+        set of int
+            The indexes of the rows that were not filled.
+
+        '''
+        if not rows:
+            return set()
+        rows = [[how, what, self._fill_value(value)] for how, what, value in rows]
+        return set(self.js(scripts.FILL, rows, clear, blur))
+
+    @staticmethod
+    def _fill_value(value):
+        '''
+        A form value as both ways of filling compare it: a string, or a list
+        of strings for a group of checkboxes.
+        '''
+        if isinstance(value, (list, tuple)):
+            return [str(item) for item in value]
+        return str(value)
+
+    @staticmethod
+    def _value_pairs(values):
+        '''
+        The (selector, value) pairs of the values set_values takes.
+        '''
+        pairs = []
+        if isinstance(values, dict):
+            # If the entire var is a dict, just use all the key/value pairs
+            pairs = list(values.items())
+        else:
+            # If not a dict it's a list/tuple of things (dicts or lists / tuples)
+            for row in values:
+                if isinstance(row, dict):
+                    # If it is a dict use it's key / value pairs.
+                    pairs.extend(row.items())
+                else:
+                    # Otherwise just use the list / tuple positions
+                    pairs.append((row[0], row[1]))
+        return pairs
+
+    @staticmethod
+    def _search_method(row):
+        '''
+        The key of a fill_form row that _find_elements searches by.
+        '''
+        for key in ('name', 'css', 'class', 'xpath'):
+            if key in row:
+                return key
+        return 'id'
+
     def _find_elements(self, row):
         '''
         Find elements using a name, css selector, class, xpath, or id.
@@ -1541,7 +2082,7 @@ class WebRunner(object):
         else:
             self.browser.save_screenshot(path)
 
-    def fill(self, form_dict):
+    def fill(self, form_dict, fast=None, keystrokes=()):
         '''
         Fills a form using Selenium. This helper will save a lot of time
         and effort because working with form data can be tricky and gross.
@@ -1551,14 +2092,20 @@ class WebRunner(object):
         form_dict: dict
             Takes in a dict where the keys are CSS selectors
             and the values are what will be applied to them.
+        fast: bool
+            Set the fields with a single script. (See fill_form)
+            Defaults to WebRunner.fast_fill
+        keystrokes: list of str
+            Selectors of the fields that must still be typed into.
 
         '''
         form_list = []
         for key in form_dict:
-            form_list.append({'css': key, 'value': form_dict[key]})
-        self.fill_form(form_list)
+            form_list.append({'css': key, 'value': form_dict[key],
+                              'keystrokes': key in keystrokes})
+        self.fill_form(form_list, fast=fast)
 
-    def fill_form(self, form_list):
+    def fill_form(self, form_list, fast=None):
         '''
         This helper can be used directly but it is much easier
         to use the "fill" method instead.
@@ -1567,46 +2114,53 @@ class WebRunner(object):
         ----------
         form_list: list of dict
             A list of dictionaries where the key is the search method
-            and the value is what is passed to Selenium
-        clear: bool
-            True/False value indicating whether or not to clear out
-            the input currently in any text inputs.
+            and the value is what is passed to Selenium.
+            Rows with a true 'keystrokes' key are always typed into.
+        fast: bool
+            Set text, select, radio and checkbox values with a single script
+            that fires the input, change and blur events, instead of
+            typing into every field. File inputs, hidden fields and fields
+            the script can't set are still filled the slow way.
+            Defaults to WebRunner.fast_fill
+
+        '''
+        if fast is None:
+            fast = self.fast_fill
+
+        if fast:
+            indexes = [i for i, row in enumerate(form_list) if not row.get('keystrokes')]
+            rows = []
+            for i in indexes:
+                how = self._search_method(form_list[i])
+                rows.append((how, form_list[i][how], form_list[i]['value']))
+            left = self._fast_fill(rows)
+            filled = set(index for n, index in enumerate(indexes) if n not in left)
+            form_list = [row for i, row in enumerate(form_list) if i not in filled]
 
-        '''
         for row in form_list:
             elems = self._find_elements(row)
             # If the length is greater than 1, it should be a checkbox or radio.
             if len(elems) > 1:
-                # Get the element type we are dealing with.
-                tag_name = elems[0].tag_name
-                tag_type = elems[0].get_attribute('type')
+                # Types, values and checked states of the whole group in one call.
+                choices = self.browser.execute_script(scripts.CHOICES, elems)
+                tag_type = choices[0][0]
+                wanted = self._fill_value(row['value'])
+                wanted = wanted if isinstance(wanted, list) else [wanted]
+                matching = set(i for i, choice in enumerate(choices) if choice[1] in wanted)
+                checked = set(i for i, choice in enumerate(choices) if choice[2])
 
                 if tag_type == 'radio':
-                    for elem in elems:
-                        tag_value = elem.get_attribute('value')
-                        if tag_value == row['value']:
-                            # Select the right radio button
-                            elem.click()
-
+                    # Select the right radio button
+                    toggle = matching - checked
                 elif tag_type == 'checkbox':
-                    # We need to handle checkboxes differently than radio buttons.
-                    # (More than one can be checked so we must handle that.)
-                    for elem in elems:
-                        tag_value = elem.get_attribute('value')
-                        if not isinstance(row['value'], list):
-                            # Put single items in a list so we can loop.
-                            row['value'] = [row['value']]
-
-                        for value in row['value']:
-                            # Loop over all the values and check the ones we want.
-                            # Un-check the ones we don't want.
-                            if tag_value == value:
-                                if not elem.is_selected():
-                                    elem.click()
-                            else:
-                                if elem.is_selected():
-                                    if tag_value not in row['value']:
-                                        elem.click()
+                    # More than one can be checked: check the ones we want
+                    # and un-check the ones we don't.
+                    toggle = matching ^ checked
+                else:
+                    toggle = set()
+
+                for i in sorted(toggle):
+                    elems[i].click()
 
             elif len(elems) == 1:
                 # Handle every other form element type since they are much
@@ -1624,6 +2178,9 @@ class WebRunner(object):
             else:
                 print("{} Element not found.".format(row))
 
+        # The clicks may have changed the page.
+        self._elements.clear()
+
     # Custom asynchronous wait helpers
     def _wait_for(self, wait_function, **kwargs):
         '''
@@ -1639,22 +2196,115 @@ class WebRunner(object):
             The number of seconds to wait for the given condition
             before throwing an error.
             Overrides WebRunner.timeout
+        poll_frequency: float
+            Seconds to sleep between checks. Same as poll=<seconds>
+        poll: str, float or strategy
+            'fixed', 'backoff', a number of seconds or a strategy object.
+            Overrides WebRunner.poll (See PyWebRunner.poll)
+        message: str
+            The message of the TimeoutException. Defaults to naming wait_function.
+
+        Returns
+        -------
+        The last (truthy) value returned by wait_function.
 
         '''
+        if 'poll_frequency' in kwargs:
+            strategy = get_strategy(kwargs['poll_frequency'])
+        else:
+            strategy = get_strategy(kwargs.get('poll') or self.poll)
+        intervals = strategy.intervals()
+        name = getattr(wait_function, '__name__', type(wait_function).__name__)
+        timeout = float(kwargs.get('timeout') or self.timeout)
+        polls = 0
+        start = time()
+        end = start + timeout
+        # Its screen and stack trace go into the TimeoutException, like WebDriverWait does.
+        ignored = None
         try:
-            wait = WebDriverWait(self.browser, kwargs.get('timeout') or self.timeout)
-            wait.until(wait_function)
+            while True:
+                polls += 1
+                try:
+                    value = wait_function(self.browser)
+                    if value:
+                        return value
+                except NoSuchElementException as e:
+                    ignored = e
+                remaining = end - time()
+                if remaining <= 0:
+                    message = kwargs.get('message') or 'Timed out waiting for {}'.format(name)
+                    raise TimeoutException('{} after {:g} seconds.'.format(message, timeout),
+                                           getattr(ignored, 'screen', None),
+                                           getattr(ignored, 'stacktrace', None))
+                sleep(min(next(intervals), remaining))
         except TimeoutException:
             if self.driver == 'Gecko':
                 print("Geckodriver can't use the text_to_be_present_in_element_value wait for some reason.")
             else:
                 raise
+        finally:
+            self.wait_polls.append((name, polls, time() - start))
+            if self.timer is not None:
+                self.timer.polls += polls
+
+    def _wait_for_condition(self, condition, selector, wait_function, expected=None, **kwargs):
+        '''
+        Waits for one of the conditions of scripts.WAIT_FOR using the selected
+        backend.
+
+        With the 'browser' backend the condition is checked in the page on
+        every DOM change and animation frame, so the wait returns within a
+        frame of the change with a single round trip. If the page navigates
+        away mid-wait (or the driver can't run async scripts) the wait falls
+        back to polling wait_function.
+
+        Parameters
+        ----------
+        condition: str
+            presence, visible, invisible, text, value, opacity,
+            page_text or page_markup
+        selector: str
+            A CSS/XPATH selector to search for. (None for page_text and page_markup)
+        wait_function: callable
+            The same condition for _wait_for.
+        expected: str or number
+            The text, value or opacity to wait for.
+        backend: str
+            'poll' or 'browser'. Defaults to WebRunner.wait_backend
+        kwargs:
+            Passed on to _wait_for
+
+        Returns
+        -------
+        The element for presence and visible, otherwise True.
+
+        '''
+        backend = kwargs.pop('backend', None) or self.wait_backend
+        kwargs.setdefault('message', 'Timed out waiting for {} of {}'.format(condition, selector))
+        if backend == 'browser':
+            timeout = float(kwargs.get('timeout') or self.timeout)
+            start = time()
+            try:
+                result = self._async_js(scripts.WAIT_FOR, condition, selector, expected,
+                                        int(timeout * 1000), timeout=timeout + 5)
+            except TimeoutException:
+                raise
+            except WebDriverException:
+                # The page unloaded while waiting. Poll for the rest of the timeout.
+                kwargs['timeout'] = max(timeout - (time() - start), 0.5)
+            else:
+                if not result:
+                    raise TimeoutException('{} after {:g} seconds.'.format(kwargs['message'], timeout))
+                return result
+
+        return self._wait_for(wait_function, **kwargs)
 
     def wait_for_alert(self, **kwargs):
         '''
         Shortcut for waiting for alert. If it not ends with exception, it
         returns that alert.
         '''
+        kwargs.setdefault('message', 'Timed out waiting for an alert')
         self._wait_for(EC.alert_is_present(), **kwargs)
 
     def wait_for_presence(self, selector='', **kwargs):
@@ -1670,13 +2320,8 @@ class WebRunner(object):
             Passed on to _wait_for
 
         '''
-        if selector.startswith('/'):
-            by = By.XPATH
-        else:
-            by = By.CSS_SELECTOR
-        self._wait_for(EC.presence_of_element_located((by, selector)) or
-                       EC.presence_of_elements_located((by, selector)),
-                       **kwargs)
+        self._remember(selector, self._wait_for_condition(
+            'presence', selector, EC.presence_of_element_located(locate(selector)), **kwargs))
 
     def wait_for_clickable(self, selector='', **kwargs):
         '''
@@ -1691,11 +2336,9 @@ class WebRunner(object):
             Passed on to _wait_for
 
         '''
-        if selector.startswith('/'):
-            by = By.XPATH
-        else:
-            by = By.CSS_SELECTOR
-        self._wait_for(EC.element_to_be_clickable((by, selector)), **kwargs)
+        kwargs.setdefault('message', 'Timed out waiting for {} to be clickable'.format(selector))
+        self._remember(selector, self._wait_for(EC.element_to_be_clickable(locate(selector)),
+                                                **kwargs))
 
     def wait_for_ko(self, selector='', **kwargs):
         '''
@@ -1726,6 +2369,7 @@ class WebRunner(object):
             Passed on to _wait_for
 
         '''
+        kwargs.setdefault('message', 'Timed out waiting for the URL to match {}'.format(url))
         self._wait_for(expect_url_match(url), **kwargs)
 
     def wait_for_visible(self, selector='', **kwargs):
@@ -1741,12 +2385,8 @@ class WebRunner(object):
             Passed on to _wait_for
 
         '''
-        if selector.startswith('/'):
-            by = By.XPATH
-        else:
-            by = By.CSS_SELECTOR
-        self._wait_for(EC.visibility_of_element_located((by, selector)),
-                       **kwargs)
+        self._remember(selector, self._wait_for_condition(
+            'visible', selector, EC.visibility_of_element_located(locate(selector)), **kwargs))
 
     def _wait_for_presence_or_visible(self, selector, wait_for, **kwargs):
         '''
@@ -1771,12 +2411,8 @@ class WebRunner(object):
             Passed on to _wait_for
 
         '''
-        if selector.startswith('/'):
-            by = By.XPATH
-        else:
-            by = By.CSS_SELECTOR
-        self._wait_for(EC.invisibility_of_element_located((by, selector)),
-                       **kwargs)
+        self._wait_for_condition('invisible', selector,
+                                 EC.invisibility_of_element_located(locate(selector)), **kwargs)
 
     def wait_for_all_invisible(self, selector='', **kwargs):
         '''
@@ -1788,13 +2424,17 @@ class WebRunner(object):
             A CSS selector to search for. This can be any valid CSS selector.
 
         kwargs:
-            Passed on to _wait_for
+            Passed on to _wait_for_condition
+
+        Raises
+        ------
+        NoSuchElementException
+            When nothing matches selector.
 
         '''
         all_matches = self.get_elements(selector)
-
-        for match in all_matches:
-            self._wait_for(invisibility_of(match), **kwargs)
+        self._wait_for_condition('all_invisible', selector, invisibility_of_all(all_matches),
+                                 expected=all_matches, **kwargs)
 
     def wait_for_js(self, js_script, **kwargs):
         '''
@@ -1809,11 +2449,31 @@ class WebRunner(object):
             passed on to _wait_for
 
         '''
+        kwargs.setdefault('message', 'Timed out waiting for the script to return true: {}'.format(js_script))
         self._wait_for(lambda browser: bool(browser.execute_script(js_script)),
                        **kwargs)
 
-    def wait_for_text_on_page(self, text):
-        self._wait_for(lambda s: text in s.page_source)
+    def wait_for_text_on_page(self, text, markup=True, **kwargs):
+        '''
+        Wait for text to appear anywhere on the page.
+
+        Parameters
+        ----------
+        text: str
+            The text to wait for.
+        markup: bool
+            Search the HTML of the page, like page_source. False waits for
+            the text of the page. Defaults to True
+        kwargs:
+            Passed on to _wait_for_condition
+
+        '''
+        markup = bool(markup)
+        kwargs.setdefault('message', 'Timed out waiting for "{}" on the page'.format(text))
+        self._wait_for_condition(
+            'page_markup' if markup else 'page_text', None,
+            lambda browser: browser.execute_script(scripts.TEXT_OFFSET, text, markup) != -1,
+            expected=text, **kwargs)
 
     def wait_for_text(self, selector='', text='', **kwargs):
         '''
@@ -1831,12 +2491,9 @@ class WebRunner(object):
             Passed on to _wait_for
 
         '''
-        if selector.startswith('/'):
-            by = By.XPATH
-        else:
-            by = By.CSS_SELECTOR
-        self._wait_for(EC.text_to_be_present_in_element((by, selector),
-                                                        text), **kwargs)
+        self._wait_for_condition('text', selector,
+                                 EC.text_to_be_present_in_element(locate(selector), text),
+                                 expected=text, **kwargs)
 
     def help(self):
         methods = [x for x, y in WebRunner.__dict__.items() if type(y) == FunctionType and not x.startswith('_')]
@@ -1860,12 +2517,9 @@ class WebRunner(object):
             Passed on to _wait_for
 
         '''
-        if selector.startswith('/'):
-            by = By.XPATH
-        else:
-            by = By.CSS_SELECTOR
-        self._wait_for(EC.text_to_be_present_in_element_value((by, selector),
-                                                              text), **kwargs)
+        self._wait_for_condition('value', selector,
+                                 EC.text_to_be_present_in_element_value(locate(selector), text),
+                                 expected=text, **kwargs)
 
     def wait_for_selected(self, selector='', selected=True, **kwargs):
         '''
@@ -1883,11 +2537,9 @@ class WebRunner(object):
             Passed on to _wait_for
 
         '''
-        if selector.startswith('/'):
-            by = By.XPATH
-        else:
-            by = By.CSS_SELECTOR
-        self._wait_for(EC.element_located_selection_state_to_be((by, selector),
+        kwargs.setdefault('message', 'Timed out waiting for {} to be {}'.format(
+            selector, 'selected' if selected else 'unselected'))
+        self._wait_for(EC.element_located_selection_state_to_be(locate(selector),
                                                                 selected), **kwargs)
 
     def wait_for_title(self, title, **kwargs):
@@ -1903,6 +2555,7 @@ class WebRunner(object):
             Passed on to _wait_for
 
         '''
+        kwargs.setdefault('message', 'Timed out waiting for the title to be {}'.format(title))
         self._wait_for(EC.title_is(title), **kwargs)
 
     def wait_for_value(self, selector='', value='', **kwargs):
@@ -1921,12 +2574,9 @@ class WebRunner(object):
             Passed on to _wait_for
 
         '''
-        if selector.startswith('/'):
-            by = By.XPATH
-        else:
-            by = By.CSS_SELECTOR
-        self._wait_for(EC.text_to_be_present_in_element_value((by, selector),
-                                                              value), **kwargs)
+        self._wait_for_condition('value', selector,
+                                 EC.text_to_be_present_in_element_value(locate(selector), value),
+                                 expected=value, **kwargs)
 
     def wait_for_opacity(self, selector, opacity, **kwargs):
         '''
@@ -1946,9 +2596,11 @@ class WebRunner(object):
         '''
 
         def _wait_for_opacity(self, browser):
-            return str(self.get_element(selector).value_of_css_property('opacity')) == str(opacity)
+            elem = browser.find_element(*locate(selector))
+            return str(elem.value_of_css_property('opacity')) == str(opacity)
 
-        self._wait_for(partial(_wait_for_opacity, self), **kwargs)
+        self._wait_for_condition('opacity', selector, partial(_wait_for_opacity, self),
+                                 expected=opacity, **kwargs)
 
     def switch_to_window(self, window_name=None, title=None, url=None):
         '''
@@ -1966,6 +2618,7 @@ class WebRunner(object):
             URL of the window you want to switch to.
 
         '''
+        self._elements.clear()
         if window_name:
             self.browser.switch_to_window(window_name)
             return
@@ -2060,6 +2713,7 @@ class WebRunner(object):
                 alert.dismiss()
             else:
                 alert.accept()
+            self._elements.clear()
 
         except NoAlertPresentException:
             if not ignore_exception:
@@ -2085,10 +2739,37 @@ class WebRunner(object):
 
 
 class WebRunnerElement(WebElement):
-    ''' Checks for a known element to be invisible.
-        Much like the builtin visibility_of:
-        https://github.com/SeleniumHQ/selenium/search?utf8=%E2%9C%93&q=visibility_of
+    ''' A WebElement with a few extra helpers.
+        start() makes the browser create these directly, so elements are not
+        copied into a second object. It adds no state of its own.
     '''
+    # {element class: WebRunnerElement subclass of it} See for_class
+    _subclasses = {}
+
+    @classmethod
+    def for_class(cls, base):
+        '''
+        The WebRunnerElement class for elements of the given WebElement
+        class. Drivers with elements of their own (FirefoxWebElement...)
+        get a subclass of both, so their helpers keep working.
+        '''
+        if issubclass(base, cls):
+            return base
+        if base is WebElement:
+            return cls
+        subclass = cls._subclasses.get(base)
+        if subclass is None:
+            subclass = cls._subclasses[base] = type(cls.__name__, (cls, base), {})
+        return subclass
+
+    @classmethod
+    def extend(cls, elem):
+        '''
+        Turns a WebElement into a WebRunnerElement in place.
+        '''
+        if not isinstance(elem, cls):
+            elem.__class__ = cls.for_class(type(elem))
+        return elem
 
     def has_class(self, name):
         return name in self.classes
@@ -2128,3 +2809,33 @@ class invisibility_of(object):
             # If the element reference is no longer valid,
             # it was likely removed from the dom and is no longer visible
             return True
+
+
+class invisibility_of_all(object):
+    ''' Checks for every one of a list of known elements to be invisible,
+        with one script per check instead of one command per element.
+        The first check keeps the elements in the page and the later ones
+        only pass their key, so elements removed from the page in the
+        meantime are simply counted as invisible.
+    '''
+
+    def __init__(self, elements):
+        self.elements = list(elements)
+        self.key = id(self)
+        self.kept = False
+
+    def __call__(self, driver):
+        if self.kept:
+            return driver.execute_script(scripts.ALL_INVISIBLE, None, self.key)
+        try:
+            hidden = driver.execute_script(scripts.ALL_INVISIBLE, self.elements, self.key)
+        except EC.StaleElementReferenceException:
+            # Removed from the dom before the first check, so invisible. Drop them.
+            for elem in list(self.elements):
+                try:
+                    driver.execute_script(scripts.ALL_INVISIBLE, [elem], None)
+                except EC.StaleElementReferenceException:
+                    self.elements.remove(elem)
+            hidden = driver.execute_script(scripts.ALL_INVISIBLE, self.elements, self.key)
+        self.kept = True
+        return hidden
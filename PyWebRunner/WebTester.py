@@ -56,8 +56,8 @@ class WebTester(WebRunner):
         '''
         self._wait_for_presence_or_visible(selector, wait_for, **kwargs)
 
-        el = self.get_element(selector)
-        assert cls in el.get_attribute('class')
+        classes = self._on_element(selector, lambda el: el.get_attribute('class'))
+        assert cls in classes
 
     def assert_element_not_has_class(self, selector, cls, wait_for='presence', **kwargs):
         '''
@@ -76,8 +76,8 @@ class WebTester(WebRunner):
         '''
         self._wait_for_presence_or_visible(selector, wait_for, **kwargs)
 
-        el = self.get_element(selector)
-        assert cls not in el.get_attribute('class')
+        classes = self._on_element(selector, lambda el: el.get_attribute('class'))
+        assert cls not in classes
 
     def assert_exists(self, selector):
         '''
@@ -111,7 +111,7 @@ class WebTester(WebRunner):
         current_url = self.browser.current_url
         assert current_url == url, 'The URL was: {0} instead of {1}'.format(current_url, url)
 
-    def assert_text_in_page(self, text):
+    def assert_text_in_page(self, text, markup=True):
         '''
         Asserts that the text exists on the page.
 
@@ -119,11 +119,14 @@ class WebTester(WebRunner):
         ----------
         text: str
             Text to search for.
+        markup: bool
+            Search the HTML of the page, like page_source. False searches
+            only its text. Defaults to True
 
         '''
-        assert self.is_text_on_page(text) == True, '{} was not present in the source code.'.format(text)
+        assert self.is_text_on_page(text, markup) == True, '{} was not present in the source code.'.format(text)
 
-    def assert_text_not_in_page(self, text):
+    def assert_text_not_in_page(self, text, markup=True):
         '''
         Asserts that the text does not exist on the page.
 
@@ -131,9 +134,12 @@ class WebTester(WebRunner):
         ----------
         text: str
             Text to search for.
+        markup: bool
+            Search the HTML of the page, like page_source. False searches
+            only its text. Defaults to True
 
         '''
-        assert self.is_text_on_page(text) == False, '{} was present in the source code.'.format(text)
+        assert self.is_text_on_page(text, markup) == False, '{} was present in the source code.'.format(text)
 
     def assert_not_visible(self, selector):
         '''
@@ -148,8 +154,8 @@ class WebTester(WebRunner):
         '''
         self.wait_for_presence(selector)
 
-        elem = self.get_element(selector)
-        assert elem.is_displayed() == False, 'The {} element was visible.'.format(selector)
+        displayed = self._on_element(selector, lambda elem: elem.is_displayed())
+        assert displayed == False, 'The {} element was visible.'.format(selector)
 
     def assert_visible(self, selector, **kwargs):
         '''
@@ -165,8 +171,8 @@ class WebTester(WebRunner):
         '''
         self.wait_for_presence(selector, **kwargs)
 
-        elem = self.get_element(selector)
-        assert elem.is_displayed() == True, 'The {} element was not visible.'.format(selector)
+        displayed = self._on_element(selector, lambda elem: elem.is_displayed())
+        assert displayed == True, 'The {} element was not visible.'.format(selector)
 
     def assert_value_of_element(self, selector, value, wait_for='presence', **kwargs):
         '''
@@ -0,0 +1,1033 @@
+'''
+An asyncio engine for running command scripts. (Python 3.5+)
+
+Every WebDriver command is an HTTP request that mostly waits on the browser.
+Instead of a process (and a blocking Selenium client) per browser, the classes
+here speak the WebDriver wire protocol over non-blocking keep-alive
+connections so a single process can drive many sessions at once.
+
+AsyncWebRunner supports the commonly scripted subset of the WebTester
+commands. Every method that talks to the browser is a coroutine, including
+command_script. Scripts that use any other WebTester command are rejected
+with an UnsupportedCommandError before their first step runs.
+
+This module is not imported by PyWebRunner itself. Import it explicitly:
+
+    from PyWebRunner.aio import run_scripts
+
+'''
+import asyncio
+import json
+import os
+import re
+import string
+
+from urllib.parse import urlparse
+
+from selenium.common.exceptions import (NoSuchElementException, StaleElementReferenceException,
+                                        TimeoutException, WebDriverException)
+from selenium.webdriver.common.desired_capabilities import DesiredCapabilities
+from selenium.webdriver.common.keys import Keys
+from selenium.webdriver.common.utils import free_port, keys_to_typing
+from selenium.webdriver.remote.command import Command
+from selenium.webdriver.remote.errorhandler import ErrorCode, ErrorHandler
+from selenium.webdriver.remote.remote_connection import RemoteConnection
+
+from PyWebRunner import js as scripts
+from PyWebRunner import launch
+from PyWebRunner import proxy as proxies
+from PyWebRunner import script as script_plans
+from PyWebRunner.locator import locate
+from PyWebRunner.WebRunner import WebRunner
+from PyWebRunner.WebTester import WebTester
+from PyWebRunner.utils import which, fix_chrome, fix_gecko, prompt
+
+ELEMENT_KEY = 'element-6066-11e4-a52e-4f735466cecf'
+
+# Requests that can be sent again when the connection fails before the
+# answer arrives. The server may already have acted on any other request.
+IDEMPOTENT = ('GET', 'HEAD', 'OPTIONS', 'DELETE')
+
+# The (method, path) of every WebDriver command. Taken from Selenium so both
+# clients always agree on the protocol.
+_COMMANDS = None
+
+# arguments: selector. Returns the first match if it is displayed, otherwise null.
+VISIBLE = scripts.FIND_ALL + scripts.IS_DISPLAYED + '''
+var e = __pwrFindAll(arguments[0])[0];
+return e && __pwrIsDisplayed(e) ? e : null;
+'''
+
+# arguments: selector. True when nothing matches or the first match is hidden.
+INVISIBLE = scripts.FIND_ALL + scripts.IS_DISPLAYED + '''
+var e = __pwrFindAll(arguments[0])[0];
+return !e || !__pwrIsDisplayed(e);
+'''
+
+# arguments: selector. The checked state of the first match (null if none).
+CHECKED = scripts.FIND_ALL + '''
+var e = __pwrFindAll(arguments[0])[0];
+return e ? !!(e.checked || e.selected) : null;
+'''
+
+
+class UnsupportedCommandError(ValueError):
+    """
+    Raised by AsyncWebRunner.command_script for scripts that use WebTester
+    commands AsyncWebRunner doesn't have.
+    """
+
+
+def _commands():
+    global _COMMANDS
+
+    if _COMMANDS is None:
+        _COMMANDS = RemoteConnection('http://127.0.0.1', resolve_ip=False)._commands
+    return _COMMANDS
+
+
+class AsyncHTTPClient(object):
+    """
+    A minimal HTTP/1.1 client for talking to a WebDriver server.
+
+    Connections are kept alive and reused, so a command costs one request
+    on an open socket instead of a new connection.
+
+    Parameters
+    ----------
+    url: str
+        The address of the WebDriver server. (http://host:port/path)
+    connections: int
+        Maximum number of requests in flight at once.
+    """
+
+    def __init__(self, url, connections=2):
+        parsed = urlparse(url)
+        self.host = parsed.hostname
+        self.port = parsed.port or 80
+        self.base_path = parsed.path.rstrip('/')
+        self.connections = int(connections)
+        self.idle = []
+        # Created on first use so it belongs to the running event loop.
+        self._slots = None
+
+    async def request(self, method, path, body=None):
+        '''
+        Sends a request and reads the whole response.
+
+        Returns
+        -------
+        (int, dict, bytes)
+            The status code, the headers (lower case names) and the body.
+
+        '''
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.connections)
+
+        if method not in ('POST', 'PUT'):
+            body = None
+
+        async with self._slots:
+            conn = self._checkout()
+            reused = conn is not None
+            if not reused:
+                conn = await asyncio.open_connection(self.host, self.port)
+
+            sent = False
+            try:
+                await self._write(conn, method, path, body)
+                sent = True
+                status, headers, data = await self._read(conn)
+            except (OSError, asyncio.IncompleteReadError):
+                conn[1].close()
+                if not reused or (sent and method not in IDEMPOTENT):
+                    raise
+                # The server closed the idle connection. Retry once on a new one.
+                conn = await asyncio.open_connection(self.host, self.port)
+                try:
+                    await self._write(conn, method, path, body)
+                    status, headers, data = await self._read(conn)
+                except (OSError, asyncio.IncompleteReadError):
+                    conn[1].close()
+                    raise
+
+            if headers.get('connection', '').lower() == 'close':
+                conn[1].close()
+            else:
+                self.idle.append(conn)
+
+        return status, headers, data
+
+    def _checkout(self):
+        # Skip the idle connections the server has closed in the meantime.
+        while self.idle:
+            reader, writer = self.idle.pop()
+            # The transport's is_closing: StreamWriter only has one from Python 3.7.
+            if not reader.at_eof() and not writer.transport.is_closing():
+                return reader, writer
+            writer.close()
+        return None
+
+    async def _write(self, conn, method, path, body):
+        reader, writer = conn
+        payload = body.encode('utf-8') if body else b''
+        head = ('{} {}{} HTTP/1.1\r\n'
+                'Host: {}:{}\r\n'
+                'Accept: application/json\r\n'
+                'Content-Type: application/json;charset=UTF-8\r\n'
+                'Content-Length: {}\r\n'
+                'Connection: keep-alive\r\n'
+                '\r\n').format(method, self.base_path, path, self.host, self.port, len(payload))
+        writer.write(head.encode('latin-1') + payload)
+        await writer.drain()
+
+    async def _read(self, conn):
+        reader, writer = conn
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionResetError('The WebDriver server closed the connection.')
+        status = int(status_line.split()[1])
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int((await reader.readline()).split(b';')[0], 16)
+                if not size:
+                    # Skip any trailers.
+                    while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                        pass
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readexactly(2)
+            data = b''.join(chunks)
+        elif 'content-length' in headers:
+            data = await reader.readexactly(int(headers['content-length']))
+        else:
+            # No length means the body ends when the connection does.
+            data = await reader.read()
+            headers['connection'] = 'close'
+
+        return status, headers, data
+
+    def close(self):
+        '''
+        Closes every idle connection.
+        '''
+        idle, self.idle = self.idle, []
+        for reader, writer in idle:
+            writer.close()
+
+
+class AsyncElement(object):
+    """
+    A reference to an element in an AsyncWebDriver session.
+    """
+    __slots__ = ('parent', 'id')
+
+    def __init__(self, parent, id_):
+        self.parent = parent
+        self.id = id_
+
+    def __eq__(self, other):
+        return isinstance(other, AsyncElement) and self.id == other.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+    async def _execute(self, command, params=None):
+        params = dict(params or {})
+        params['id'] = self.id
+        return (await self.parent.execute(command, params))['value']
+
+    async def click(self):
+        await self._execute(Command.CLICK_ELEMENT)
+
+    async def clear(self):
+        await self._execute(Command.CLEAR_ELEMENT)
+
+    async def send_keys(self, *value):
+        await self._execute(Command.SEND_KEYS_TO_ELEMENT,
+                            {'text': ''.join(keys_to_typing(value)),
+                             'value': keys_to_typing(value)})
+
+    async def get_text(self):
+        return await self._execute(Command.GET_ELEMENT_TEXT)
+
+    async def get_tag_name(self):
+        return await self._execute(Command.GET_ELEMENT_TAG_NAME)
+
+
+class AsyncWebDriver(object):
+    """
+    A non-blocking WebDriver client for a single browser session.
+
+    Speaks both the JSON wire protocol and W3C WebDriver, using the command
+    table and error handling of the Selenium client.
+
+    Parameters
+    ----------
+    command_executor: str
+        The address of the WebDriver server.
+    desired_capabilities: dict
+        The capabilities to request for the session.
+    connections: int
+        Maximum number of requests in flight at once.
+    """
+
+    def __init__(self, command_executor='http://127.0.0.1:4444/wd/hub',
+                 desired_capabilities=None, connections=2):
+        self.http = AsyncHTTPClient(command_executor, connections)
+        self.desired_capabilities = dict(desired_capabilities or DesiredCapabilities.CHROME)
+        self.error_handler = ErrorHandler()
+        self.session_id = None
+        self.capabilities = None
+        self.w3c = False
+
+    async def start_session(self):
+        '''
+        Creates the browser session.
+        '''
+        parameters = {'capabilities': {'firstMatch': [], 'alwaysMatch': self.desired_capabilities},
+                      'desiredCapabilities': self.desired_capabilities}
+        response = await self.execute(Command.NEW_SESSION, parameters)
+        if 'sessionId' not in response:
+            response = response['value']
+        self.session_id = response['sessionId']
+        self.capabilities = response.get('value') or response.get('capabilities')
+        self.w3c = response.get('status') is None
+
+    async def quit(self):
+        '''
+        Ends the session (closing the browser) and its connections.
+        '''
+        try:
+            if self.session_id is not None:
+                await self.execute(Command.QUIT)
+        finally:
+            self.session_id = None
+            self.http.close()
+
+    def _wrap_value(self, value):
+        if isinstance(value, dict):
+            return dict((key, self._wrap_value(val)) for key, val in value.items())
+        elif isinstance(value, AsyncElement):
+            return {'ELEMENT': value.id, ELEMENT_KEY: value.id}
+        elif isinstance(value, (list, tuple)):
+            return [self._wrap_value(item) for item in value]
+        return value
+
+    def _unwrap_value(self, value):
+        if isinstance(value, dict):
+            if 'ELEMENT' in value or ELEMENT_KEY in value:
+                return AsyncElement(self, value.get('ELEMENT') or value[ELEMENT_KEY])
+            return dict((key, self._unwrap_value(val)) for key, val in value.items())
+        elif isinstance(value, list):
+            return [self._unwrap_value(item) for item in value]
+        return value
+
+    @staticmethod
+    def _parse_response(status, headers, data):
+        # Mirrors RemoteConnection._request.
+        body = data.decode('utf-8').replace('\x00', '').strip()
+        if 399 < status <= 500:
+            return {'status': status, 'value': body}
+        if headers.get('content-type', '').startswith('image/png'):
+            return {'status': ErrorCode.SUCCESS, 'value': body}
+        try:
+            response = json.loads(body)
+        except ValueError:
+            if 199 < status < 300:
+                return {'status': ErrorCode.SUCCESS, 'value': body}
+            return {'status': ErrorCode.UNKNOWN_ERROR, 'value': body}
+        if 'value' not in response:
+            response['value'] = None
+        return response
+
+    async def execute(self, command, params=None):
+        '''
+        Sends a command to the WebDriver server.
+
+        Parameters
+        ----------
+        command: str
+            One of selenium.webdriver.remote.command.Command
+        params: dict
+            The parameters of the command. Path parameters (sessionId, id...)
+            are filled in from here too.
+
+        Returns
+        -------
+        dict
+            The response, with element references turned into AsyncElements.
+
+        '''
+        method, path = _commands()[command]
+        params = dict(params or {})
+        if self.session_id is not None:
+            params.setdefault('sessionId', self.session_id)
+        params = self._wrap_value(params)
+
+        path = string.Template(path).substitute(params)
+        status, headers, data = await self.http.request(method, path, json.dumps(params))
+        if 300 <= status < 304:
+            location = urlparse(headers.get('location', ''))
+            status, headers, data = await self.http.request('GET', location.path)
+
+        response = self._parse_response(status, headers, data)
+        if response:
+            self.error_handler.check_response(response)
+            response['value'] = self._unwrap_value(response.get('value'))
+            return response
+        return {'success': 0, 'value': None, 'sessionId': self.session_id}
+
+    async def get(self, url):
+        await self.execute(Command.GET, {'url': url})
+
+    async def execute_script(self, script, *args):
+        command = Command.W3C_EXECUTE_SCRIPT if self.w3c else Command.EXECUTE_SCRIPT
+        return (await self.execute(command, {'script': script, 'args': list(args)}))['value']
+
+    async def find_elements(self, selector):
+        locator = locate(selector)
+        params = {'using': locator.by, 'value': locator.value}
+        return (await self.execute(Command.FIND_ELEMENTS, params))['value'] or []
+
+    async def get_current_url(self):
+        return (await self.execute(Command.GET_CURRENT_URL))['value']
+
+    async def get_title(self):
+        return (await self.execute(Command.GET_TITLE))['value']
+
+    async def get_page_source(self):
+        return (await self.execute(Command.GET_PAGE_SOURCE))['value']
+
+
+class AsyncWebRunner(object):
+    """
+    A coroutine version of WebTester for running command scripts.
+
+    Every method that talks to the browser must be awaited. Waits poll
+    without blocking the event loop, so many runners can share one.
+
+    Parameters
+    ----------
+    driver: str
+        'chrome', 'chrome-headless', 'gecko', 'gecko-headless' or 'remote'.
+        Local drivers need a running driver server (see DriverService).
+    command_executor: str
+        The address of the WebDriver server.
+    desired_capabilities: dict or str
+        Capabilities (or the name of a DesiredCapabilities entry) to request.
+    base_url: str
+        Prefix for goto.
+    timeout: int
+        Default timeout of every wait_* method.
+    poll_frequency: float
+        Seconds between the checks of every wait_* method.
+    launch_profile: str
+        'default' or 'lean'. (See PyWebRunner.launch)
+    proxy_address: str
+        host:port of a running proxy (see PyWebRunner.proxy) to send the
+        browser's requests through.
+    """
+
+    # These only touch yaml_vars and yaml_funcs, so they work as is.
+    _parse_item = WebRunner._parse_item
+    _import = WebRunner._import
+    _print_command_error = WebRunner._print_command_error
+
+    def __init__(self, **kwargs):
+        self.driver = os.environ.get('WR_DRIVER', kwargs.get('driver', 'chrome')).lower()
+        self.command_executor = os.environ.get(
+            'WR_COMMAND_EXECUTOR', kwargs.get('command_executor', 'http://127.0.0.1:4444/wd/hub'))
+        self.desired_capabilities = os.environ.get(
+            'WR_DESIRED_CAPABILITIES', kwargs.get('desired_capabilities'))
+        self.base_url = kwargs.get('base_url', 'http://127.0.0.1:5000')
+        self.timeout = os.environ.get('WR_TIMEOUT', kwargs.get('timeout', 90))
+        self.default_offset = kwargs.get('default_offset', 0)
+        self.poll_frequency = kwargs.get('poll_frequency', 0.5)
+        self.width = os.environ.get('WR_WIDTH', kwargs.get('width', 1440))
+        self.height = os.environ.get('WR_HEIGHT', kwargs.get('height', 1200))
+        self.launch_profile = os.environ.get('WR_LAUNCH_PROFILE', kwargs.get('launch_profile', 'default'))
+        self.proxy_address = os.environ.get('WR_PROXY', kwargs.get('proxy_address'))
+        self.browser = None
+        self.yaml_funcs = {}
+        self.yaml_vars = {}
+
+    def unsupported_commands(self, plan):
+        '''
+        The WebTester commands of a compiled script (see PyWebRunner.script)
+        that AsyncWebRunner doesn't have, in the order they first appear.
+        '''
+        missing = []
+        for step in plan:
+            if step.key in missing or hasattr(self, step.key):
+                continue
+            if hasattr(WebTester, step.key):
+                missing.append(step.key)
+        return missing
+
+    def _capabilities(self):
+        caps = self._browser_capabilities()
+        if self.proxy_address:
+            caps = dict(caps)
+            caps['proxy'] = proxies.capabilities(self.proxy_address)
+        return caps
+
+    def _browser_capabilities(self):
+        caps = self.desired_capabilities
+        if isinstance(caps, dict):
+            return caps
+        if caps:
+            name = caps.upper()
+            return getattr(DesiredCapabilities, 'INTERNETEXPLORER' if name == 'IE' else name)
+
+        if self.driver in ('gecko', 'gecko-headless', 'firefox-headless'):
+            caps = dict(DesiredCapabilities.FIREFOX)
+            caps['marionette'] = True
+            options = {'prefs': launch.firefox_preferences(self.launch_profile)}
+            if self.driver.endswith('-headless'):
+                options['args'] = ['-headless']
+            caps['moz:firefoxOptions'] = options
+            return caps
+
+        caps = dict(DesiredCapabilities.CHROME)
+        args = ['--window-size={}x{}'.format(self.width, self.height)]
+        if self.driver == 'chrome-headless':
+            args.append('--headless')
+        args.extend(launch.chrome_arguments(self.launch_profile))
+        caps['chromeOptions'] = {'args': args}
+        return caps
+
+    async def start(self):
+        '''
+        Starts a browser session.
+        '''
+        self.browser = AsyncWebDriver(self.command_executor, self._capabilities())
+        await self.browser.start_session()
+
+    async def stop(self):
+        '''
+        Ends the browser session.
+        '''
+        if self.browser:
+            await self.browser.quit()
+            self.browser = None
+
+    async def reset(self):
+        '''
+        Puts the session back into a clean state between scripts.
+        (Cookies, web storage and script variables.)
+        '''
+        await self.browser.execute(Command.DELETE_ALL_COOKIES)
+        try:
+            await self.js('window.localStorage.clear(); window.sessionStorage.clear();')
+        except WebDriverException:
+            # Storage is not available on every page (about:blank, data: URLs).
+            pass
+        self.yaml_vars = {}
+        await self.go('about:blank')
+
+    async def _wait_for(self, condition, timeout=None, poll_frequency=None, message=''):
+        '''
+        Awaits condition() until it returns a truthy value.
+
+        Parameters
+        ----------
+        condition: coroutine function
+            Called without arguments. NoSuchElementException and
+            StaleElementReferenceException count as a falsy result.
+        timeout: int
+            Overrides AsyncWebRunner.timeout
+        poll_frequency: float
+            Overrides AsyncWebRunner.poll_frequency
+
+        Returns
+        -------
+        The truthy value returned by condition.
+
+        '''
+        loop = asyncio.get_event_loop()
+        end = loop.time() + float(timeout or self.timeout)
+        poll = self.poll_frequency if poll_frequency is None else poll_frequency
+        while True:
+            try:
+                value = await condition()
+                if value:
+                    return value
+            except (NoSuchElementException, StaleElementReferenceException):
+                pass
+            if loop.time() > end:
+                raise TimeoutException(message)
+            await asyncio.sleep(poll)
+
+    async def _read(self, selector, kind):
+        return await self.js(scripts.READ_ALL, None, selector, kind, None)
+
+    async def js(self, js_str, *args):
+        '''
+        Runs JavaScript in the page and returns its result.
+        '''
+        return await self.browser.execute_script(js_str, *args)
+
+    async def go(self, address):
+        await self.browser.get(address)
+
+    async def goto(self, url, wait_for_visible=None, wait_for_presence=None):
+        '''
+        Goes to a path relative to base_url and optionally waits for an element.
+        '''
+        await self.go('{}{}'.format(self.base_url, url))
+        if wait_for_visible:
+            await self.wait_for_visible(wait_for_visible)
+        if wait_for_presence:
+            await self.wait_for_presence(wait_for_presence)
+
+    async def refresh(self):
+        await self.browser.execute(Command.REFRESH)
+
+    async def back(self):
+        await self.browser.execute(Command.GO_BACK)
+
+    async def forward(self):
+        await self.browser.execute(Command.GO_FORWARD)
+
+    async def current_url(self):
+        return await self.browser.get_current_url()
+
+    async def get_page_source(self):
+        return await self.browser.get_page_source()
+
+    async def wait(self, seconds=500):
+        await asyncio.sleep(seconds)
+
+    async def find_elements(self, selector):
+        return await self.browser.find_elements(selector)
+
+    async def get_elements(self, selector):
+        elems = await self.find_elements(selector)
+        if not elems:
+            raise NoSuchElementException(selector)
+        return elems
+
+    async def get_element(self, selector):
+        return (await self.get_elements(selector))[0]
+
+    async def count(self, selector):
+        return len(await self.find_elements(selector))
+
+    async def get_text(self, selector):
+        return await (await self.get_element(selector)).get_text()
+
+    async def get_texts(self, selector):
+        texts = await self._read(selector, 'text')
+        if not texts:
+            raise NoSuchElementException(selector)
+        return texts
+
+    async def get_value(self, selector):
+        return (await self.get_values(selector))[0]
+
+    async def get_values(self, selector):
+        values = await self._read(selector, 'value')
+        if not values:
+            raise NoSuchElementException(selector)
+        return values
+
+    async def is_text_on_page(self, text, markup=True):
+        return await self.js(scripts.TEXT_OFFSET, text, bool(markup)) != -1
+
+    async def click(self, selector, **kwargs):
+        '''
+        Waits until the element is displayed, enabled and scrolled into view
+        (see scripts.CLICK_READY), then clicks it.
+        '''
+        kwargs.setdefault('poll_frequency', 0.05)
+        elem = await self._wait_for(
+            lambda: self.js(scripts.CLICK_READY, None, selector, self.default_offset),
+            message='{} was not clickable.'.format(selector), **kwargs)
+        await elem.click()
+
+    async def clear(self, selector):
+        await (await self.get_element(selector)).clear()
+
+    async def set_value(self, selector, value, clear=True, blur=True, **kwargs):
+        '''
+        Types a value into the element once it is visible.
+        (Select boxes are set by value.)
+        '''
+        elem = await self.wait_for_visible(selector, **kwargs)
+        if await elem.get_tag_name() == 'select':
+            await self.set_select_by_value(selector, value)
+            return
+        if clear:
+            await elem.clear()
+        await elem.send_keys(value)
+        if blur:
+            await elem.send_keys(Keys.TAB)
+
+    async def set_values(self, values, clear=True, blur=True, **kwargs):
+        for selector, value in WebRunner._value_pairs(values):
+            await self.set_value(selector, value, clear=clear, blur=blur, **kwargs)
+
+    async def set_select_by_value(self, selector, value):
+        found = await self.js(scripts.FIND_ALL + '''
+            var select = __pwrFindAll(arguments[0])[0];
+            for (var i = 0; i < select.options.length; i++) {
+                if (select.options[i].value == arguments[1]) {
+                    select.selectedIndex = i;
+                    select.dispatchEvent(new Event('change', {bubbles: true}));
+                    return true;
+                }
+            }
+            return false;
+        ''', selector, value)
+        if not found:
+            raise NoSuchElementException('Cannot locate option with value: {}'.format(value))
+
+    async def wait_for_presence(self, selector='', **kwargs):
+        return await self._wait_for(
+            lambda: self.get_element(selector),
+            message='{} was not present.'.format(selector), **kwargs)
+
+    async def wait_for_visible(self, selector='', **kwargs):
+        return await self._wait_for(
+            lambda: self.js(VISIBLE, selector),
+            message='{} was not visible.'.format(selector), **kwargs)
+
+    async def wait_for_clickable(self, selector='', **kwargs):
+        return await self._wait_for(
+            lambda: self.js(scripts.CLICK_READY, None, selector, self.default_offset),
+            message='{} was not clickable.'.format(selector), **kwargs)
+
+    async def wait_for_invisible(self, selector='', **kwargs):
+        await self._wait_for(
+            lambda: self.js(INVISIBLE, selector),
+            message='{} was still visible.'.format(selector), **kwargs)
+
+    async def wait_for_all_invisible(self, selector='', **kwargs):
+        elems = await self.get_elements(selector)
+        # Kept in the page by the first check. (See WebRunner.invisibility_of_all)
+        key = id(elems)
+        kept = []
+
+        async def check():
+            if kept:
+                return await self.js(scripts.ALL_INVISIBLE, None, key)
+            try:
+                hidden = await self.js(scripts.ALL_INVISIBLE, elems, key)
+            except StaleElementReferenceException:
+                # Elements removed from the page count as invisible.
+                for elem in list(elems):
+                    try:
+                        await self.js(scripts.ALL_INVISIBLE, [elem], None)
+                    except StaleElementReferenceException:
+                        elems.remove(elem)
+                hidden = await self.js(scripts.ALL_INVISIBLE, elems, key)
+            kept.append(key)
+            return hidden
+
+        await self._wait_for(check, message='{} was still visible.'.format(selector), **kwargs)
+
+    async def wait_for_text(self, selector='', text='', **kwargs):
+        async def check():
+            return text in await self.get_text(selector)
+        await self._wait_for(check, message='{} never contained: {}'.format(selector, text), **kwargs)
+
+    async def wait_for_value(self, selector='', value='', **kwargs):
+        async def check():
+            return value in (await self.get_value(selector) or '')
+        await self._wait_for(check, message='{} never had the value: {}'.format(selector, value), **kwargs)
+
+    wait_for_text_in_value = wait_for_value
+
+    async def wait_for_text_on_page(self, text, markup=True, **kwargs):
+        await self._wait_for(lambda: self.is_text_on_page(text, markup),
+                             message='{} never appeared on the page.'.format(text), **kwargs)
+
+    async def wait_for_url(self, url='', **kwargs):
+        async def check():
+            return re.search(url, await self.current_url())
+        await self._wait_for(check, message='The URL never matched: {}'.format(url), **kwargs)
+
+    async def wait_for_title(self, title, **kwargs):
+        async def check():
+            return await self.browser.get_title() == title
+        await self._wait_for(check, message='The title never became: {}'.format(title), **kwargs)
+
+    async def wait_for_js(self, js_script, **kwargs):
+        async def check():
+            return bool(await self.js(js_script))
+        await self._wait_for(check, message='The script never returned true.', **kwargs)
+
+    async def assert_exists(self, selector):
+        msg = 'An element could not be found for the selector: {}'.format(selector)
+        assert await self.count(selector), msg
+
+    assert_found = assert_exists
+
+    async def assert_not_found(self, selector):
+        assert not await self.count(selector), 'An element was found for the selector: {}'.format(selector)
+
+    async def assert_visible(self, selector, **kwargs):
+        await self.wait_for_presence(selector, **kwargs)
+        assert await self.js(VISIBLE, selector), 'The {} element was not visible.'.format(selector)
+
+    async def assert_not_visible(self, selector):
+        await self.wait_for_presence(selector)
+        assert await self.js(INVISIBLE, selector), 'The {} element was visible.'.format(selector)
+
+    async def assert_url(self, url):
+        current_url = await self.current_url()
+        assert current_url == url, 'The URL was: {0} instead of {1}'.format(current_url, url)
+
+    async def assert_text_in_page(self, text, markup=True):
+        assert await self.is_text_on_page(text, markup), '{} was not present in the source code.'.format(text)
+
+    async def assert_text_not_in_page(self, text, markup=True):
+        assert not await self.is_text_on_page(text, markup), '{} was present in the source code.'.format(text)
+
+    async def assert_text_in_element(self, selector, text, wait_for='presence', **kwargs):
+        await self._wait_for_presence_or_visible(selector, wait_for, **kwargs)
+        elem_text = await self.get_text(selector)
+        assert text in elem_text, '{} was not found in the element. Found: {}'.format(text, elem_text)
+
+    assert_element_contains_text = assert_text_in_element
+
+    async def assert_value_of_element(self, selector, value, wait_for='presence', **kwargs):
+        await self._wait_for_presence_or_visible(selector, wait_for, **kwargs)
+        elem_value = await self.get_value(selector)
+        assert elem_value == value, 'The value was: {0} instead of {1}'.format(elem_value, value)
+
+    async def assert_element_count(self, selector, count):
+        found = await self.count(selector)
+        assert found == count, 'Found {0} elements instead of {1}'.format(found, count)
+
+    async def assert_checked(self, selector):
+        assert await self.js(CHECKED, selector), '{} was not checked.'.format(selector)
+
+    async def assert_not_checked(self, selector):
+        assert await self.js(CHECKED, selector) is False, '{} was checked.'.format(selector)
+
+    async def _wait_for_presence_or_visible(self, selector, wait_for, **kwargs):
+        if wait_for == 'presence':
+            await self.wait_for_presence(selector, **kwargs)
+        elif wait_for == 'visible':
+            await self.wait_for_visible(selector, **kwargs)
+
+    async def _run_step(self, step, method):
+        if method is not None:
+            result = script_plans.call(step, method, self._parse_item)
+            if asyncio.iscoroutine(result):
+                await result
+        elif step.key == 'import':
+            self._import(step.args)
+        elif step.key in ('value_of', 'text_of'):
+            if step.key == 'value_of':
+                value = await self.get_value(step.args)
+            else:
+                value = await self.get_text(step.args)
+            self.yaml_vars.setdefault(step.key, []).append(value)
+
+    async def command_script(self, filepath=None, script=None, errors=True, verbose=False,
+                             stop_on_error=True):
+        '''
+        Runs a command script. The coroutine version of WebRunner.command_script.
+
+        Parameters
+        ----------
+        filepath: str
+            A YAML or JSON script file.
+        script: list of dicts
+            A list of dicts where the key is the method to execute.
+        errors: bool
+            Whether or not to raise the first error.
+        verbose:
+            Print extra debugging information
+        stop_on_error: bool
+            Whether or not to stop the browser when a command fails.
+
+        Raises
+        ------
+        UnsupportedCommandError
+            Before running anything, when the script uses WebTester commands
+            AsyncWebRunner doesn't have.
+
+        '''
+        self._import('random.randint')
+        self._import('random.choice')
+        self.yaml_funcs['prompt'] = prompt
+        if not script and filepath:
+            plan = script_plans.get_file_plan(filepath)
+        else:
+            plan = script_plans.get_plan(script)
+
+        missing = self.unsupported_commands(plan)
+        if missing:
+            raise UnsupportedCommandError('Not supported by AsyncWebRunner: {}'.format(', '.join(missing)))
+
+        for step in plan:
+            if verbose:
+                if step.label:
+                    print(step.label)
+                if step.dump:
+                    print('Processing command: {}'.format(step.dump))
+            try:
+                method = None
+                if step.key != script_plans.INCLUDE:
+                    method = getattr(self, step.key, None)
+                await self._run_step(step, method)
+            except Exception as e:
+                self._print_command_error(step.command, getattr(e, 'message', repr(e)))
+                if stop_on_error:
+                    await self.stop()
+                if errors:
+                    raise
+
+
+class DriverService(object):
+    """
+    Runs a local chromedriver or geckodriver that every session of a process
+    shares.
+
+    Parameters
+    ----------
+    driver: str
+        The AsyncWebRunner driver name.
+    """
+
+    def __init__(self, driver='chrome'):
+        self.driver = driver
+        self.service = None
+
+    def start(self):
+        '''
+        Starts the driver server (blocking) and returns its address.
+        '''
+        if self.driver in ('gecko', 'gecko-headless', 'firefox-headless'):
+            from selenium.webdriver.firefox.service import Service
+            if not which('geckodriver'):
+                fix_gecko()
+            self.service = Service('geckodriver', port=free_port())
+        else:
+            from selenium.webdriver.chrome.service import Service
+            if not which('chromedriver'):
+                fix_chrome()
+            self.service = Service('chromedriver', port=free_port())
+        self.service.start()
+        return self.service.service_url
+
+    def stop(self):
+        if self.service:
+            self.service.stop()
+            self.service = None
+
+
+async def _stop_quietly(runner):
+    try:
+        await runner.stop()
+    except Exception:
+        # The session is already gone.
+        pass
+
+
+async def _run_file(runner, filepath, failures, errors, verbose, kwargs):
+    '''
+    Runs one script file for run_scripts, starting a session first when
+    runner is None, and resets the session afterwards.
+
+    Returns
+    -------
+    AsyncWebRunner or None
+        The session for the next script. None when the script failed or
+        the session could not be reset, after stopping it.
+
+    '''
+    try:
+        if runner is None:
+            runner = AsyncWebRunner(**kwargs)
+            await runner.start()
+        print('Processing {}:'.format(filepath))
+        await runner.command_script(filepath=filepath, errors=True, verbose=verbose,
+                                    stop_on_error=False)
+    except Exception as e:
+        print('Error running {}'.format(filepath))
+        if errors:
+            print(e)
+        failures[filepath] = e
+        if runner is not None:
+            await _stop_quietly(runner)
+        return None
+
+    try:
+        await runner.reset()
+    except Exception:
+        await _stop_quietly(runner)
+        return None
+    return runner
+
+
+async def run_scripts(files, sessions=10, errors=False, verbose=False, on_done=None, **kwargs):
+    '''
+    Runs script files over a number of concurrent browser sessions.
+
+    Each session runs one script at a time and is reset and reused for the
+    next one. A session is replaced when its script fails.
+
+    Parameters
+    ----------
+    files: list of str
+        The script paths, in the order they should start.
+    sessions: int
+        Number of browsers to run at once.
+    errors: bool
+        Print the error of every failing script.
+    verbose: bool
+        Print every command as it runs.
+    on_done: callable
+        Called with (filepath, seconds) as every script finishes.
+    kwargs:
+        Passed on to AsyncWebRunner.
+
+    Returns
+    -------
+    dict
+        {filepath: exception} for every script that failed.
+
+    '''
+    loop = asyncio.get_event_loop()
+    service = None
+    if kwargs.get('driver', 'chrome').lower() in ('chrome', 'chrome-headless', 'gecko', 'gecko-headless', 'firefox-headless'):
+        service = DriverService(kwargs.get('driver', 'chrome').lower())
+        kwargs['command_executor'] = await loop.run_in_executor(None, service.start)
+
+    queue = asyncio.Queue()
+    for filepath in files:
+        queue.put_nowait(filepath)
+    failures = {}
+
+    async def worker():
+        runner = None
+        while not queue.empty():
+            filepath = queue.get_nowait()
+            start = loop.time()
+            runner = await _run_file(runner, filepath, failures, errors, verbose, kwargs)
+            if on_done:
+                on_done(filepath, loop.time() - start)
+        if runner is not None:
+            await runner.stop()
+
+    try:
+        await asyncio.gather(*[worker() for _ in range(max(1, int(sessions)))])
+    finally:
+        if service:
+            await loop.run_in_executor(None, service.stop)
+    return failures
@@ -0,0 +1,382 @@
+'''
+JavaScript snippets that WebRunner runs in the page through execute_script.
+
+Doing the work in the browser lets a helper touch many elements with a single
+WebDriver round trip instead of one (or more) per element.
+'''
+
+# Finds all elements for a CSS or XPATH selector (XPATH selectors start with /).
+FIND_ALL = '''
+var __pwrFindAll = function(selector) {
+    if (selector.charAt(0) === '/') {
+        var found = document.evaluate(selector, document, null,
+                                      XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+        var nodes = [];
+        for (var i = 0; i < found.snapshotLength; i++) {
+            nodes.push(found.snapshotItem(i));
+        }
+        return nodes;
+    }
+    return Array.prototype.slice.call(document.querySelectorAll(selector));
+};
+'''
+
+# Mirrors WebElement.is_displayed closely enough for waits and reads.
+# PhantomJS, IE and older Firefox have no isConnected.
+IS_DISPLAYED = '''
+var __pwrIsDisplayed = function(e) {
+    if (!e) {
+        return false;
+    }
+    var connected = e.isConnected === undefined ? document.documentElement.contains(e) : e.isConnected;
+    if (!connected) {
+        return false;
+    }
+    var style = window.getComputedStyle(e);
+    if (style.visibility === 'hidden' || style.visibility === 'collapse') {
+        return false;
+    }
+    return e.getClientRects().length > 0 && (e.offsetWidth > 0 || e.offsetHeight > 0);
+};
+'''
+
+# Offset of text in the text of the page, or in its markup, -1 if it isn't there.
+# textContent includes hidden text like page_source does and needs no layout.
+FIND_TEXT = '''
+var __pwrFindText = function(text, markup) {
+    var root = document.documentElement;
+    if (!root) {
+        return -1;
+    }
+    return (markup ? root.outerHTML : root.textContent).indexOf(text);
+};
+'''
+
+# arguments: text, markup (bool)
+TEXT_OFFSET = FIND_TEXT + '''
+return __pwrFindText(arguments[0], arguments[1]);
+'''
+
+# arguments: elements (list or null), key (or null). True when every element is
+# hidden or detached. The elements are kept in the page under key, so later
+# checks pass null instead: an element removed from the page can't be passed
+# without the driver raising StaleElementReferenceException.
+ALL_INVISIBLE = IS_DISPLAYED + '''
+var kept = window.__pwrKept = window.__pwrKept || {};
+var key = arguments[1];
+var elems = arguments[0] || kept[key];
+if (!elems) {
+    // The page they were kept in is gone, and them with it.
+    return true;
+}
+var hidden = Array.prototype.every.call(elems, function(e) {
+    return !__pwrIsDisplayed(e);
+});
+if (key !== null) {
+    if (hidden) {
+        delete kept[key];
+    } else {
+        kept[key] = elems;
+    }
+}
+return hidden;
+'''
+
+# arguments: elements. [type, value, checked] of every element.
+CHOICES = '''
+return Array.prototype.map.call(arguments[0], function(e) {
+    return [e.type === undefined ? e.getAttribute('type') : e.type,
+            e.value === undefined ? e.getAttribute('value') : String(e.value),
+            !!(e.checked || e.selected)];
+});
+'''
+
+# arguments: elements (list or null), selector, what ('text', 'value', 'attribute'), attribute name
+READ_ALL = FIND_ALL + IS_DISPLAYED + '''
+var elems = arguments[0] || __pwrFindAll(arguments[1]);
+var what = arguments[2];
+var name = arguments[3];
+return Array.prototype.map.call(elems, function(e) {
+    if (what === 'text') {
+        return __pwrIsDisplayed(e) ? (e.innerText || '').trim() : '';
+    }
+    if (what === 'value') {
+        return e.value === undefined ? e.getAttribute('value') : String(e.value);
+    }
+    // Same lookup order as WebElement.get_attribute: property first, then attribute.
+    var value = e[name];
+    if (typeof value === 'boolean') {
+        return value ? 'true' : null;
+    }
+    if (value === undefined || value === null || typeof value === 'object' || typeof value === 'function') {
+        return e.getAttribute(name);
+    }
+    return String(value);
+});
+'''
+
+# arguments: rows ([how, selector, value], ...), clear, blur
+# how is the search method of fill_form: css, xpath, name, id or class.
+# Sets the value of every row and fires the input/change (and blur/focusout)
+# events that typing would. Radios and checkboxes are clicked when their
+# checked state has to change. Returns the indexes of the rows it left alone
+# so the caller can fill them the slow way: rows that match nothing, hidden
+# or disabled fields, file inputs and values a select has no option for.
+FILL = FIND_ALL + IS_DISPLAYED + '''
+var rows = arguments[0];
+var clear = arguments[1];
+var blur = arguments[2];
+
+var find = function(how, what) {
+    if (how === 'name') {
+        return document.getElementsByName(what);
+    }
+    if (how === 'id') {
+        var e = document.getElementById(what);
+        return e ? [e] : [];
+    }
+    if (how === 'class') {
+        return document.getElementsByClassName(what);
+    }
+    return __pwrFindAll(what);
+};
+var fire = function(e, name, bubbles) {
+    e.dispatchEvent(new Event(name, {bubbles: bubbles}));
+};
+var setValue = function(e, value) {
+    // The prototype's setter, so frameworks that track the value (React) see the change.
+    var descriptor = Object.getOwnPropertyDescriptor(Object.getPrototypeOf(e), 'value');
+    if (descriptor && descriptor.set) {
+        descriptor.set.call(e, value);
+    } else {
+        e.value = value;
+    }
+};
+var fill = function(elems, value) {
+    if (!elems.length) {
+        return false;
+    }
+    var e = elems[0];
+    var type = (e.getAttribute('type') || '').toLowerCase();
+    if (type === 'radio' || type === 'checkbox') {
+        var wanted = [].concat(value).map(String);
+        var toggle = [];
+        for (var i = 0; i < elems.length; i++) {
+            var want = wanted.indexOf(elems[i].value) !== -1;
+            // Checking a radio unchecks the others.
+            if (elems[i].checked !== want && (want || type === 'checkbox')) {
+                // A user can't click it. Leave the group to the slow way.
+                if (elems[i].disabled || !__pwrIsDisplayed(elems[i])) {
+                    return false;
+                }
+                toggle.push(elems[i]);
+            }
+        }
+        toggle.forEach(function(e) {
+            e.click();
+        });
+        return true;
+    }
+    var tag = e.tagName.toLowerCase();
+    if (elems.length > 1 || type === 'file' || e.disabled || !__pwrIsDisplayed(e)) {
+        return false;
+    }
+    if (tag === 'select') {
+        var exists = Array.prototype.some.call(e.options, function(option) {
+            return option.value === String(value);
+        });
+        if (!exists) {
+            return false;
+        }
+        setValue(e, String(value));
+    } else if (tag === 'input' || tag === 'textarea') {
+        setValue(e, clear ? String(value) : e.value + String(value));
+    } else {
+        return false;
+    }
+    fire(e, 'input', true);
+    fire(e, 'change', true);
+    if (blur) {
+        fire(e, 'blur', false);
+        fire(e, 'focusout', true);
+    }
+    return true;
+};
+
+var left = [];
+for (var r = 0; r < rows.length; r++) {
+    try {
+        if (!fill(find(rows[r][0], rows[r][1]), rows[r][2])) {
+            left.push(r);
+        }
+    } catch (error) {
+        left.push(r);
+    }
+}
+return left;
+'''
+
+# arguments: element (or null), selector, offset
+# Returns the element once it is displayed, enabled and scrolled into view.
+# Otherwise scrolls it towards the viewport and returns null so the caller polls again.
+CLICK_READY = FIND_ALL + IS_DISPLAYED + '''
+var e = arguments[0] || __pwrFindAll(arguments[1])[0];
+if (!e || !__pwrIsDisplayed(e) || e.disabled) {
+    return null;
+}
+var rect = e.getBoundingClientRect();
+if (rect.top < arguments[2] || rect.bottom > window.innerHeight) {
+    window.scrollTo(0, rect.top + window.pageYOffset - arguments[2]);
+    rect = e.getBoundingClientRect();
+}
+if (rect.top < 0 || (rect.bottom > window.innerHeight && rect.height <= window.innerHeight)) {
+    return null;
+}
+return e;
+'''
+
+# Async. arguments: selector, offset, offset selector (or null), settle timeout (ms), callback
+# Scrolls the element into view (minus the offset and the offset element's height)
+# and calls back once scrollY has stopped changing for a few animation frames.
+# Calls back with the selector that matched nothing if the element or the
+# offset element does not exist.
+SCROLL_TO_SETTLED = FIND_ALL + '''
+var done = arguments[arguments.length - 1];
+var e = __pwrFindAll(arguments[0])[0];
+if (!e) {
+    done(arguments[0]);
+    return;
+}
+var offset = arguments[1];
+if (arguments[2]) {
+    var offsetElem = __pwrFindAll(arguments[2])[0];
+    if (!offsetElem) {
+        done(arguments[2]);
+        return;
+    }
+    offset += offsetElem.getBoundingClientRect().height;
+}
+window.scrollTo(0, e.getBoundingClientRect().top + window.pageYOffset - offset);
+
+var finished = false;
+var finish = function() {
+    if (!finished) {
+        finished = true;
+        done(true);
+    }
+};
+// rAF does not fire in background tabs so the timeout also ends the wait.
+setTimeout(finish, arguments[3]);
+var last = window.pageYOffset;
+var still = 0;
+var tick = function() {
+    if (finished) {
+        return;
+    }
+    var y = window.pageYOffset;
+    still = (y === last) ? still + 1 : 0;
+    last = y;
+    if (still >= 3) {
+        finish();
+    } else {
+        window.requestAnimationFrame(tick);
+    }
+};
+window.requestAnimationFrame(tick);
+'''
+
+# Async. arguments: condition, selector, expected, timeout (ms), callback
+# Checks the condition against the first match of the selector whenever the
+# document changes (MutationObserver) and on every animation frame, and calls
+# back as soon as it holds: with the element for 'presence' and 'visible',
+# with true for the others. Calls back with null when the timeout runs out.
+# Conditions: presence, visible, invisible, text, value, opacity,
+# page_text and page_markup, which search the whole page for expected, and
+# all_invisible, which waits for every element in expected to be hidden.
+WAIT_FOR = FIND_ALL + IS_DISPLAYED + FIND_TEXT + '''
+var done = arguments[arguments.length - 1];
+var condition = arguments[0];
+var selector = arguments[1];
+var expected = arguments[2];
+
+var check = function() {
+    if (condition === 'page_text' || condition === 'page_markup') {
+        return __pwrFindText(expected, condition === 'page_markup') !== -1;
+    }
+    if (condition === 'all_invisible') {
+        return Array.prototype.every.call(expected, function(e) {
+            return !__pwrIsDisplayed(e);
+        });
+    }
+    var e = __pwrFindAll(selector)[0];
+    if (condition === 'invisible') {
+        return !e || !__pwrIsDisplayed(e);
+    }
+    if (!e) {
+        return null;
+    }
+    if (condition === 'presence') {
+        return e;
+    }
+    if (condition === 'visible') {
+        return __pwrIsDisplayed(e) ? e : null;
+    }
+    if (condition === 'text') {
+        var text = __pwrIsDisplayed(e) ? (e.innerText || '') : '';
+        return text.indexOf(expected) !== -1;
+    }
+    if (condition === 'value') {
+        var value = e.value === undefined ? e.getAttribute('value') : String(e.value);
+        return (value || '').indexOf(expected) !== -1;
+    }
+    if (condition === 'opacity') {
+        return parseFloat(window.getComputedStyle(e).opacity) === parseFloat(expected);
+    }
+    throw new Error('Unknown wait condition: ' + condition);
+};
+
+var finished = false;
+var observer = null;
+var timers = [];
+var finish = function(result) {
+    if (finished) {
+        return;
+    }
+    finished = true;
+    if (observer) {
+        observer.disconnect();
+    }
+    for (var i = 0; i < timers.length; i++) {
+        clearTimeout(timers[i]);
+        clearInterval(timers[i]);
+    }
+    done(result);
+};
+var poll = function() {
+    if (!finished) {
+        var result = check();
+        if (result) {
+            finish(result);
+        }
+    }
+};
+
+poll();
+if (!finished) {
+    observer = new MutationObserver(poll);
+    observer.observe(document.documentElement, {
+        attributes: true, characterData: true, childList: true, subtree: true
+    });
+    // Styles, layout and typed values change without mutations.
+    var frame = function() {
+        poll();
+        if (!finished) {
+            window.requestAnimationFrame(frame);
+        }
+    };
+    window.requestAnimationFrame(frame);
+    // rAF does not fire in background tabs.
+    timers.push(setInterval(poll, 100));
+    timers.push(setTimeout(function() { finish(null); }, arguments[3]));
+}
+'''
@@ -0,0 +1,89 @@
+'''
+Launch profiles: the command line arguments (Chrome) and preferences
+(Firefox) WebRunner.start launches the browser with.
+
+'default' launches the browsers as they come. 'lean' turns off what a test
+run has no use for (background networking, updates, sync, telemetry, the
+GPU, first-run pages...) so the browser starts sooner and competes less with
+the test for CPU. It also makes Chrome keep its shared memory in /tmp, since
+the /dev/shm of most containers is too small for it.
+'''
+
+CHROME_ARGUMENTS = {
+    'default': [],
+    'lean': [
+        '--disable-background-networking',
+        '--disable-background-timer-throttling',
+        '--disable-backgrounding-occluded-windows',
+        '--disable-breakpad',
+        '--disable-client-side-phishing-detection',
+        '--disable-component-update',
+        '--disable-default-apps',
+        '--disable-dev-shm-usage',
+        '--disable-gpu',
+        '--disable-hang-monitor',
+        '--disable-prompt-on-repost',
+        '--disable-renderer-backgrounding',
+        '--disable-sync',
+        '--disable-translate',
+        '--metrics-recording-only',
+        '--mute-audio',
+        '--no-default-browser-check',
+        '--no-first-run',
+        '--password-store=basic',
+        '--safebrowsing-disable-auto-update',
+        '--use-mock-keychain',
+    ],
+}
+
+FIREFOX_PREFERENCES = {
+    'default': {},
+    'lean': {
+        'app.normandy.enabled': False,
+        'app.update.auto': False,
+        'app.update.enabled': False,
+        'browser.aboutHomeSnippets.updateUrl': '',
+        'browser.newtabpage.enabled': False,
+        'browser.safebrowsing.downloads.enabled': False,
+        'browser.safebrowsing.malware.enabled': False,
+        'browser.safebrowsing.phishing.enabled': False,
+        'browser.search.update': False,
+        'browser.shell.checkDefaultBrowser': False,
+        'browser.startup.page': 0,
+        'datareporting.healthreport.uploadEnabled': False,
+        'datareporting.policy.dataSubmissionEnabled': False,
+        'extensions.update.enabled': False,
+        'identity.fxaccounts.enabled': False,
+        'layers.acceleration.disabled': True,
+        'media.autoplay.enabled': False,
+        'network.dns.disablePrefetch': True,
+        'network.http.speculative-parallel-limit': 0,
+        'network.prefetch-next': False,
+        'services.sync.enabled': False,
+        'toolkit.telemetry.enabled': False,
+    },
+}
+
+PROFILES = sorted(CHROME_ARGUMENTS)
+
+
+def _check(profile):
+    if profile not in CHROME_ARGUMENTS:
+        raise ValueError('Unknown launch profile: {}. Use one of: {}'.format(
+            profile, ', '.join(PROFILES)))
+
+
+def chrome_arguments(profile='default'):
+    '''
+    The Chrome command line arguments of a launch profile.
+    '''
+    _check(profile)
+    return list(CHROME_ARGUMENTS[profile])
+
+
+def firefox_preferences(profile='default'):
+    '''
+    The Firefox preferences of a launch profile.
+    '''
+    _check(profile)
+    return dict(FIREFOX_PREFERENCES[profile])
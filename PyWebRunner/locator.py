@@ -0,0 +1,57 @@
+'''
+Parsed selectors.
+
+WebRunner methods take CSS or XPATH selectors (XPATH selectors start with /).
+locate turns a selector into a Locator once and remembers it, so the same
+selector used by every step of a script is only looked at the first time.
+'''
+from collections import namedtuple
+
+from selenium.webdriver.common.by import By
+
+# Forget the parsed selectors past this many. (Scripts use far fewer.)
+MAX_LOCATORS = 4096
+
+_LOCATORS = {}
+
+
+class Locator(namedtuple('Locator', ['by', 'value'])):
+    """
+    A (by, value) pair for a CSS or XPATH selector.
+
+    It is a plain tuple to Selenium, so it can be passed to
+    browser.find_element(*locator) and to the expected_conditions as is.
+    """
+    __slots__ = ()
+
+    @property
+    def is_xpath(self):
+        return self.by == By.XPATH
+
+
+def locate(selector):
+    '''
+    Gets the Locator of a CSS/XPATH selector.
+
+    Parameters
+    ----------
+    selector: str or Locator
+        A CSS/XPATH selector. Locators are returned as they are.
+
+    Returns
+    -------
+    Locator
+
+    '''
+    if isinstance(selector, Locator):
+        return selector
+    locator = _LOCATORS.get(selector)
+    if locator is None:
+        if selector.startswith('/'):
+            locator = Locator(By.XPATH, selector)
+        else:
+            locator = Locator(By.CSS_SELECTOR, selector)
+        if len(_LOCATORS) >= MAX_LOCATORS:
+            _LOCATORS.clear()
+        _LOCATORS[selector] = locator
+    return locator
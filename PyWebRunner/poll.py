@@ -0,0 +1,86 @@
+'''
+How often the wait_for_* methods check their condition.
+
+A strategy hands out the pauses between two checks of a wait. Fixed is what
+Selenium's WebDriverWait does. Backoff starts fast, so a condition that holds
+a few milliseconds after the first check doesn't cost half a second, and
+slows down so long waits don't keep the driver busy.
+'''
+
+
+class Fixed(object):
+    """
+    The same pause between every check.
+
+    Parameters
+    ----------
+    interval: float
+        Seconds between two checks.
+    """
+
+    def __init__(self, interval=0.5):
+        self.interval = float(interval)
+
+    def intervals(self):
+        while True:
+            yield self.interval
+
+
+class Backoff(object):
+    """
+    Pauses that grow exponentially: 10ms, 20ms, 40ms... up to maximum.
+
+    Parameters
+    ----------
+    start: float
+        Seconds before the second check.
+    factor: float
+        How much longer each pause is than the one before.
+    maximum: float
+        The longest pause, in seconds.
+    """
+
+    def __init__(self, start=0.01, factor=2.0, maximum=0.5):
+        self.start = float(start)
+        self.factor = float(factor)
+        self.maximum = float(maximum)
+
+    def intervals(self):
+        interval = self.start
+        while True:
+            yield interval
+            interval = min(interval * self.factor, self.maximum)
+
+
+STRATEGIES = {
+    'fixed': Fixed,
+    'backoff': Backoff,
+}
+
+
+def get_strategy(value=None):
+    '''
+    Gets a poll strategy.
+
+    Parameters
+    ----------
+    value: str, number or strategy
+        'fixed' or 'backoff', a number of seconds (a Fixed interval) or an
+        object with an intervals() method. None is Fixed(0.5).
+
+    Returns
+    -------
+    A strategy.
+
+    '''
+    if value is None:
+        return Fixed()
+    if hasattr(value, 'intervals'):
+        return value
+    if value in STRATEGIES:
+        return STRATEGIES[value]()
+    try:
+        return Fixed(float(value))
+    except (TypeError, ValueError):
+        raise ValueError('Unknown poll strategy: {}. Use {} or a number of seconds.'.format(
+            value, ', '.join(sorted(STRATEGIES))))
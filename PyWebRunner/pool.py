@@ -0,0 +1,195 @@
+import threading
+import time
+
+
+class SessionPool(object):
+    """
+    Keeps started WebRunner instances alive so they can be reused between
+    scripts instead of launching a new browser for every one of them.
+
+    Browsers are reset (see WebRunner.reset) when they are handed back and
+    are only relaunched when a script leaves them broken.
+
+    Browsers can be started ahead of time in background threads (see warm)
+    and the pool can keep a number of spare, already started browsers ready
+    so that a crashed browser is swapped out without waiting on a cold start.
+
+    Parameters
+    ----------
+    factory: callable
+        Called with no arguments to build and start a new WebRunner.
+    spares: int
+        Number of started browsers to keep waiting in the pool (in addition
+        to the ones handed out). Replacements are launched in the background.
+
+    Attributes
+    ----------
+    launch_errors: list of Exception
+        Why background launches failed since acquire last raised them.
+    """
+
+    def __init__(self, factory, spares=0):
+        self.factory = factory
+        self.spares = int(spares)
+        self.idle = []
+        self.launched = 0
+        self.pending = 0
+        self.launch_errors = []
+        self.closed = False
+        self.lock = threading.Condition()
+
+    def _launch(self):
+        runner = self.factory()
+        with self.lock:
+            self.launched += 1
+        return runner
+
+    def _launch_background(self):
+        try:
+            runner = self._launch()
+        except Exception as e:
+            print("Could not start a browser in the background: {}".format(e))
+            with self.lock:
+                self.pending -= 1
+                self.launch_errors.append(e)
+                self.lock.notify_all()
+            return
+
+        with self.lock:
+            self.pending -= 1
+            closed = self.closed
+            if not closed:
+                self.idle.append(runner)
+            self.lock.notify_all()
+        if closed:
+            # close gave up waiting for this one.
+            self._discard(runner)
+
+    def _discard(self, runner):
+        try:
+            runner.stop()
+        except Exception:
+            # The browser is already gone. Nothing left to clean up.
+            pass
+
+    def warm(self, count=1):
+        '''
+        Starts browsers in background threads so they are ready before the
+        first script asks for one. Returns immediately.
+
+        Parameters
+        ----------
+        count: int
+            Number of browsers to launch concurrently.
+
+        '''
+        with self.lock:
+            if self.closed:
+                return
+            self.pending += int(count)
+
+        for _ in range(int(count)):
+            thread = threading.Thread(target=self._launch_background)
+            thread.daemon = True
+            thread.start()
+
+    def _top_up(self):
+        with self.lock:
+            if self.launch_errors:
+                # Don't keep launching in the background while launches fail.
+                return
+            missing = self.spares - len(self.idle) - self.pending
+        if missing > 0:
+            self.warm(missing)
+
+    def acquire(self):
+        '''
+        Gets a started WebRunner. Idle browsers that are still alive are
+        reused, browsers being launched in the background are waited on and
+        a new one is only launched here when neither is available.
+
+        Returns
+        -------
+        WebRunner
+            A started runner that is ready to run a script.
+
+        Raises
+        ------
+        Exception
+            Why the background launches failed, when they left no browser
+            to hand out. The next call launches one here again.
+
+        '''
+        runner = None
+        while runner is None:
+            with self.lock:
+                while not self.idle and self.pending:
+                    self.lock.wait()
+                if not self.idle:
+                    errors, self.launch_errors = self.launch_errors, []
+                    if errors:
+                        raise errors[0]
+                    break
+                candidate = self.idle.pop()
+
+            if candidate.is_alive():
+                runner = candidate
+            else:
+                self._discard(candidate)
+
+        if runner is None:
+            runner = self._launch()
+
+        self._top_up()
+        return runner
+
+    def release(self, runner, broken=False):
+        '''
+        Hands a runner back to the pool.
+
+        Parameters
+        ----------
+        runner: WebRunner
+            A runner previously returned by acquire.
+        broken: bool
+            Whether or not the caller knows the browser is unusable.
+            Broken browsers, and those that fail to reset, are stopped.
+
+        '''
+        if broken or not runner.is_alive():
+            self._discard(runner)
+            self._top_up()
+            return
+
+        try:
+            runner.reset()
+        except Exception:
+            self._discard(runner)
+            self._top_up()
+            return
+
+        with self.lock:
+            self.idle.append(runner)
+            self.lock.notify_all()
+
+    def close(self, timeout=60):
+        '''
+        Stops every idle browser in the pool. Waits for browsers still being
+        launched in the background so none of them are left running.
+
+        Parameters
+        ----------
+        timeout: float
+            Seconds to wait for the background launches. Browsers that
+            start later are stopped as soon as they have started.
+
+        '''
+        deadline = time.time() + timeout
+        with self.lock:
+            self.closed = True
+            while self.pending and time.time() < deadline:
+                self.lock.wait(deadline - time.time())
+            idle, self.idle = self.idle, []
+
+        for runner in idle:
+            self._discard(runner)
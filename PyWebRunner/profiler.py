@@ -0,0 +1,130 @@
+'''
+Profiles the WebDriver commands a WebRunner sends.
+
+The profiler wraps the remote connection of the browser, so every HTTP
+request to the driver is counted and timed by endpoint and attributed to the
+WebRunner method that issued it (the command being timed by
+PyWebRunner.timing). The report ranks methods by how many round trips each
+call of them costs, which points at the helpers worth batching.
+'''
+from time import time
+
+# Attributed to wire commands sent outside of any WebRunner method.
+UNATTRIBUTED = '(outside WebRunner)'
+
+
+class TransportProfiler(object):
+    """
+    Counts and times the wire commands of a runner.
+
+    Parameters
+    ----------
+    timer: PyWebRunner.timing.CommandTimer
+        Tells which WebRunner command is running.
+    """
+
+    def __init__(self, timer):
+        self.timer = timer
+        self.endpoints = {}
+        self.methods = {}
+        self._invocation = {}
+
+    def install(self, browser):
+        '''
+        Wraps the remote connection of a started browser.
+        Does nothing if it is already wrapped.
+        '''
+        executor = browser.command_executor
+        if getattr(executor, '_pwr_profiler', None) is self:
+            return
+        execute = executor.execute
+        commands = executor._commands
+
+        def profiled_execute(command, params):
+            start = time()
+            try:
+                return execute(command, params)
+            finally:
+                method, path = commands.get(command, ('?', command))
+                self.record('{} {}'.format(method, path), time() - start)
+
+        executor.execute = profiled_execute
+        executor._pwr_profiler = self
+
+    def record(self, endpoint, seconds):
+        '''
+        Records a wire command against the endpoint and the running command.
+        '''
+        stats = self.endpoints.setdefault(endpoint, [0, 0.0])
+        stats[0] += 1
+        stats[1] += seconds
+
+        name = self.timer.current or UNATTRIBUTED
+        method = self.methods.setdefault(
+            name, {'invocations': 0, 'calls': 0, 'seconds': 0.0, 'endpoints': {}})
+        # CommandTimer.count is the number of finished commands, so it
+        # changes between two invocations of the same method.
+        invocation = self.timer.count
+        if name == UNATTRIBUTED or self._invocation.get(name) != invocation:
+            self._invocation[name] = invocation
+            method['invocations'] += 1
+        method['calls'] += 1
+        method['seconds'] += seconds
+        method['endpoints'][endpoint] = method['endpoints'].get(endpoint, 0) + 1
+
+    def drain(self):
+        '''
+        Returns the statistics collected so far (see merge) and forgets them.
+        '''
+        stats = {'endpoints': self.endpoints, 'methods': self.methods}
+        self.endpoints = {}
+        self.methods = {}
+        self._invocation = {}
+        return stats
+
+
+def merge(all_stats):
+    '''
+    Adds up the statistics of several profilers. (Or several drains of one.)
+    '''
+    merged = {'endpoints': {}, 'methods': {}}
+    for stats in all_stats:
+        for endpoint, (count, seconds) in stats['endpoints'].items():
+            total = merged['endpoints'].setdefault(endpoint, [0, 0.0])
+            total[0] += count
+            total[1] += seconds
+        for name, method in stats['methods'].items():
+            total = merged['methods'].setdefault(
+                name, {'invocations': 0, 'calls': 0, 'seconds': 0.0, 'endpoints': {}})
+            total['invocations'] += method['invocations']
+            total['calls'] += method['calls']
+            total['seconds'] += method['seconds']
+            for endpoint, count in method['endpoints'].items():
+                total['endpoints'][endpoint] = total['endpoints'].get(endpoint, 0) + count
+    return merged
+
+
+def format_report(stats, top=20):
+    '''
+    Formats the statistics as two tables: the methods with the most round
+    trips per call (and their most used endpoints) and the busiest endpoints.
+    '''
+    lines = ['{:<32} {:>7} {:>7} {:>10} {:>10}'.format(
+        'method', 'calls', 'trips', 'trips/call', 'wire time')]
+    methods = sorted(stats['methods'].items(),
+                     key=lambda item: -item[1]['calls'] / float(item[1]['invocations']))
+    for name, method in methods[:top]:
+        lines.append('{:<32} {:>7} {:>7} {:>10.1f} {:>9.3f}s'.format(
+            name, method['invocations'], method['calls'],
+            method['calls'] / float(method['invocations']), method['seconds']))
+        endpoints = sorted(method['endpoints'].items(), key=lambda item: -item[1])
+        for endpoint, count in endpoints[:3]:
+            lines.append('    {:<60} {:>7}'.format(endpoint, count))
+
+    lines.append('')
+    lines.append('{:<64} {:>7} {:>10} {:>10}'.format('endpoint', 'calls', 'mean', 'total'))
+    endpoints = sorted(stats['endpoints'].items(), key=lambda item: -item[1][1])
+    for endpoint, (count, seconds) in endpoints[:top]:
+        lines.append('{:<64} {:>7} {:>8.1f}ms {:>9.3f}s'.format(
+            endpoint, count, seconds / count * 1000, seconds))
+    return '\n'.join(lines)
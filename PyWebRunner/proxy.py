@@ -0,0 +1,538 @@
+'''
+A local HTTP proxy for the browsers WebRunner starts.
+
+The proxy answers requests that match the block rules with an empty
+response instead of fetching them, so analytics, fonts, images... that no
+assertion looks at cost neither bytes nor time. Everything else is passed
+through, and static assets can be served from a disk cache (see
+ResponseCache) that several browsers share. HTTPS requests are tunnelled
+(CONNECT), so only their host can be matched against the rules and they are
+never cached.
+
+Rules are strings. The names of resource types (see TYPES) match by file
+extension and Accept header, plain host names match the host and its
+subdomains and anything else is a glob matched against the whole URL:
+
+    Proxy(block=['image', 'font', 'google-analytics.com', '*/ads/*']).start()
+'''
+import fnmatch
+import hashlib
+import json
+import os
+import select
+import socket
+import threading
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    import httplib
+    import urlparse as parse
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    import http.client as httplib
+    from urllib import parse
+
+from PyWebRunner.utils import get_cache_dir
+
+# Resource types: (file extensions, Accept header prefixes)
+TYPES = {
+    'image': (('.png', '.jpg', '.jpeg', '.gif', '.webp', '.svg', '.ico', '.bmp', '.avif'), ('image/',)),
+    'font': (('.woff', '.woff2', '.ttf', '.otf', '.eot'), ('font/', 'application/font')),
+    'media': (('.mp4', '.webm', '.ogv', '.mp3', '.ogg', '.wav', '.m4a'), ('video/', 'audio/')),
+    'stylesheet': (('.css',), ('text/css',)),
+    'script': (('.js',), ()),
+}
+
+# Not passed on by a proxy. (RFC 7230 section 6.1)
+HOP_BY_HOP = ('connection', 'keep-alive', 'proxy-authenticate', 'proxy-authorization',
+              'proxy-connection', 'te', 'trailer', 'transfer-encoding', 'upgrade')
+
+# Seconds to wait on the servers the proxy talks to.
+UPSTREAM_TIMEOUT = 60
+
+# Requests that are sent again when a kept-alive connection fails before
+# their answer arrives. The server may already have acted on any other one.
+IDEMPOTENT = ('GET', 'HEAD', 'OPTIONS', 'DELETE')
+
+
+class BlockRules(object):
+    """
+    Decides which requests the proxy blocks.
+
+    Parameters
+    ----------
+    rules: list of str
+        Resource types, host names or URL globs.
+    """
+
+    def __init__(self, rules=()):
+        self.types = set()
+        self.hosts = []
+        self.globs = []
+        self.add(rules)
+
+    def add(self, rules):
+        '''
+        Adds more rules.
+        '''
+        for rule in rules:
+            if rule in TYPES:
+                self.types.add(rule)
+            elif any(c in rule for c in '*?[/:'):
+                self.globs.append(rule)
+            else:
+                self.hosts.append(rule.lower())
+
+    def __bool__(self):
+        return bool(self.types or self.hosts or self.globs)
+
+    __nonzero__ = __bool__
+
+    def blocks(self, url, accept=''):
+        '''
+        True if the request for url should be blocked.
+
+        Parameters
+        ----------
+        url: str
+            The absolute URL. (Only scheme and host for tunnelled requests.)
+        accept: str
+            The Accept header of the request.
+
+        '''
+        parsed = parse.urlparse(url)
+        host = (parsed.hostname or '').lower()
+        for blocked in self.hosts:
+            if host == blocked or host.endswith('.' + blocked):
+                return True
+        for glob in self.globs:
+            if fnmatch.fnmatchcase(url, glob):
+                return True
+        path = parsed.path.lower()
+        accept = (accept or '').lower()
+        for name in self.types:
+            extensions, accepts = TYPES[name]
+            if path.endswith(extensions) or (accept and accept.startswith(accepts)):
+                return True
+        return False
+
+
+# Cache modes. (See ResponseCache)
+RECORD = 'record'
+REPLAY = 'replay'
+PASS_THROUGH = 'pass-through'
+MODES = (RECORD, REPLAY, PASS_THROUGH)
+
+# Responses the cache keeps: static assets, never pages or API answers.
+STATIC_TYPES = ('image/', 'font/', 'video/', 'audio/', 'text/css', 'text/javascript',
+                'application/javascript', 'application/x-javascript', 'application/font',
+                'application/x-font', 'application/wasm')
+
+
+class ResponseCache(object):
+    """
+    A disk cache of the static assets fetched through the proxy.
+
+    Bodies are stored once per content (objects/<sha256 of the body>) and
+    an append-only index (index.jsonl) maps every URL to its status, headers
+    and body, so the cache survives runs and is shared by every process that
+    points at the same directory. Only 200 responses to GET requests for
+    static types that may be stored (no Set-Cookie, no private or no-store)
+    are kept.
+
+    Parameters
+    ----------
+    path: str
+        The cache directory. Defaults to <WR_CACHE_DIR>/responses
+    mode: str
+        'replay' serves cached responses and fetches (and stores) the others.
+        'record' fetches everything and stores it again, for refreshing the
+        cache after a deploy. 'pass-through' neither reads nor writes.
+    """
+
+    def __init__(self, path=None, mode=REPLAY):
+        if mode not in MODES:
+            raise ValueError('Unknown cache mode: {}. Use one of: {}'.format(mode, ', '.join(MODES)))
+        self.path = path or get_cache_dir('responses')
+        self.mode = mode
+        self.index = {}
+        self._lock = threading.Lock()
+        try:
+            os.makedirs(os.path.join(self.path, 'objects'))
+        except OSError:
+            pass
+        self._load()
+
+    @property
+    def _index_path(self):
+        return os.path.join(self.path, 'index.jsonl')
+
+    def _object_path(self, digest):
+        return os.path.join(self.path, 'objects', digest)
+
+    def _load(self):
+        try:
+            with open(self._index_path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # A line cut short by a crash.
+                        continue
+                    self.index[entry['url']] = entry
+        except (IOError, OSError):
+            pass
+
+    @staticmethod
+    def cacheable(status, headers):
+        '''
+        True if a response with this status and these headers may be stored.
+        '''
+        if status != 200:
+            return False
+        headers = dict((name.lower(), value) for name, value in headers)
+        cache_control = headers.get('cache-control', '').lower()
+        if 'set-cookie' in headers or 'no-store' in cache_control or 'private' in cache_control:
+            return False
+        return headers.get('content-type', '').lower().startswith(STATIC_TYPES)
+
+    def get(self, url):
+        '''
+        The cached (status, headers, body) of url, or None.
+        '''
+        entry = self.index.get(url)
+        if entry is None:
+            return None
+        try:
+            with open(self._object_path(entry['body']), 'rb') as f:
+                body = f.read()
+        except (IOError, OSError):
+            return None
+        return entry['status'], [tuple(header) for header in entry['headers']], body
+
+    def put(self, url, status, headers, body):
+        '''
+        Stores a response if it is cacheable. Returns True if it was stored.
+        '''
+        if not self.cacheable(status, headers):
+            return False
+        digest = hashlib.sha256(body).hexdigest()
+        path = self._object_path(digest)
+        entry = {'url': url, 'status': status, 'headers': list(headers), 'body': digest}
+        try:
+            if not os.path.exists(path):
+                tmp_path = '{}.{}.{}.tmp'.format(path, os.getpid(), threading.current_thread().ident)
+                with open(tmp_path, 'wb') as f:
+                    f.write(body)
+                # Atomic, so a reader never gets half a body.
+                os.rename(tmp_path, path)
+            with self._lock:
+                with open(self._index_path, 'a') as f:
+                    f.write(json.dumps(entry, sort_keys=True) + '\n')
+                self.index[url] = entry
+        except (IOError, OSError):
+            return False
+        return True
+
+
+class ProxyHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        # Connections to the servers, reused while the browser keeps this one open.
+        self.upstream = {}
+
+    def finish(self):
+        BaseHTTPRequestHandler.finish(self)
+        for conn in self.upstream.values():
+            conn.close()
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status, headers=(), body=b''):
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, value)
+        if self.command != 'HEAD' and status not in (204, 304):
+            self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if body and self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def do_CONNECT(self):
+        proxy = self.server.proxy
+        host, _, port = self.path.rpartition(':')
+        proxy.count('requests')
+        if proxy.rules.blocks('https://{}/'.format(host)):
+            proxy.count('blocked')
+            self._reply(403)
+            return
+        try:
+            upstream = self._open_tunnel(host, int(port))
+        except (httplib.HTTPException, socket.error, ValueError):
+            self._reply(502)
+            return
+        self.send_response(200, 'Connection established')
+        self.end_headers()
+        self.close_connection = True
+        try:
+            self._tunnel(upstream)
+        finally:
+            upstream.close()
+
+    def _open_tunnel(self, host, port):
+        '''
+        A connection to host:port, through the upstream proxy if there is one.
+        '''
+        upstream_proxy = self.server.proxy.upstream_proxy
+        if not upstream_proxy:
+            return socket.create_connection((host, port), timeout=UPSTREAM_TIMEOUT)
+        proxy_host, _, proxy_port = upstream_proxy.rpartition(':')
+        conn = httplib.HTTPConnection(proxy_host, int(proxy_port), timeout=UPSTREAM_TIMEOUT)
+        conn.set_tunnel(host, port)
+        try:
+            conn.connect()
+        except (httplib.HTTPException, socket.error):
+            conn.close()
+            raise
+        return conn.sock
+
+    def _tunnel(self, upstream):
+        sockets = [self.connection, upstream]
+        while True:
+            readable, _, broken = select.select(sockets, [], sockets, UPSTREAM_TIMEOUT)
+            if broken or not readable:
+                return
+            for sock in readable:
+                data = sock.recv(65536)
+                if not data:
+                    return
+                (upstream if sock is self.connection else self.connection).sendall(data)
+
+    def _forward(self):
+        proxy = self.server.proxy
+        url = self.path
+        if not url.startswith('http://'):
+            self._reply(400)
+            return
+        proxy.count('requests')
+        if proxy.rules.blocks(url, self.headers.get('Accept')):
+            proxy.count('blocked')
+            self._reply(204)
+            return
+
+        cache = proxy.cache
+        if cache is None or cache.mode == PASS_THROUGH or self.command != 'GET':
+            cache = None
+        if cache is not None and cache.mode == REPLAY:
+            cached = cache.get(url)
+            if cached is not None:
+                proxy.count('hits')
+                self._reply(*cached)
+                return
+
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else None
+        try:
+            resp, data = self._fetch(url, body)
+        except (httplib.HTTPException, socket.error):
+            self._reply(502)
+            return
+        headers = [(name, value) for name, value in resp.getheaders()
+                   if name.lower() not in HOP_BY_HOP and name.lower() != 'content-length']
+        if cache is not None:
+            proxy.count('misses')
+            if cache.put(url, resp.status, headers, data):
+                proxy.count('stored')
+        if self.command == 'HEAD' and resp.getheader('Content-Length'):
+            headers.append(('Content-Length', resp.getheader('Content-Length')))
+        self._reply(resp.status, headers, data)
+
+    do_GET = do_POST = do_PUT = do_DELETE = do_HEAD = do_OPTIONS = do_PATCH = _forward
+
+    def _fetch(self, url, body):
+        '''
+        Sends the request to its server (or the upstream proxy) over a
+        kept-alive connection.
+
+        Returns
+        -------
+        (httplib.HTTPResponse, bytes)
+            The response and its whole body.
+
+        '''
+        parsed = parse.urlparse(url)
+        path = parsed.path or '/'
+        if parsed.query:
+            path += '?' + parsed.query
+        # The handler has already answered any Expect: 100-continue itself.
+        headers = dict((name, value) for name, value in self.headers.items()
+                       if name.lower() not in HOP_BY_HOP and name.lower() != 'expect')
+        key = (parsed.hostname, parsed.port or 80)
+        upstream_proxy = self.server.proxy.upstream_proxy
+        if upstream_proxy:
+            # A proxy wants the whole URL.
+            host, _, port = upstream_proxy.rpartition(':')
+            key, path = (host, int(port)), url
+
+        for attempt in (1, 2):
+            conn = self.upstream.get(key)
+            reused = conn is not None
+            if conn is None:
+                conn = self.upstream[key] = httplib.HTTPConnection(*key, timeout=UPSTREAM_TIMEOUT)
+            sent = False
+            try:
+                conn.request(self.command, path, body, headers)
+                sent = True
+                resp = conn.getresponse()
+                data = resp.read()
+            except (httplib.HTTPException, socket.error) as error:
+                conn.close()
+                del self.upstream[key]
+                # The server closed the kept-alive connection. Retry once on a new one,
+                # unless the server may already have acted on the request.
+                stale = reused and attempt == 1 and not isinstance(error, socket.timeout)
+                if stale and (not sent or self.command in IDEMPOTENT):
+                    continue
+                raise
+            if resp.will_close:
+                conn.close()
+                del self.upstream[key]
+            return resp, data
+
+
+class ProxyServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class Proxy(object):
+    """
+    A blocking (and caching) HTTP proxy running in a background thread.
+
+    Parameters
+    ----------
+    block: list of str
+        Block rules. (See BlockRules)
+    cache: ResponseCache
+        Where static assets are cached, if anywhere.
+    host: str
+        The interface to listen on.
+    port: int
+        The port to listen on. Defaults to any free port.
+    upstream_proxy: str
+        host:port of a proxy to send the requests that aren't blocked on to,
+        for instance the caching proxy every worker of a run shares.
+
+    Attributes
+    ----------
+    rules: BlockRules
+        The block rules in use. Can be changed while the proxy runs.
+    stats: dict
+        'requests' seen and how many of them were 'blocked'. With a cache,
+        also the cache 'hits', 'misses' and how many responses were 'stored'.
+    """
+
+    def __init__(self, block=(), cache=None, host='127.0.0.1', port=0, upstream_proxy=None):
+        self.rules = BlockRules(block)
+        self.cache = cache
+        self.upstream_proxy = upstream_proxy
+        self.host = host
+        self.port = port
+        self.server = None
+        self.stats = {'requests': 0, 'blocked': 0}
+        if cache is not None:
+            self.stats.update({'hits': 0, 'misses': 0, 'stored': 0})
+        self._lock = threading.Lock()
+
+    @property
+    def address(self):
+        '''
+        host:port of the running proxy.
+        '''
+        return '{}:{}'.format(self.host, self.port)
+
+    def start(self):
+        '''
+        Starts serving in a background thread. Returns the proxy.
+        '''
+        self.server = ProxyServer((self.host, self.port), ProxyHandler)
+        self.server.proxy = self
+        self.port = self.server.server_address[1]
+        thread = threading.Thread(target=self.server.serve_forever, kwargs={'poll_interval': 0.1})
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def count(self, key, n=1):
+        with self._lock:
+            self.stats[key] = self.stats.get(key, 0) + n
+
+    def drain(self):
+        '''
+        Returns the statistics collected so far and starts counting from zero.
+        '''
+        with self._lock:
+            stats = self.stats
+            self.stats = dict((key, 0) for key in stats)
+        return stats
+
+
+def format_stats(stats):
+    '''
+    A line (two with a cache) summing up proxy statistics.
+    '''
+    lines = ['Proxy: {} requests, {} blocked.'.format(stats.get('requests', 0), stats.get('blocked', 0))]
+    if 'hits' in stats:
+        looked_up = stats['hits'] + stats['misses']
+        ratio = stats['hits'] * 100.0 / looked_up if looked_up else 0.0
+        lines.append('Cache: {} hits, {} misses ({:.1f}% hit ratio), {} responses stored.'.format(
+            stats['hits'], stats['misses'], ratio, stats['stored']))
+    return '\n'.join(lines)
+
+
+def chrome_arguments(address, rules):
+    '''
+    Chrome arguments that send its requests through the proxy at address.
+    Images are also turned off in the renderer when rules block them.
+    '''
+    arguments = ['--proxy-server=http://{}'.format(address)]
+    if 'image' in rules.types:
+        arguments.append('--blink-settings=imagesEnabled=false')
+    return arguments
+
+
+def firefox_preferences(address, rules):
+    '''
+    Firefox preferences that send its requests through the proxy at address.
+    Images and downloadable fonts are also turned off when rules block them.
+    '''
+    host, _, port = address.rpartition(':')
+    preferences = {
+        'network.proxy.type': 1,
+        'network.proxy.http': host,
+        'network.proxy.http_port': int(port),
+        'network.proxy.ssl': host,
+        'network.proxy.ssl_port': int(port),
+    }
+    if 'image' in rules.types:
+        preferences['permissions.default.image'] = 2
+    if 'font' in rules.types:
+        preferences['gfx.downloadable_fonts.enabled'] = False
+    return preferences
+
+
+def capabilities(address):
+    '''
+    The WebDriver proxy capability for the proxy at address.
+    '''
+    return {'proxyType': 'MANUAL', 'httpProxy': address, 'sslProxy': address}
@@ -2,66 +2,285 @@
 # -*- coding: utf-8 -*-
 import argparse
 
-from json import loads
 from multiprocessing import Pool
+from multiprocessing.util import Finalize
+from time import time
 from PyWebRunner import WebTester
-from yaml import load
+from PyWebRunner.pool import SessionPool
+from PyWebRunner.timing import format_summary, write_log
+from PyWebRunner.profiler import format_report, merge
+from PyWebRunner.proxy import MODES, Proxy, ResponseCache, format_stats
+from PyWebRunner.schedule import DEFAULT_HISTORY_FILE, TimingHistory, longest_first, shard
 
 ARGS = {}
 
+# One SessionPool per worker process. Created on first use.
+SESSIONS = None
+# host:port of the proxy every worker's browser goes through (see start_proxy).
+PROXY_ADDRESS = None
+
+
+def new_tester():
+    driver = ARGS.browser or 'Chrome'
+    timeout = ARGS.timeout or 30
+    default_offset = ARGS.default_offset or 0
+
+    return WebTester(driver=driver, base_url=ARGS.base_url,
+                     timeout=int(timeout), default_offset=default_offset,
+                     fast_click=ARGS.fast_click,
+                     fast_fill=ARGS.fast_fill,
+                     time_commands=bool(ARGS.time_commands or ARGS.step_log),
+                     profile=ARGS.profile,
+                     wait_backend=ARGS.wait_backend,
+                     poll=ARGS.poll,
+                     launch_profile=ARGS.launch_profile,
+                     block=ARGS.block.split(',') if ARGS.block is not None else None,
+                     proxy_address=PROXY_ADDRESS)
+
+
+def start_tester():
+    wt = new_tester()
+    wt.start()
+    if ARGS.focus:
+        wt.focus_browser()
+    return wt
+
+
+def get_sessions():
+    global SESSIONS
+
+    if SESSIONS is None:
+        SESSIONS = SessionPool(start_tester, spares=int(ARGS.spares or 0))
+        # Stop the pooled browsers when this worker process exits.
+        Finalize(SESSIONS, SESSIONS.close, exitpriority=10)
+    return SESSIONS
+
+
+def warm_sessions():
+    '''
+    Pool initializer. Starts this worker's browser (and any spares) in the
+    background while the first script is being dispatched.
+    '''
+    if not ARGS.no_reuse:
+        sessions = get_sessions()
+        sessions.warm(1 + sessions.spares)
+
 
 def run_test(filepath):
+    '''
+    Runs one script file.
+
+    Returns
+    -------
+    (str, float, list of dict, dict, dict)
+        The file path, how long (in seconds) it took to run, the command
+        timings (see PyWebRunner.timing), the wire command statistics
+        (see PyWebRunner.profiler) and the proxy statistics (see
+        PyWebRunner.proxy) if they were asked for.
+    '''
+    start = time()
+    if ARGS.no_reuse:
+        wt = run_test_fresh(filepath)
+    else:
+        wt = run_test_pooled(filepath)
+
+    records = []
+    profile = None
+    if wt is not None and wt.timer is not None:
+        records = wt.timer.drain()
+    if wt is not None and wt.profiler is not None:
+        profile = wt.profiler.drain()
+    proxy_stats = None
+    if wt is not None and wt.proxy is not None:
+        proxy_stats = wt.proxy.drain()
+    return filepath, time() - start, records, profile, proxy_stats
+
+
+def run_test_pooled(filepath):
+    errors = ARGS.errors or False
+    sessions = get_sessions()
     try:
-        errors = ARGS.errors or False
-        driver = ARGS.browser or 'Chrome'
-        timeout = ARGS.timeout or 30
-        default_offset = ARGS.default_offset or 0
+        wt = sessions.acquire()
+    except Exception as e:
+        print("Error starting the browser for {}".format(filepath))
+        print(e)
+        return
+
+    try:
+        print("Processing {}:".format(filepath))
+        # Always raise so the script stops at the first failing command, but
+        # keep the browser running so the pool can reset and reuse it.
+        wt.command_script(filepath=filepath, errors=True, verbose=ARGS.verbose,
+                          stop_on_error=False)
+    except Exception as e:
+        print("Error running {}".format(filepath))
+        if errors:
+            print(e)
+    finally:
+        sessions.release(wt)
+    return wt
 
-        wt = WebTester(driver=driver, base_url=ARGS.base_url,
-                       timeout=int(timeout), default_offset=default_offset)
-        wt.start()
-        if ARGS.focus:
-            wt.focus_browser()
+
+def run_test_fresh(filepath):
+    wt = None
+    try:
+        errors = ARGS.errors or False
+        wt = start_tester()
 
         print("Processing {}:".format(filepath))
-        with open(filepath, 'r') as f:
-            if filepath.lower().endswith('yaml') or filepath.lower().endswith('yml'):
-                script = load(f)
-            elif filepath.lower().endswith('json'):
-                script = loads(f.read())
-            else:
-                print("Couldn't detect filetype from extension. Defaulting to YAML.")
-                script = load(f)
-            wt.command_script(script=script, errors=errors, verbose=ARGS.verbose)
+        wt.command_script(filepath=filepath, errors=errors, verbose=ARGS.verbose)
         wt.stop()
-    except StandardError as e:
+    except Exception as e:
         print("Error running {}".format(filepath))
         print(e)
+    return wt
+
+
+def start_proxy():
+    '''
+    Starts the proxy that caches (--cache) requests for the browsers of every
+    worker, in a thread of the main process.
+
+    Worker processes block (--block) with a proxy per browser, so scripts can
+    change their own rules (see WebRunner.block_resources), and send the rest
+    on to this one. Async sessions have no proxy of their own, so this one
+    blocks for them.
+    '''
+    global PROXY_ADDRESS
+
+    cache = None
+    if ARGS.cache:
+        cache = ResponseCache(ARGS.cache_dir, mode=ARGS.cache)
+    block = []
+    if ARGS.async_sessions:
+        block = [rule for rule in (ARGS.block or '').split(',') if rule]
+    proxy = Proxy(block=block, cache=cache).start()
+    PROXY_ADDRESS = proxy.address
+    return proxy
+
+
+def parse_shard(value):
+    '''
+    Parses the "i/n" value of --shard into (i, n).
+    '''
+    try:
+        index, count = [int(part) for part in value.split('/')]
+    except ValueError:
+        raise argparse.ArgumentTypeError('Expected i/n, for example 1/4. Got: {}'.format(value))
+    if count < 1 or not 1 <= index <= count:
+        raise argparse.ArgumentTypeError('Shard {} is out of range. Use 1/n through n/n.'.format(value))
+    return index, count
 
 
 def main():
     global ARGS
 
     parser = argparse.ArgumentParser(description='Run a PyWebRunner YAML/JSON script.')
-    parser.add_argument('-b', '--browser', help='Which browser to load. Defaults to Chrome.')
+    parser.add_argument('-b', '--browser', help='Which browser to load: chrome, chrome-headless, gecko, gecko-headless, firefox... Defaults to Chrome.')
     parser.add_argument('--base-url', help='Base URL to use with goto command.')
     parser.add_argument('-t', '--timeout', help='Global wait timeout (in seconds). Defaults to 30.')
     parser.add_argument('-p', '--processes', help='Number of processes (browsers) to use. Defaults to 1')
     parser.add_argument('-do', '--default-offset', help='New default offset for scroll_to_element. (Default is 0)')
     parser.add_argument('--errors', dest='errors', action='store_true', help='Show errors.')
+    parser.add_argument('--fast-fill', dest='fast_fill', action='store_true', help='Set the fields of fill, fill_form and set_values with a single script.')
+    parser.add_argument('--fast-click', dest='fast_click', action='store_true', help='Wait for clicks with a single in-browser readiness check.')
+    parser.add_argument('--wait-backend', default='poll', choices=['poll', 'browser'], help='"browser" runs wait_for_* conditions inside the page and returns as soon as they hold. Defaults to poll.')
+    parser.add_argument('--poll', default='fixed', help='How often waits check their condition: "fixed" (every half second), "backoff" (10ms, 20ms, 40ms... up to half a second) or a number of seconds. Defaults to fixed.')
+    parser.add_argument('--launch-profile', default='default', choices=['default', 'lean'], help='"lean" launches the browser without background networking, updates, sync, telemetry, the GPU... Defaults to default.')
+    parser.add_argument('--block', help='Comma separated resource types (image, font, media, stylesheet, script), hosts and URL globs the browsers should not load, e.g. image,font,google-analytics.com')
+    parser.add_argument('--cache', choices=MODES, help='Send the browsers through a proxy that caches static assets on disk. "replay" serves what is cached and stores the rest, "record" fetches and stores everything again, "pass-through" only proxies.')
+    parser.add_argument('--cache-dir', help='Directory of the --cache. Defaults to WR_CACHE_DIR/responses (~/.cache/pywebrunner/responses).')
     parser.add_argument('--focus', dest='focus', action='store_true', help='Focus the browser on launch.')
+    parser.add_argument('--no-reuse', dest='no_reuse', action='store_true', help='Launch a new browser for every script instead of reusing one per process.')
+    parser.add_argument('--async-sessions', help='Run N browser sessions concurrently from a single process with the asyncio engine (Python 3.5+) instead of using --processes.')
+    parser.add_argument('--spares', help='Number of spare, already started browsers each process keeps ready to replace a broken one. Defaults to 0')
+    parser.add_argument('--shard', type=parse_shard, help='Only run shard i of n (e.g. 2/4). Scripts are split by a hash of their path unless --shard-timings is given.')
+    parser.add_argument('--shard-timings', help='Timings file to balance the --shard split on. Every machine must read an identical copy (e.g. one saved by a previous full run), or scripts are skipped or run twice.')
+    parser.add_argument('--timings', default=DEFAULT_HISTORY_FILE, help='File where script durations are kept to run the longest scripts first. Defaults to {}'.format(DEFAULT_HISTORY_FILE))
+    parser.add_argument('--time-commands', dest='time_commands', action='store_true', help='Print the p50/p95/max time, round trips and wait polls of every command when the run ends.')
+    parser.add_argument('--step-log', help='Append the timing of every command to this JSON-lines file. (Implies --time-commands)')
+    parser.add_argument('--profile', dest='profile', action='store_true', help='Count and time every WebDriver request by endpoint and by the command that sent it, and print the commands with the most requests per call.')
     parser.add_argument('-v', '--verbose', dest='verbose', action='store_true', help='Verbose output of commands being executed.')
     parser.add_argument('files', nargs='*')
     ARGS = parser.parse_args()
 
+    history = TimingHistory(ARGS.timings)
+    files = ARGS.files
+    if ARGS.shard:
+        index, count = ARGS.shard
+        shard_history = TimingHistory(ARGS.shard_timings) if ARGS.shard_timings else None
+        files = shard(files, index, count, shard_history)
+        print("Running shard {}/{}: {} of {} scripts.".format(index, count, len(files), len(ARGS.files)))
+    files = longest_first(files, history)
+
+    # One proxy for every worker, so they share the cache.
+    proxy = None
+    if ARGS.cache or (ARGS.block is not None and ARGS.async_sessions):
+        proxy = start_proxy()
+    # The workers' own proxies already counted every request (see start_proxy).
+    own_proxies = ARGS.block is not None and not ARGS.async_sessions
+
+    records = []
+    profiles = []
+    proxy_stats = {}
+    try:
+        if ARGS.async_sessions:
+            run_async(files, history)
+        else:
+            run_processes(files, history, records, profiles, proxy_stats)
+    finally:
+        if proxy is not None:
+            for key, count in proxy.drain().items():
+                if own_proxies and key in ('requests', 'blocked'):
+                    continue
+                proxy_stats[key] = proxy_stats.get(key, 0) + count
+            proxy.stop()
+
+    if records and (ARGS.time_commands or ARGS.step_log):
+        print(format_summary(records))
+        if ARGS.step_log:
+            write_log(records, ARGS.step_log)
+    if profiles:
+        print(format_report(merge(profiles)))
+    if proxy_stats:
+        print(format_stats(proxy_stats))
+
+    try:
+        history.save()
+    except (IOError, OSError) as e:
+        print("Could not save script timings to {}: {}".format(ARGS.timings, e))
+
+
+def run_processes(files, history, records, profiles, proxy_stats):
     processes = ARGS.processes or 1
-    pool = Pool(int(processes))
+    pool = Pool(int(processes), initializer=warm_sessions)
 
-    pool.map(run_test, ARGS.files)
+    # Hand out one script at a time so no browser sits idle while
+    # another one still has a queue of scripts waiting.
+    for filepath, seconds, script_records, profile, stats in pool.imap_unordered(run_test, files, chunksize=1):
+        history.record(filepath, seconds)
+        records.extend(script_records)
+        if profile:
+            profiles.append(profile)
+        for key, count in (stats or {}).items():
+            proxy_stats[key] = proxy_stats.get(key, 0) + count
 
     pool.close()
     pool.join()
 
 
+def run_async(files, history):
+    import asyncio
+    from PyWebRunner.aio import run_scripts
+
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(run_scripts(
+        files, sessions=int(ARGS.async_sessions), errors=ARGS.errors, verbose=ARGS.verbose,
+        on_done=history.record, driver=(ARGS.browser or 'Chrome').lower(),
+        base_url=ARGS.base_url, timeout=int(ARGS.timeout or 30),
+        default_offset=ARGS.default_offset or 0, launch_profile=ARGS.launch_profile,
+        proxy_address=PROXY_ADDRESS))
+
+
 if __name__ == '__main__':
     main()
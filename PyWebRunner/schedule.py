@@ -0,0 +1,147 @@
+'''
+Helpers for deciding which scripts webrunner runs, and in what order.
+
+Per-script durations from earlier runs are kept in a small JSON file so the
+longest scripts can be started first and every browser stays busy until the
+queue drains. Durations can also be used to split a suite into shards that
+take about as long as each other to run on separate machines, as long as
+every machine reads the same durations.
+'''
+import hashlib
+import json
+import os
+
+DEFAULT_HISTORY_FILE = '.webrunner-timings.json'
+
+
+class TimingHistory(object):
+    """
+    Per-script durations (in seconds) recorded by previous runs.
+
+    Parameters
+    ----------
+    path: str
+        The JSON file the durations are read from and saved to.
+    weight: float
+        How much a new measurement counts against the recorded duration.
+        1 keeps only the latest run.
+    """
+
+    def __init__(self, path=DEFAULT_HISTORY_FILE, weight=0.5):
+        self.path = path
+        self.weight = weight
+        self.durations = {}
+        try:
+            with open(path, 'r') as f:
+                self.durations = json.load(f)
+        except (IOError, OSError, ValueError):
+            # No history yet (or it is unreadable). Start from scratch.
+            pass
+
+    @staticmethod
+    def key(filepath):
+        return os.path.normpath(filepath)
+
+    def get(self, filepath, default=None):
+        '''
+        Gets the recorded duration of a script, or default if it has never run.
+        '''
+        return self.durations.get(self.key(filepath), default)
+
+    def record(self, filepath, seconds):
+        '''
+        Records how long a script took.
+        '''
+        key = self.key(filepath)
+        previous = self.durations.get(key)
+        if previous is None:
+            self.durations[key] = seconds
+        else:
+            self.durations[key] = previous + (seconds - previous) * self.weight
+
+    def save(self):
+        '''
+        Writes the durations to the history file.
+        '''
+        tmp_path = '{}.{}.tmp'.format(self.path, os.getpid())
+        with open(tmp_path, 'w') as f:
+            json.dump(self.durations, f, indent=2, sort_keys=True)
+        os.rename(tmp_path, self.path)
+
+
+def longest_first(files, history):
+    '''
+    Orders scripts longest first (LPT scheduling) using their recorded durations.
+
+    Scripts without a recorded duration go first since they could be the
+    longest of all. Otherwise the original order breaks ties.
+
+    Parameters
+    ----------
+    files: list of str
+        The script paths.
+    history: TimingHistory
+        The recorded durations.
+
+    Returns
+    -------
+    list of str
+
+    '''
+    unknown = float('inf')
+    order = dict((f, index) for index, f in enumerate(files))
+    return sorted(files, key=lambda f: (-history.get(f, unknown), order[f]))
+
+
+def _stable_shard(filepath, count):
+    digest = hashlib.md5(TimingHistory.key(filepath).encode('utf-8')).hexdigest()
+    return int(digest, 16) % count
+
+
+def shard(files, index, count, history=None):
+    '''
+    Picks the scripts that belong to one of count shards.
+
+    By default scripts are split by a stable hash of their path, so every
+    machine picks the same split from the same files. With a history the
+    scripts are spread so every shard takes about as long (greedy
+    longest-first packing; scripts without a recorded duration count as the
+    average). Only pass one that every machine reads identically (a shared
+    file, not the timings each machine records for its own shard), or the
+    machines split differently and scripts are skipped or run twice.
+
+    Parameters
+    ----------
+    files: list of str
+        The script paths.
+    index: int
+        Which shard to return. 1 through count.
+    count: int
+        The total number of shards.
+    history: TimingHistory
+        Durations shared by every machine, or None.
+
+    Returns
+    -------
+    list of str
+        The scripts in the shard, in their original order.
+
+    '''
+    known = []
+    if history is not None:
+        known = [history.get(f) for f in files if history.get(f) is not None]
+    if not known:
+        return [f for f in files if _stable_shard(f, count) == index - 1]
+
+    average = sum(known) / float(len(known))
+    # Sort on the path too so the split doesn't depend on the argument order.
+    by_duration = sorted(files, key=lambda f: (-history.get(f, average), TimingHistory.key(f)))
+
+    loads = [0.0] * count
+    assigned = {}
+    for f in by_duration:
+        lightest = loads.index(min(loads))
+        loads[lightest] += history.get(f, average)
+        assigned[f] = lightest
+
+    return [f for f in files if assigned[f] == index - 1]
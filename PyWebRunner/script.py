@@ -0,0 +1,492 @@
+'''
+Compiles YAML/JSON command scripts into plans that WebRunner.command_script
+can run without re-interpreting every command on every run.
+
+A plan is an immutable sequence of Step objects. Each step knows which method it
+calls, how the arguments are passed and which arguments hold (( expressions ))
+that have to be evaluated when the step runs. Plans are cached in memory and
+on disk, keyed by a hash of the script's content.
+
+Includes are resolved when a script is compiled: the included commands are
+copied into the plan in place of the include command. Included files are only
+loaded and compiled once per process.
+'''
+from collections import namedtuple
+
+import hashlib
+import json
+import marshal
+import os
+import pickle
+import re
+import yaml
+
+from PyWebRunner.utils import get_cache_dir
+
+try:
+    # libyaml is many times faster than the pure Python parser.
+    from yaml import CSafeLoader as YamlLoader
+except ImportError:
+    from yaml import SafeLoader as YamlLoader
+
+# Bump whenever Step, Plan or the way scripts are compiled changes.
+PLAN_VERSION = 3
+
+# Grab things wrapped like so: (( something ))
+PRE_PARSE_REGEX = re.compile(r'\(\(([^}]+)\)\)')
+
+# How a step passes its arguments to the method.
+CALL = 'call'            # method(*args)
+CALL_LIST = 'call_list'  # method(args) - the first argument is a list
+CALL_ONE = 'call_one'    # method(arg) - a single, non-list argument
+CALL_NONE = 'call_none'  # method() - a bare command string
+INCLUDE = 'include'      # run the commands from another script file (only before expansion)
+
+Step = namedtuple('Step', ['key', 'kind', 'args', 'plain', 'slots', 'command', 'label', 'dump'])
+Step.__doc__ = '''
+A single compiled command.
+
+key: the method (or special command) name
+kind: one of CALL, CALL_LIST, CALL_ONE, CALL_NONE or INCLUDE
+args: the literal arguments (a tuple for CALL and CALL_LIST)
+plain: True when args holds no lists or dicts, so it can be passed as is.
+       Otherwise a fresh copy is made for every run (see thaw).
+slots: ((index, subindex, expression), ...) arguments to replace with the
+       value of their (( expression )). subindex is None for top level items.
+command: the original command, for error messages
+label: the "Parsing" line printed in verbose mode (or None)
+dump: the "Processing command" text printed in verbose mode (or None)
+'''
+
+
+class Plan(object):
+    """
+    A compiled script: the steps to run, in order.
+
+    Plans are shared by every runner in the process. Runners can remember
+    what they resolved for a plan in a WeakKeyDictionary keyed by the plan
+    (see WebRunner._run_plan), which a tuple couldn't be.
+
+    Parameters
+    ----------
+    steps: iterable of Step
+    """
+
+    def __init__(self, steps):
+        self.steps = tuple(steps)
+
+    def __iter__(self):
+        return iter(self.steps)
+
+    def __len__(self):
+        return len(self.steps)
+
+    def __getitem__(self, index):
+        return self.steps[index]
+
+
+_PLANS = {}
+
+# {realpath: ((mtime, size), plan, deps)} for included files. See _include_plan
+_INCLUDES = {}
+
+
+class IncludeCycleError(ValueError):
+    '''
+    Raised when script files include each other in a loop.
+    '''
+    pass
+
+
+def _expression(item):
+    '''
+    Returns the (( expression )) held in a script argument or None.
+    '''
+    found = PRE_PARSE_REGEX.findall(str(item))
+    if found:
+        return found[0].strip()
+    return None
+
+
+def _freeze(value):
+    if isinstance(value, list):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+def _is_plain(args):
+    if isinstance(args, (list, tuple)):
+        return not any(isinstance(a, (list, tuple, dict)) for a in args)
+    return not isinstance(args, dict)
+
+
+def thaw(value):
+    '''
+    Makes a mutable copy of compiled arguments. (Tuples become lists again.)
+    Methods are free to modify their arguments without changing the plan.
+    '''
+    if isinstance(value, (list, tuple)):
+        return [thaw(v) for v in value]
+    if isinstance(value, dict):
+        return dict((k, thaw(v)) for k, v in value.items())
+    return value
+
+
+def _compile_args(args):
+    slots = []
+    for index, item in enumerate(args):
+        if isinstance(item, list):
+            for subindex, subitem in enumerate(item):
+                expression = _expression(subitem)
+                if expression:
+                    slots.append((index, subindex, expression))
+        elif not isinstance(item, dict):
+            expression = _expression(item)
+            if expression:
+                slots.append((index, None, expression))
+    return tuple(slots)
+
+
+def compile_command(command, label=None):
+    '''
+    Compiles one command from a script into a tuple of steps.
+
+    Parameters
+    ----------
+    command: str or dict
+        A method name or a dict where the key is the method to execute.
+    label: str
+        Printed before the command runs in verbose mode.
+
+    '''
+    if isinstance(command, str):
+        return (Step(command, CALL_NONE, (), True, (), command, None, None),)
+
+    steps = []
+    dump = yaml.dump(command)
+    for key in command:
+        value = command[key]
+        if key == 'include':
+            step = Step(key, INCLUDE, value, True, (), command, label, dump)
+        elif isinstance(value, list):
+            kind = CALL_LIST if value and isinstance(value[0], list) else CALL
+            step = Step(key, kind, _freeze(value), _is_plain(value), _compile_args(value),
+                        command, label, dump)
+        else:
+            step = Step(key, CALL_ONE, _freeze(value), _is_plain(value), (), command, label, dump)
+        steps.append(step)
+        # Only announce a command once, even if it has several keys.
+        label = dump = None
+    return tuple(steps)
+
+
+def compile_script(script, filepath=None):
+    '''
+    Compiles a parsed script (a list of commands) into a plan.
+
+    Parameters
+    ----------
+    script: list
+        The parsed script.
+    filepath: str
+        The file the script was loaded from. Includes that can't be found
+        relative to the current directory are looked up next to it.
+
+    Returns
+    -------
+    Plan
+
+    '''
+    chain = (os.path.realpath(filepath),) if filepath else ()
+    return _compile(script, filepath, chain)[0]
+
+
+def _compile(script, filepath, chain):
+    '''
+    Compiles a script and expands its includes.
+
+    Returns
+    -------
+    (plan, deps)
+        deps is a set of (realpath, mtime, size) for every included file.
+
+    '''
+    digits = len(str(len(script)))
+    steps = []
+    deps = set()
+    for index, command in enumerate(script):
+        label = None
+        if not isinstance(command, str):
+            key = list(command.keys())[0]
+            label = '({}) Parsing: {}: {}'.format(str(index + 1).zfill(digits), key, command[key])
+
+        for step in compile_command(command, label):
+            if step.kind != INCLUDE:
+                steps.append(step)
+                continue
+
+            if step.label:
+                # Keep the "Parsing" line of the include command in verbose output.
+                steps.append(Step(INCLUDE, CALL_NONE, (), True, (), step.command, step.label, None))
+
+            included, included_deps = _include_plan(step.args, filepath, chain)
+            deps.update(included_deps)
+            steps.extend(included)
+    return Plan(steps), deps
+
+
+def _stamp(path):
+    stat = os.stat(path)
+    return (stat.st_mtime, stat.st_size)
+
+
+def _fresh(deps):
+    try:
+        return all(_stamp(path) == (mtime, size) for path, mtime, size in deps)
+    except OSError:
+        return False
+
+
+def _include_plan(path, including, chain):
+    '''
+    Gets the compiled, already expanded steps of an included file.
+    The steps are shared by every script that includes the file.
+    '''
+    if not os.path.exists(path) and including:
+        # Fall back to a path relative to the including file.
+        relative = os.path.join(os.path.dirname(including), path)
+        if os.path.exists(relative):
+            path = relative
+
+    real = os.path.realpath(path)
+    if real in chain:
+        names = [os.path.relpath(p) for p in chain + (real,)]
+        raise IncludeCycleError('Include cycle detected: {}'.format(' -> '.join(names)))
+
+    cached = _INCLUDES.get(real)
+    if cached is not None and _fresh(cached[2]):
+        return cached[1], cached[2]
+
+    stamp = _stamp(path)
+    script = load_file(path)
+    plan, deps = _compile(script, path, chain + (real,))
+    # Included commands are not numbered in verbose output.
+    plan = tuple(step._replace(label=None) for step in plan)
+    deps.add((real,) + stamp)
+    deps = frozenset(deps)
+    _INCLUDES[real] = (stamp, plan, deps)
+    return plan, deps
+
+
+def parse_file(filepath):
+    '''
+    Parses a YAML or JSON script file.
+    '''
+    with open(filepath, 'r') as f:
+        if filepath.lower().endswith('yaml') or filepath.lower().endswith('yml'):
+            script = yaml.load(f, Loader=YamlLoader)
+        elif filepath.lower().endswith('json'):
+            script = json.loads(f.read())
+        else:
+            print("Couldn't detect filetype from extension. Defaulting to YAML.")
+            script = yaml.load(f, Loader=YamlLoader)
+    return script
+
+
+def _parsed_path(filepath):
+    name = hashlib.sha1(os.path.abspath(filepath).encode('utf-8')).hexdigest()
+    return os.path.join(get_cache_dir('parsed'), '{}.bin'.format(name))
+
+
+def load_file(filepath, cache=True):
+    '''
+    Loads a YAML or JSON script file.
+
+    Parsed scripts are cached on disk, keyed by the file's path, modification
+    time and size, so an unchanged file is loaded without parsing it again.
+
+    Parameters
+    ----------
+    filepath: str
+        Path to the script.
+    cache: bool
+        Whether or not to use (and update) the parsed script cache.
+
+    '''
+    if not cache:
+        return parse_file(filepath)
+
+    stat = os.stat(filepath)
+    key = (PLAN_VERSION, os.path.abspath(filepath), stat.st_mtime, stat.st_size)
+    path = _parsed_path(filepath)
+
+    try:
+        with open(path, 'rb') as f:
+            if marshal.load(f) == key:
+                # marshal for plain data, pickle for anything it can't handle (dates...)
+                if marshal.load(f) == 'marshal':
+                    return marshal.load(f)
+                return pickle.load(f)
+    except Exception:
+        # Missing or unreadable cache file. Parse the script instead.
+        pass
+
+    script = parse_file(filepath)
+
+    tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+    try:
+        with open(tmp_path, 'wb') as f:
+            marshal.dump(key, f)
+            try:
+                payload = marshal.dumps(script)
+                marshal.dump('marshal', f)
+                f.write(payload)
+            except ValueError:
+                marshal.dump('pickle', f)
+                pickle.dump(script, f, pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp_path, path)
+    except (IOError, OSError):
+        pass
+
+    return script
+
+
+def _plan_path(digest):
+    return os.path.join(get_cache_dir('plans'), '{}.pickle'.format(digest))
+
+
+def _read_plan(digest):
+    try:
+        with open(_plan_path(digest), 'rb') as f:
+            return pickle.load(f)
+    except Exception:
+        # Missing, unreadable or written by another version: compile again.
+        return None
+
+
+def _write_plan(digest, plan):
+    path = _plan_path(digest)
+    tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+    try:
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(plan, f, pickle.HIGHEST_PROTOCOL)
+        # Atomic, so parallel runners never read half a plan.
+        os.rename(tmp_path, path)
+    except (IOError, OSError):
+        pass
+
+
+def _digest(*parts):
+    sha = hashlib.sha1('pywebrunner-plan-{}'.format(PLAN_VERSION).encode('utf-8'))
+    for part in parts:
+        if not isinstance(part, bytes):
+            part = part.encode('utf-8')
+        sha.update(part)
+    return sha.hexdigest()
+
+
+def _cached(digest, build):
+    '''
+    Gets a plan from memory or disk, building (and storing) it if it isn't
+    cached or one of the files it includes has changed since.
+
+    build: callable
+        Returns (plan, deps). See _compile
+    '''
+    entry = _PLANS.get(digest)
+    if entry is None or not _fresh(entry[1]):
+        entry = _read_plan(digest)
+        if entry is None or not _fresh(entry[1]):
+            plan, deps = build()
+            entry = (plan, frozenset(deps))
+            _write_plan(digest, entry)
+        _PLANS[digest] = entry
+    return entry[0]
+
+
+def get_plan(script):
+    '''
+    Gets the compiled plan for an already parsed script, from the cache
+    if it has been compiled before.
+    '''
+    try:
+        # Not sort_keys: the order of a dict's keys is the order its fields are set in.
+        content = json.dumps(script)
+    except (TypeError, ValueError):
+        # Not JSON serializable so it can't be hashed. Just compile it.
+        return compile_script(script)
+    return _cached(_digest('script', content), lambda: _compile(script, None, ()))
+
+
+def get_file_plan(filepath):
+    '''
+    Gets the compiled plan for a script file. The file is only parsed when
+    no plan for its content has been cached yet.
+    '''
+    with open(filepath, 'rb') as f:
+        content = f.read()
+    ext = os.path.splitext(filepath)[1].lower()
+    real = os.path.realpath(filepath)
+
+    def build():
+        return _compile(load_file(filepath), filepath, (real,))
+
+    # The path is part of the key because includes are resolved relative to it.
+    return _cached(_digest('file', ext, real, content), build)
+
+
+def call(step, method, parse_item):
+    '''
+    Calls the method of a step with its arguments, filling in the value of
+    each (( expression )) first.
+
+    Parameters
+    ----------
+    step: Step
+        The compiled command.
+    method: callable
+        The method the step runs. (See bind)
+    parse_item: callable
+        Evaluates an expression. (WebRunner._parse_item)
+
+    Returns
+    -------
+    Whatever the method returns.
+
+    '''
+    kind = step.kind
+    if kind == CALL_NONE:
+        return method()
+    if kind == CALL_ONE:
+        return method(step.args if step.plain else thaw(step.args))
+
+    args = list(step.args) if step.plain else thaw(step.args)
+    for index, subindex, expression in step.slots:
+        if subindex is None:
+            args[index] = parse_item(expression)
+        else:
+            args[index][subindex] = parse_item(expression)
+
+    if kind == CALL_LIST:
+        return method(args)
+    return method(*args)
+
+
+def bind(plan, runner):
+    '''
+    Resolves the method each step calls on the given runner.
+
+    Returns
+    -------
+    list of (Step, callable or None)
+        None for steps that are not methods of the runner.
+        (include, import, value_of, text_of or unknown commands.)
+
+    '''
+    bound = []
+    for step in plan:
+        method = None
+        if step.key != INCLUDE and hasattr(runner, step.key):
+            method = getattr(runner, step.key)
+        bound.append((step, method))
+    return bound
@@ -0,0 +1,210 @@
+'''
+Per-command timing for WebRunner.
+
+When timing is on (the time_commands option), every public WebRunner method
+is wrapped so that each call (from Python or from a command script) records:
+
+- its wall time,
+- how many WebDriver round trips it made,
+- how many times its waits polled their condition.
+
+Calls made by another timed method (click calling wait_for_presence...) count
+towards the outer call, so every record is one command as the caller sees it.
+The records can be summarized per verb (see format_summary) or written out as
+a JSON-lines step log (see write_log).
+'''
+import json
+import math
+
+from functools import wraps
+from time import time
+from types import FunctionType
+
+# Public methods that are not timed. command_script is timed per command instead.
+UNTIMED = ('command_script', 'help')
+
+
+class CommandTimer(object):
+    """
+    Collects a record for every timed WebRunner command.
+
+    Attributes
+    ----------
+    records: list of dict
+        One dict per command: script, index, verb, start, seconds,
+        round_trips, polls and ok.
+    script: str
+        The script file being run, if any. Added to every record.
+    stack: list of str
+        The timed methods currently running. The first one is the command
+        that is being recorded.
+    """
+
+    def __init__(self):
+        self.records = []
+        self.script = None
+        self.stack = []
+        self.round_trips = 0
+        self.polls = 0
+        self.count = 0
+
+    @property
+    def current(self):
+        '''
+        The command being recorded, or None.
+        '''
+        return self.stack[0] if self.stack else None
+
+    def measure(self, verb, method, *args, **kwargs):
+        '''
+        Calls method, recording it as verb unless another command is already
+        being recorded.
+        '''
+        if self.stack:
+            self.stack.append(verb)
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self.stack.pop()
+
+        self.stack.append(verb)
+        round_trips = self.round_trips
+        polls = self.polls
+        ok = False
+        start = time()
+        try:
+            result = method(*args, **kwargs)
+            ok = True
+            return result
+        finally:
+            self.stack.pop()
+            self.count += 1
+            self.records.append({
+                'script': self.script,
+                'index': self.count,
+                'verb': verb,
+                'start': start,
+                'seconds': time() - start,
+                'round_trips': self.round_trips - round_trips,
+                'polls': self.polls - polls,
+                'ok': ok,
+            })
+
+    def watch(self, browser):
+        '''
+        Counts the WebDriver commands sent through browser.
+        Does nothing if browser is already being watched.
+        '''
+        if browser is None or getattr(browser, '_pwr_timer', None) is self:
+            return
+        execute = browser.execute
+
+        def counted_execute(driver_command, params=None):
+            self.round_trips += 1
+            return execute(driver_command, params)
+
+        browser.execute = counted_execute
+        browser._pwr_timer = self
+
+    def drain(self):
+        '''
+        Returns the records collected so far and forgets them.
+        '''
+        records, self.records = self.records, []
+        return records
+
+
+def instrument(runner, timer):
+    '''
+    Wraps the public methods of a runner so calls to them are timed.
+
+    Parameters
+    ----------
+    runner: WebRunner
+        The instance to time. Its class is left alone.
+    timer: CommandTimer
+        Where the records go.
+
+    '''
+    seen = set()
+    for klass in type(runner).__mro__:
+        for name, value in vars(klass).items():
+            if name in seen or name.startswith('_') or name in UNTIMED:
+                continue
+            seen.add(name)
+            if isinstance(value, FunctionType):
+                setattr(runner, name, _timed(runner, timer, name, getattr(runner, name)))
+
+
+def _timed(runner, timer, verb, method):
+    @wraps(method)
+    def timed(*args, **kwargs):
+        timer.watch(runner.browser)
+        return timer.measure(verb, method, *args, **kwargs)
+    return timed
+
+
+def percentile(values, percent):
+    '''
+    Nearest-rank percentile of a list of numbers.
+    '''
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    rank = int(math.ceil(percent / 100.0 * len(ordered)))
+    return ordered[max(rank - 1, 0)]
+
+
+def summarize(records):
+    '''
+    Aggregates records per verb.
+
+    Returns
+    -------
+    list of dict
+        verb, count, total, p50, p95, max, round_trips and polls (averages
+        per call) for every verb. Slowest (by total time) first.
+
+    '''
+    by_verb = {}
+    for record in records:
+        by_verb.setdefault(record['verb'], []).append(record)
+
+    rows = []
+    for verb, calls in by_verb.items():
+        seconds = [call['seconds'] for call in calls]
+        rows.append({
+            'verb': verb,
+            'count': len(calls),
+            'total': sum(seconds),
+            'p50': percentile(seconds, 50),
+            'p95': percentile(seconds, 95),
+            'max': max(seconds),
+            'round_trips': sum(call['round_trips'] for call in calls) / float(len(calls)),
+            'polls': sum(call['polls'] for call in calls) / float(len(calls)),
+        })
+    rows.sort(key=lambda row: -row['total'])
+    return rows
+
+
+def format_summary(records):
+    '''
+    A table of the per-verb timings of records. (See summarize)
+    '''
+    lines = ['{:<32} {:>6} {:>9} {:>9} {:>9} {:>10} {:>7} {:>7}'.format(
+        'command', 'calls', 'p50', 'p95', 'max', 'total', 'trips', 'polls')]
+    for row in summarize(records):
+        lines.append('{:<32} {:>6} {:>8.3f}s {:>8.3f}s {:>8.3f}s {:>9.3f}s {:>7.1f} {:>7.1f}'.format(
+            row['verb'], row['count'], row['p50'], row['p95'], row['max'], row['total'],
+            row['round_trips'], row['polls']))
+    return '\n'.join(lines)
+
+
+def write_log(records, path):
+    '''
+    Appends records to a JSON-lines file, one command per line.
+    '''
+    with open(path, 'a') as f:
+        for record in records:
+            f.write(json.dumps(record, sort_keys=True))
+            f.write('\n')
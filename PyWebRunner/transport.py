@@ -0,0 +1,200 @@
+'''
+A pooled, keep-alive HTTP transport for talking to the WebDriver server.
+
+Selenium's RemoteConnection either opens a new connection for every command
+(the default for remote drivers), which leaves a socket in TIME_WAIT each
+time, or shares a single keep-alive connection that is not thread safe and
+fails the command if the server has dropped it. PooledRemoteConnection keeps
+a small pool of open connections instead, hands one to each request and
+reconnects transparently when an idle connection has been closed.
+'''
+import select
+import socket
+import threading
+
+from selenium.webdriver.remote import utils
+from selenium.webdriver.remote.errorhandler import ErrorCode
+from selenium.webdriver.remote.remote_connection import LOGGER, RemoteConnection
+
+try:
+    import http.client as httplib
+    from urllib import parse
+except ImportError:
+    import httplib
+    import urlparse as parse
+
+# Requests that are sent again when a reused connection fails before their
+# answer arrives. The driver may already have run any other command.
+IDEMPOTENT = ('GET', 'HEAD', 'OPTIONS', 'DELETE')
+
+
+class PooledRemoteConnection(RemoteConnection):
+    """
+    A RemoteConnection that reuses a pool of keep-alive connections.
+
+    Parameters
+    ----------
+    remote_server_addr: str
+        The address of the WebDriver server.
+    resolve_ip: bool
+        Whether or not to resolve the host name once up front.
+    max_idle: int
+        Maximum number of open connections kept for reuse. More connections
+        are opened when more requests run at once, but only this many stay
+        open afterwards.
+    """
+
+    def __init__(self, remote_server_addr, resolve_ip=True, max_idle=4):
+        RemoteConnection.__init__(self, remote_server_addr, keep_alive=False, resolve_ip=resolve_ip)
+        self.keep_alive = True
+        self.max_idle = int(max_idle)
+        # Number of connections opened so far. (Each one costs a TCP handshake.)
+        self.opened = 0
+        self._idle = []
+        self._lock = threading.Lock()
+
+        parsed_url = parse.urlparse(self._url)
+        self._scheme = parsed_url.scheme
+        self._host = parsed_url.hostname
+        self._port = parsed_url.port
+
+    @classmethod
+    def replace(cls, executor, max_idle=4):
+        '''
+        Builds a pooled connection to the same server as an existing
+        RemoteConnection, keeping its command table (drivers add their own
+        commands to it) and closing its keep-alive connection if it has one.
+        '''
+        pooled = cls(executor._url, resolve_ip=False, max_idle=max_idle)
+        pooled._commands = executor._commands
+        if getattr(executor, 'keep_alive', False) and getattr(executor, '_conn', None):
+            executor._conn.close()
+        return pooled
+
+    def _connect(self):
+        with self._lock:
+            self.opened += 1
+        if self._scheme == 'https':
+            return httplib.HTTPSConnection(self._host, self._port, timeout=self._timeout)
+        return httplib.HTTPConnection(self._host, self._port, timeout=self._timeout)
+
+    @staticmethod
+    def _stale(conn):
+        # Nothing should arrive on an idle connection. If it is readable the
+        # server has closed it (or sent something unexpected).
+        if conn.sock is None:
+            return True
+        try:
+            readable = select.select([conn.sock], [], [], 0)[0]
+        except (ValueError, select.error, socket.error):
+            return True
+        return bool(readable)
+
+    def _checkout(self):
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                conn = self._idle.pop()
+            if not self._stale(conn):
+                return conn, True
+            conn.close()
+        return self._connect(), False
+
+    def _checkin(self, conn):
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    @staticmethod
+    def _send(conn, method, path, body, headers):
+        conn.request(method, path, body, headers)
+        return conn.getresponse()
+
+    def _request(self, method, url, body=None):
+        '''
+        Sends an HTTP request over a pooled connection.
+
+        Returns
+        -------
+        dict
+            The server's parsed JSON response. (See RemoteConnection._request)
+
+        '''
+        LOGGER.debug('%s %s %s' % (method, url, body))
+        parsed_url = parse.urlparse(url)
+        headers = self.get_remote_connection_headers(parsed_url, True)
+        if body and method != 'POST' and method != 'PUT':
+            body = None
+
+        conn, reused = self._checkout()
+        sent = False
+        try:
+            conn.request(method, parsed_url.path, body, headers)
+            sent = True
+            resp = conn.getresponse()
+        except socket.timeout:
+            conn.close()
+            raise
+        except (httplib.HTTPException, socket.error):
+            conn.close()
+            if not reused or (sent and method not in IDEMPOTENT):
+                raise
+            # The server closed the idle connection. Retry once on a new one.
+            conn = self._connect()
+            try:
+                resp = self._send(conn, method, parsed_url.path, body, headers)
+            except (httplib.HTTPException, socket.error):
+                conn.close()
+                raise
+
+        data = resp.read()
+        if resp.will_close:
+            conn.close()
+        else:
+            self._checkin(conn)
+
+        return self._response(resp, data)
+
+    def _response(self, resp, data):
+        # Same handling as the end of RemoteConnection._request.
+        statuscode = resp.status
+        try:
+            if 300 <= statuscode < 304:
+                return self._request('GET', resp.getheader('location'))
+            body = data.decode('utf-8').replace('\x00', '').strip()
+            if 399 < statuscode <= 500:
+                return {'status': statuscode, 'value': body}
+            content_type = []
+            if resp.getheader('Content-Type') is not None:
+                content_type = resp.getheader('Content-Type').split(';')
+            if any(x.startswith('image/png') for x in content_type):
+                return {'status': 0, 'value': body}
+
+            try:
+                data = utils.load_json(body)
+            except ValueError:
+                if 199 < statuscode < 300:
+                    status = ErrorCode.SUCCESS
+                else:
+                    status = ErrorCode.UNKNOWN_ERROR
+                return {'status': status, 'value': body}
+
+            assert type(data) is dict, 'Invalid server response body: %s' % body
+            if 'value' not in data:
+                data['value'] = None
+            return data
+        finally:
+            LOGGER.debug("Finished Request")
+            resp.close()
+
+    def close(self):
+        '''
+        Closes every idle connection.
+        '''
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
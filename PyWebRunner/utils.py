@@ -13,6 +13,34 @@ except ImportError:
 
 latest_gecko_driver = '0.18.0'
 
+
+def env_flag(name, default=False):
+    '''
+    Reads an on/off WR_* environment variable. '', '0', 'false', 'no' and
+    'off' (in any case) are False, anything else is True. Returns default
+    when the variable isn't set.
+    '''
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() not in ('', '0', 'false', 'no', 'off')
+
+
+def get_cache_dir(*parts):
+    '''
+    Returns (and creates) a directory for PyWebRunner's caches.
+    Set WR_CACHE_DIR to move it. Defaults to ~/.cache/pywebrunner
+    '''
+    base = os.environ.get('WR_CACHE_DIR') or os.path.join(os.path.expanduser('~'), '.cache', 'pywebrunner')
+    path = os.path.join(base, *parts)
+    try:
+        os.makedirs(path)
+    except OSError:
+        # Already exists (or can't be created, in which case writes will fail quietly.)
+        pass
+    return path
+
+
 def get_remote_binary(whichbin):
     # if not which(whichbin):
     print("=" * 80)
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Browser start time per launch profile.
+
+Starts and stops the browser a number of times with every launch profile
+(see PyWebRunner.launch) and prints how long WebRunner.start took, how long
+the first page load took after it and how long stop took. Needs the browser
+and its driver installed. (Run it from the repository root with PyWebRunner
+installed, or with PYTHONPATH=.)
+
+    python benchmarks/startup.py -n 5 --browser chrome-headless
+    python benchmarks/startup.py --browser gecko-headless --profiles lean
+'''
+import argparse
+
+from time import time
+
+from PyWebRunner import WebRunner
+from PyWebRunner.launch import PROFILES
+from PyWebRunner.timing import percentile
+
+
+def launch(driver, profile):
+    '''
+    Starts and stops one browser. Returns the seconds start, the first page
+    load and stop took.
+    '''
+    wr = WebRunner(driver=driver, launch_profile=profile)
+    start = time()
+    wr.start()
+    started = time()
+    wr.browser.get('about:blank')
+    loaded = time()
+    wr.stop()
+    return started - start, loaded - started, time() - loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark browser start time per launch profile.')
+    parser.add_argument('-n', '--launches', type=int, default=5, help='Launches per profile. Defaults to 5')
+    parser.add_argument('-b', '--browser', default='chrome-headless', help='Which browser to start. Defaults to chrome-headless')
+    parser.add_argument('--profiles', nargs='+', default=PROFILES, choices=PROFILES, help='Launch profiles to compare. Defaults to all of them.')
+    args = parser.parse_args()
+
+    results = {}
+    for profile in args.profiles:
+        # The first launch warms the disk cache. Don't count it.
+        launch(args.browser, profile)
+        results[profile] = [launch(args.browser, profile) for i in range(args.launches)]
+
+    print('{} launches per profile, {}'.format(args.launches, args.browser))
+    print('{:<10} {:>9} {:>9} {:>9} {:>12} {:>9}'.format(
+        'profile', 'start p50', 'start p95', 'start max', 'first page', 'stop'))
+    for profile in args.profiles:
+        starts = [result[0] for result in results[profile]]
+        pages = [result[1] for result in results[profile]]
+        stops = [result[2] for result in results[profile]]
+        print('{:<10} {:>8.3f}s {:>8.3f}s {:>8.3f}s {:>11.3f}s {:>8.3f}s'.format(
+            profile, percentile(starts, 50), percentile(starts, 95), max(starts),
+            percentile(pages, 50), percentile(stops, 50)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Per-command latency of the WebDriver transports.
+
+Sends the same command over Selenium's RemoteConnection (a new connection per
+command, and a single keep-alive connection) and over PyWebRunner's
+PooledRemoteConnection, and prints the latency of each along with the number
+of TCP connections it opened.
+
+By default the commands go to a stub WebDriver server started in this
+process, which isolates the cost of the transport itself. Pass --chromedriver
+to measure against a real chromedriver session instead. (Run it from the
+repository root with PyWebRunner installed, or with PYTHONPATH=.)
+
+    python benchmarks/transport.py -n 2000 --threads 4
+    python benchmarks/transport.py --chromedriver
+'''
+import argparse
+import json
+import threading
+
+from time import time
+
+from selenium.webdriver.remote.command import Command
+from selenium.webdriver.remote.remote_connection import RemoteConnection
+
+from PyWebRunner.timing import percentile
+from PyWebRunner.transport import PooledRemoteConnection
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Send each response in one write, like a real driver does.
+    wbufsize = -1
+    disable_nagle_algorithm = True
+    connections = 0
+
+    def setup(self):
+        StubHandler.connections += 1
+        BaseHTTPRequestHandler.setup(self)
+
+    def log_message(self, *args):
+        pass
+
+    def _respond(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            self.rfile.read(length)
+        data = json.dumps({'sessionId': 'stub', 'status': 0, 'value': 'Stub'}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json;charset=UTF-8')
+        self.send_header('Content-Length', str(len(data)))
+        if self.headers.get('Connection', '').lower() != 'keep-alive':
+            self.send_header('Connection', 'close')
+            self.close_connection = True
+        self.end_headers()
+        self.wfile.write(data)
+
+    do_GET = do_POST = do_DELETE = _respond
+
+
+class StubServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def start_stub():
+    server = StubServer(('127.0.0.1', 0), StubHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server, 'http://127.0.0.1:{}'.format(server.server_port), 'stub'
+
+
+def start_chromedriver():
+    from selenium import webdriver
+    from selenium.webdriver.chrome.options import Options
+
+    options = Options()
+    options.add_argument('--headless')
+    browser = webdriver.Chrome(chrome_options=options)
+    return browser, browser.command_executor._url, browser.session_id
+
+
+def run(executor, session_id, count, threads):
+    latencies = []
+    lock = threading.Lock()
+
+    def worker(n):
+        mine = []
+        for _ in range(n):
+            start = time()
+            executor.execute(Command.GET_TITLE, {'sessionId': session_id})
+            mine.append(time() - start)
+        with lock:
+            latencies.extend(mine)
+
+    workers = [threading.Thread(target=worker, args=(count // threads,)) for _ in range(threads)]
+    start = time()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return latencies, time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the WebDriver transports.')
+    parser.add_argument('-n', '--commands', type=int, default=2000, help='Commands per transport. Defaults to 2000')
+    parser.add_argument('--threads', type=int, default=1, help='Threads sharing each transport. Defaults to 1')
+    parser.add_argument('--chromedriver', action='store_true', help='Use a headless Chrome session instead of the stub server.')
+    args = parser.parse_args()
+
+    if args.chromedriver:
+        target, url, session_id = start_chromedriver()
+    else:
+        target, url, session_id = start_stub()
+
+    transports = [('new connection per command', RemoteConnection(url, keep_alive=False))]
+    if args.threads == 1:
+        # Selenium's keep-alive connection can't be shared between threads.
+        transports.append(('selenium keep-alive', RemoteConnection(url, keep_alive=True)))
+    transports.append(('pooled keep-alive', PooledRemoteConnection(url)))
+
+    print('{} commands, {} thread(s), {}'.format(
+        args.commands, args.threads, 'chromedriver' if args.chromedriver else 'stub server'))
+    print('{:<28} {:>9} {:>9} {:>9} {:>11} {:>12}'.format(
+        'transport', 'mean', 'p50', 'p95', 'commands/s', 'connections'))
+    try:
+        for name, executor in transports:
+            connections = StubHandler.connections
+            latencies, elapsed = run(executor, session_id, args.commands, args.threads)
+            opened = getattr(executor, 'opened', None)
+            if not args.chromedriver:
+                opened = StubHandler.connections - connections
+            print('{:<28} {:>7.3f}ms {:>7.3f}ms {:>7.3f}ms {:>11.0f} {:>12}'.format(
+                name, sum(latencies) / len(latencies) * 1000, percentile(latencies, 50) * 1000,
+                percentile(latencies, 95) * 1000, len(latencies) / elapsed,
+                '?' if opened is None else opened))
+    finally:
+        if args.chromedriver:
+            target.quit()
+        else:
+            target.shutdown()
+
+
+if __name__ == '__main__':
+    main()
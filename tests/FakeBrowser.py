@@ -0,0 +1,81 @@
+from selenium.common.exceptions import StaleElementReferenceException
+from selenium.webdriver.remote.webelement import WebElement
+
+from PyWebRunner import WebRunner
+
+
+class FakeBrowser(object):
+    """
+    Stands in for a WebDriver in tests that don't need a browser. Records
+    the commands, scripts and async scripts it is sent.
+
+    Parameters
+    ----------
+    script_result:
+        What execute_script returns. Callables are called with the browser.
+    async_result:
+        What execute_async_script returns.
+    async_error: Exception
+        Raised by execute_async_script instead.
+    matches: int
+        How many elements find_elements finds.
+    command_executor:
+        Where execute sends the commands, if anywhere.
+    """
+
+    def __init__(self, script_result=None, async_result=None, async_error=None, matches=3,
+                 command_executor=None):
+        self.script_result = script_result
+        self.async_result = async_result
+        self.async_error = async_error
+        self.matches = matches
+        self.command_executor = command_executor
+        self.commands = []
+        self.scripts = []
+        self.async_calls = []
+        self.finds = 0
+        # Ids of the elements that have left the page.
+        self.stale = set()
+
+    def execute(self, driver_command, params=None):
+        self.commands.append(driver_command)
+        if self.command_executor is not None:
+            return self.command_executor.execute(driver_command, params)
+        element_id = (params or {}).get('id')
+        if element_id in self.stale:
+            raise StaleElementReferenceException('stale')
+        return {'value': 'text of {}'.format(element_id) if element_id else None}
+
+    def execute_script(self, script, *args):
+        self.scripts.append(args)
+        if callable(self.script_result):
+            return self.script_result(self)
+        return self.script_result
+
+    def set_script_timeout(self, timeout):
+        self.script_timeout = timeout
+
+    def execute_async_script(self, script, *args):
+        self.async_calls.append(args)
+        if self.async_error:
+            raise self.async_error
+        return self.async_result
+
+    def find_element(self, by, value):
+        self.finds += 1
+        return WebElement(self, 'e{}'.format(self.finds))
+
+    def find_elements(self, by, value):
+        return [self.find_element(by, value) for _ in range(self.matches)]
+
+    def get(self, url):
+        self.execute('get', {'url': url})
+
+
+def fake_runner(browser=None, **kwargs):
+    '''
+    A WebRunner (built with kwargs) driving browser, a new FakeBrowser by default.
+    '''
+    wt = WebRunner(**kwargs)
+    wt.browser = browser or FakeBrowser()
+    return wt
@@ -0,0 +1,11 @@
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmpdir, monkeypatch):
+    '''
+    Keeps the plans and parsed scripts the tests compile (see
+    PyWebRunner.script) out of ~/.cache/pywebrunner.
+    '''
+    monkeypatch.setenv('WR_CACHE_DIR', str(tmpdir))
+    return str(tmpdir)
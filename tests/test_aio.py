@@ -0,0 +1,200 @@
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+
+if sys.version_info >= (3, 5):
+    import asyncio
+    from PyWebRunner.aio import AsyncHTTPClient, AsyncWebRunner, UnsupportedCommandError, run_scripts
+
+
+class StubDriver(BaseHTTPRequestHandler):
+    """
+    Answers just enough of the JSON wire protocol to run a small script.
+    """
+    protocol_version = 'HTTP/1.1'
+    requests = []
+    connections = 0
+    # (method, path) of requests to drop once without answering.
+    drop = set()
+
+    responses = {
+        ('POST', '/session'): {'sessionId': 'abc', 'status': 0, 'value': {}},
+        ('POST', '/session/abc/url'): {'status': 0, 'value': None},
+        ('GET', '/session/abc/url'): {'status': 0, 'value': 'http://example.com/'},
+        ('POST', '/session/abc/execute'): {'status': 0, 'value': {'ELEMENT': '1'}},
+        ('POST', '/session/abc/element/1/click'): {'status': 0, 'value': None},
+        ('DELETE', '/session/abc'): {'status': 0, 'value': None},
+        ('DELETE', '/session/abc/cookie'): {'status': 0, 'value': None},
+    }
+
+    def setup(self):
+        StubDriver.connections += 1
+        BaseHTTPRequestHandler.setup(self)
+
+    def log_message(self, *args):
+        pass
+
+    def _respond(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        self.requests.append((self.command, self.path, body))
+        if (self.command, self.path) in self.drop:
+            self.drop.discard((self.command, self.path))
+            self.close_connection = True
+            return
+        response = self.responses.get((self.command, self.path))
+        if response is None:
+            response = {'status': 9, 'value': {'message': 'Unknown command'}}
+        data = json.dumps(response).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json;charset=UTF-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    do_GET = do_POST = do_DELETE = _respond
+
+
+@unittest.skipIf(sys.version_info < (3, 5), 'PyWebRunner.aio needs Python 3.5+')
+class TestAsyncWebRunner(unittest.TestCase):
+
+    def setUp(self):
+        StubDriver.requests = []
+        StubDriver.connections = 0
+        StubDriver.drop = set()
+        self.server = HTTPServer(('127.0.0.1', 0), StubDriver)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.url = 'http://127.0.0.1:{}'.format(self.server.server_port)
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.loop.close()
+
+    def run_script(self, script):
+        async def run():
+            wt = AsyncWebRunner(driver='remote', command_executor=self.url, timeout=1)
+            await wt.start()
+            try:
+                await wt.command_script(script=script, stop_on_error=False)
+            finally:
+                await wt.stop()
+        self.loop.run_until_complete(run())
+
+    def test_command_script(self):
+        self.run_script([
+            {'go': 'http://example.com/'},
+            {'click': '#button'},
+            {'assert_url': 'http://example.com/'},
+        ])
+        paths = [(method, path) for method, path, body in StubDriver.requests]
+        assert paths == [('POST', '/session'),
+                         ('POST', '/session/abc/url'),
+                         ('POST', '/session/abc/execute'),
+                         ('POST', '/session/abc/element/1/click'),
+                         ('GET', '/session/abc/url'),
+                         ('DELETE', '/session/abc')]
+        # Every command went over the same keep-alive connection.
+        assert StubDriver.connections == 1
+
+    def test_retries_only_idempotent_requests(self):
+        # The server may have clicked before dropping the connection. Don't click twice.
+        StubDriver.drop = {('POST', '/session/abc/element/1/click'), ('GET', '/session/abc/url')}
+        with self.assertRaises(ConnectionError):
+            self.run_script([{'click': '#button'}])
+        clicks = [r for r in StubDriver.requests if r[1] == '/session/abc/element/1/click']
+        assert len(clicks) == 1
+
+        StubDriver.requests = []
+        self.run_script([{'assert_url': 'http://example.com/'}])
+        urls = [r for r in StubDriver.requests if r[1] == '/session/abc/url']
+        assert len(urls) == 2
+
+    def test_failed_retry_closes_its_connection(self):
+        client = AsyncHTTPClient(self.url)
+        written = []
+
+        async def run():
+            # Leaves an idle connection to retry from.
+            await client.request('GET', '/session/abc/url')
+            write = client._write
+
+            async def record(conn, *args):
+                written.append(conn[1])
+                await write(conn, *args)
+
+            async def hang_up(conn):
+                raise ConnectionResetError('The WebDriver server closed the connection.')
+            client._write = record
+            client._read = hang_up
+            with self.assertRaises(ConnectionResetError):
+                await client.request('GET', '/session/abc/url')
+        self.loop.run_until_complete(run())
+        # The idle connection and the one opened for the retry.
+        assert len(written) == 2
+        assert all(writer.transport.is_closing() for writer in written)
+        assert client.idle == []
+
+    def test_run_scripts(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        files = []
+        for name, url in (('a', 'http://example.com/'), ('b', 'http://example.org/'), ('c', 'http://example.com/')):
+            path = os.path.join(tmp_dir, name + '.json')
+            with open(path, 'w') as f:
+                json.dump([{'assert_url': url}], f)
+            files.append(path)
+
+        done = []
+        failures = self.loop.run_until_complete(run_scripts(
+            files, sessions=1, driver='remote', command_executor=self.url,
+            on_done=lambda filepath, seconds: done.append(filepath)))
+        assert done == files
+        assert list(failures) == [files[1]]
+        # The failed script's session was replaced, the others were reused.
+        sessions = [r for r in StubDriver.requests if r[:2] == ('POST', '/session')]
+        assert len(sessions) == 2
+
+    def test_set_values_shapes(self):
+        wt = AsyncWebRunner(driver='remote', command_executor=self.url)
+        typed = []
+
+        async def set_value(selector, value, **kwargs):
+            typed.append((selector, value))
+        wt.set_value = set_value
+
+        self.loop.run_until_complete(wt.set_values({'#textfield': 'AAAA'}))
+        assert typed == [('#textfield', 'AAAA')]
+        del typed[:]
+        # The mixed list of tests/script.yml
+        self.loop.run_until_complete(wt.set_values([['#textfield', 'CCCC'], {'#selectfield': '7'}]))
+        assert typed == [('#textfield', 'CCCC'), ('#selectfield', '7')]
+
+    def test_unsupported_commands(self):
+        with self.assertRaises(UnsupportedCommandError) as raised:
+            self.run_script([
+                {'go': 'http://example.com/'},
+                {'set_selectize': ['#select', 'value']},
+                {'fill_form': []},
+                {'set_selectize': ['#other', 'value']},
+            ])
+        assert str(raised.exception) == 'Not supported by AsyncWebRunner: set_selectize, fill_form'
+        # Rejected before the first step.
+        paths = [(method, path) for method, path, body in StubDriver.requests]
+        assert paths == [('POST', '/session'), ('DELETE', '/session/abc')]
+
+
+if __name__ == '__main__':
+    unittest.main()
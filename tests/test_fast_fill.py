@@ -0,0 +1,117 @@
+import os
+import unittest
+
+from FakeBrowser import FakeBrowser, fake_runner
+from PyWebRunner import WebRunner
+
+
+class TestFastFill(unittest.TestCase):
+
+    def runner(self, left=()):
+        # The script returns the indexes of the rows it could not fill.
+        wt = fake_runner(FakeBrowser(script_result=list(left)), fast_fill=True)
+        self.typed = []
+        wt.set_value = lambda selector, value, **kwargs: self.typed.append((selector, value))
+        return wt
+
+    def test_one_script_for_all_fields(self):
+        wt = self.runner()
+        wt.set_values([('#name', 'Ann'), {'#plan': '2'}, ['#terms', 'yes']])
+        (rows, clear, blur), = wt.browser.scripts
+        assert rows == [['css', '#name', 'Ann'], ['css', '#plan', '2'], ['css', '#terms', 'yes']]
+        assert clear and blur
+        assert self.typed == []
+
+    def test_left_over_and_keystroke_fields_are_typed(self):
+        # The script could not fill its second row (#upload).
+        wt = self.runner(left=[1])
+        wt.set_values([('#name', 'Ann'), ('#card', '4111'), ('#upload', '/tmp/a.pdf')],
+                      keystrokes=['#card'])
+        (rows, clear, blur), = wt.browser.scripts
+        assert [row[1] for row in rows] == ['#name', '#upload']
+        assert self.typed == [('#card', '4111'), ('#upload', '/tmp/a.pdf')]
+
+    def test_typing_is_never_fast(self):
+        wt = self.runner()
+        wt.set_values({'#name': 'Ann'}, typing=True)
+        assert wt.browser.scripts == []
+        assert self.typed == [('#name', 'Ann')]
+
+    def test_fill_form_search_methods(self):
+        wt = self.runner()
+        wt.fill_form([{'name': 'plan', 'value': '2'},
+                      {'xpath': '//input[@id="a"]', 'value': 'x'},
+                      {'id': 'b', 'value': ['1', '3']}])
+        (rows, clear, blur), = wt.browser.scripts
+        assert rows == [['name', 'plan', '2'], ['xpath', '//input[@id="a"]', 'x'], ['id', 'b', ['1', '3']]]
+
+    def test_values_are_strings(self):
+        wt = self.runner()
+        wt.fill_form([{'name': 'plan', 'value': 2}, {'id': 'b', 'value': [1, 3]}])
+        (rows, clear, blur), = wt.browser.scripts
+        assert rows == [['name', 'plan', '2'], ['id', 'b', ['1', '3']]]
+
+    def test_off_by_default(self):
+        wt = fake_runner()
+        wt.set_value = lambda selector, value, **kwargs: None
+        wt.set_values({'#name': 'Ann'})
+        assert wt.browser.scripts == []
+
+    def test_env_flag(self):
+        os.environ['WR_FAST_FILL'] = '0'
+        try:
+            assert not WebRunner(fast_fill=True).fast_fill
+        finally:
+            del os.environ['WR_FAST_FILL']
+
+
+class Choice(object):
+
+    def __init__(self, browser, value):
+        self.browser = browser
+        self.value = value
+
+    def click(self):
+        self.browser.clicks.append(self.value)
+
+
+class GroupBrowser(FakeBrowser):
+    """
+    A radio or checkbox group. Every script is answered like the CHOICES one.
+    """
+
+    def __init__(self, tag_type, checked):
+        FakeBrowser.__init__(self, script_result=lambda browser: browser.choices)
+        self.choices = [[tag_type, value, value in checked] for value in ('a', 'b', 'c', 'd')]
+        self.clicks = []
+
+    def find_elements_by_name(self, name):
+        return [Choice(self, choice[1]) for choice in self.choices]
+
+
+class TestFillGroups(unittest.TestCase):
+
+    def fill(self, tag_type, checked, value):
+        wt = fake_runner(GroupBrowser(tag_type, checked))
+        wt.fill_form([{'name': 'group', 'value': value}])
+        assert len(wt.browser.scripts) == 1
+        return wt.browser.clicks
+
+    def test_checkboxes(self):
+        # Check c and d, un-check a. b stays checked.
+        assert self.fill('checkbox', ['a', 'b'], ['b', 'c', 'd']) == ['a', 'c', 'd']
+        assert self.fill('checkbox', ['a'], 'a') == []
+
+    def test_radios(self):
+        assert self.fill('radio', ['a'], 'c') == ['c']
+        assert self.fill('radio', ['c'], 'c') == []
+
+    def test_values_compare_as_strings(self):
+        wt = fake_runner(GroupBrowser('checkbox', []))
+        wt.browser.choices = [['checkbox', str(value), False] for value in (1, 2, 3)]
+        wt.fill_form([{'name': 'group', 'value': [1, 3]}])
+        assert wt.browser.clicks == ['1', '3']
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -62,3 +62,19 @@ class TestForms(HttpBase):
         self.wt.wait_for_text_in_value('#textfield', 'DDDDDDDD')
         assert self.wt.get_value('#textfield') == 'DDDDDDDD'
         assert self.wt.get_value('#selectfield') == '8'
+
+    def test_fast_fill(self):
+        self.wt.goto('/tests/html/forms.html')
+        self.wt.wait_for_clickable('#textfield')
+
+        self.wt.fill({
+            '#textfield': 'EEEEEEEE',
+            '#selectfield': '3',
+            '#checkbox': '1'
+        }, fast=True)
+        assert self.wt.get_value('#textfield') == 'EEEEEEEE'
+        assert self.wt.get_value('#selectfield') == '3'
+        self.wt.assert_checked('#checkbox')
+
+        self.wt.set_values([('#textfield', 'FF')], clear=False, fast=True)
+        assert self.wt.get_value('#textfield') == 'EEEEEEEEFF'
@@ -0,0 +1,42 @@
+import sys
+import unittest
+
+from selenium.webdriver.common.desired_capabilities import DesiredCapabilities
+
+from PyWebRunner import WebRunner
+from PyWebRunner.launch import chrome_arguments, firefox_preferences
+
+if sys.version_info >= (3, 5):
+    from PyWebRunner.aio import AsyncWebRunner
+
+
+class TestLaunchProfiles(unittest.TestCase):
+
+    def test_profiles(self):
+        assert chrome_arguments('default') == []
+        assert '--disable-dev-shm-usage' in chrome_arguments('lean')
+        assert firefox_preferences('lean')['app.update.enabled'] is False
+        with self.assertRaises(ValueError):
+            chrome_arguments('fast')
+
+    def test_remote_capabilities(self):
+        wr = WebRunner(launch_profile='lean')
+        caps = wr._launch_capabilities(DesiredCapabilities.CHROME)
+        assert caps['chromeOptions']['args'] == chrome_arguments('lean')
+        assert 'chromeOptions' not in DesiredCapabilities.CHROME
+
+        caps = wr._launch_capabilities(DesiredCapabilities.FIREFOX)
+        assert caps['moz:firefoxOptions']['prefs'] == firefox_preferences('lean')
+
+        wr = WebRunner()
+        assert wr._launch_capabilities(DesiredCapabilities.CHROME) == DesiredCapabilities.CHROME
+
+    @unittest.skipIf(sys.version_info < (3, 5), 'PyWebRunner.aio needs Python 3.5+')
+    def test_async_headless_firefox(self):
+        caps = AsyncWebRunner(driver='gecko-headless', launch_profile='lean')._capabilities()
+        assert caps['moz:firefoxOptions']['args'] == ['-headless']
+        assert caps['moz:firefoxOptions']['prefs'] == firefox_preferences('lean')
+
+
+if __name__ == '__main__':
+    unittest.main()
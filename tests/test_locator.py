@@ -0,0 +1,72 @@
+import unittest
+
+from selenium.webdriver.common.by import By
+from selenium.webdriver.remote.webelement import WebElement
+
+from FakeBrowser import FakeBrowser, fake_runner
+from PyWebRunner.WebRunner import WebRunnerElement
+from PyWebRunner.locator import Locator, locate
+
+
+class DriverElement(WebElement):
+
+    def anonymous_children(self):
+        return []
+
+
+class TestLocator(unittest.TestCase):
+
+    def test_locate(self):
+        assert locate('#id') == (By.CSS_SELECTOR, '#id')
+        assert locate('//div').is_xpath
+        assert locate('#id') is locate('#id')
+        assert locate(Locator(By.XPATH, '//a')) == (By.XPATH, '//a')
+
+
+class TestElementCache(unittest.TestCase):
+
+    def setUp(self):
+        self.wt = fake_runner(FakeBrowser(script_result=True))
+
+    def test_reuses_handle(self):
+        assert self.wt.get_element('#a') is self.wt.get_element('#a')
+        assert self.wt.get_text('#a') == 'text of e1'
+        assert self.wt.browser.finds == 1
+
+    def test_navigation_forgets_handles(self):
+        self.wt.get_element('#a')
+        self.wt.go('about:blank')
+        self.wt.get_element('#a')
+        assert self.wt.browser.finds == 2
+
+    def test_changes_forget_handles(self):
+        commands = (lambda: self.wt.click_all('li'),
+                    lambda: self.wt.js('document.body.className = "done";'),
+                    lambda: self.wt.clear('#a'))
+        for command in commands:
+            before = self.wt.get_element('#a')
+            command()
+            assert self.wt.get_element('#a') is not before
+
+    def test_stale_handle_is_replaced(self):
+        self.wt.get_element('#a')
+        self.wt.browser.stale.add('e1')
+        assert self.wt.get_text('#a') == 'text of e2'
+        assert self.wt.get_element('#a').id == 'e2'
+
+    def test_elements_are_extended_in_place(self):
+        elems = self.wt.get_elements('li')
+        assert [type(e) for e in elems] == [WebRunnerElement] * 3
+        assert [e.id for e in elems] == ['e1', 'e2', 'e3']
+
+    def test_driver_elements_keep_their_class(self):
+        elem = WebRunnerElement.extend(DriverElement(self.wt.browser, 'e1'))
+        assert isinstance(elem, DriverElement)
+        assert elem.anonymous_children() == []
+        assert isinstance(elem, WebRunnerElement)
+        assert type(elem) is WebRunnerElement.for_class(DriverElement)
+        assert WebRunnerElement.for_class(type(elem)) is type(elem)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -22,6 +22,15 @@ class TestMisc(HttpBase):
         assert self.wt.count('/html/body/table/tbody/tr/td') == 8 * 3
         assert self.wt.count('li') == 8
 
+    def test_bulk_readers(self):
+        self.wt.goto('/tests/html/misc.html')
+        self.wt.wait_for_visible('li')
+        texts = ['Item {}'.format(i) for i in range(1, 9)]
+        assert self.wt.get_texts('li') == texts
+        assert self.wt.get_texts('li', bulk=False) == texts
+        assert self.wt.get_texts('/html/body/ul/li') == texts
+        assert self.wt.get_attributes('li', 'tagName') == ['LI'] * 8
+
     def test_screenshot(self):
         import os.path
         path = '/tmp/selenium-screenshot.png'
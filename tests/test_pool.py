@@ -0,0 +1,101 @@
+import threading
+import time
+import unittest
+
+from PyWebRunner.pool import SessionPool
+
+
+class FakeRunner(object):
+
+    def __init__(self):
+        self.alive = True
+        self.resets = 0
+
+    def is_alive(self):
+        return self.alive
+
+    def reset(self):
+        self.resets += 1
+
+    def stop(self):
+        self.alive = False
+
+
+class TestSessionPool(unittest.TestCase):
+
+    def test_reuse(self):
+        pool = SessionPool(FakeRunner)
+        runner = pool.acquire()
+        pool.release(runner)
+        assert runner.resets == 1
+        assert pool.acquire() is runner
+        assert pool.launched == 1
+
+    def test_scripts_share_sessions(self):
+        # 6 scripts over 2 sessions launch 2 browsers, not 6.
+        pool = SessionPool(FakeRunner)
+        used = set()
+        for _ in range(3):
+            runners = [pool.acquire(), pool.acquire()]
+            used.update(runners)
+            for runner in runners:
+                pool.release(runner)
+        assert pool.launched == 2
+        assert len(used) == 2
+        assert sum(runner.resets for runner in used) == 6
+
+    def test_broken_browser_is_replaced(self):
+        pool = SessionPool(FakeRunner)
+        runner = pool.acquire()
+        runner.alive = False
+        pool.release(runner)
+        assert pool.acquire() is not runner
+        assert pool.launched == 2
+
+    def test_warm_spares(self):
+        pool = SessionPool(FakeRunner, spares=1)
+        pool.warm(2)
+        runner = pool.acquire()
+        runner.alive = False
+        pool.release(runner)
+        replacement = pool.acquire()
+        assert replacement is not runner
+        assert replacement.alive
+        pool.close()
+        assert pool.idle == []
+        # The 2 warmed browsers and the spare launched after the second acquire.
+        assert pool.launched == 3
+
+    def test_background_launch_errors_are_raised(self):
+        def broken():
+            raise RuntimeError('chromedriver not found')
+        pool = SessionPool(broken, spares=1)
+        pool.warm(2)
+        with self.assertRaises(RuntimeError):
+            pool.acquire()
+        assert pool.launch_errors == []
+        # Launched here again, and no spares are launched after a failure.
+        with self.assertRaises(RuntimeError):
+            pool.acquire()
+        assert pool.pending == 0
+
+    def test_close_stops_waiting(self):
+        started = threading.Event()
+        runners = []
+
+        def slow():
+            started.wait()
+            runners.append(FakeRunner())
+            return runners[-1]
+        pool = SessionPool(slow)
+        pool.warm()
+        start = time.time()
+        pool.close(timeout=0.05)
+        assert time.time() - start < 1
+        # A browser that starts after close is stopped right away.
+        started.set()
+        deadline = time.time() + 5
+        while (not runners or runners[0].alive) and time.time() < deadline:
+            time.sleep(0.01)
+        assert not runners[0].alive
+        assert pool.idle == []
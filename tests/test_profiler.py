@@ -0,0 +1,58 @@
+import unittest
+
+from FakeBrowser import FakeBrowser, fake_runner
+from PyWebRunner.profiler import UNATTRIBUTED, format_report, merge
+
+
+class FakeConnection(object):
+    _commands = {
+        'get': ('POST', '/session/$sessionId/url'),
+        'getTitle': ('GET', '/session/$sessionId/title'),
+    }
+
+    def execute(self, command, params):
+        return {'status': 0, 'value': None}
+
+
+class TitleBrowser(FakeBrowser):
+    """
+    Also gets the title after loading a page: two requests per get.
+    """
+
+    def get(self, url):
+        FakeBrowser.get(self, url)
+        self.execute('getTitle')
+
+
+class TestTransportProfiler(unittest.TestCase):
+
+    def setUp(self):
+        self.wt = fake_runner(TitleBrowser(command_executor=FakeConnection()), profile=True)
+        self.wt.profiler.install(self.wt.browser)
+
+    def test_attribution(self):
+        self.wt.go('about:blank')
+        self.wt.go('about:blank')
+        self.wt.browser.get('about:blank')
+        stats = self.wt.profiler.drain()
+
+        go = stats['methods']['go']
+        assert go['invocations'] == 2
+        assert go['calls'] == 4
+        assert go['endpoints'] == {'POST /session/$sessionId/url': 2,
+                                   'GET /session/$sessionId/title': 2}
+        assert stats['methods'][UNATTRIBUTED]['calls'] == 2
+        assert stats['endpoints']['POST /session/$sessionId/url'][0] == 3
+
+        merged = merge([stats, stats])
+        assert merged['methods']['go']['calls'] == 8
+        assert 'go' in format_report(merged)
+
+    def test_install_once(self):
+        self.wt.profiler.install(self.wt.browser)
+        self.wt.go('about:blank')
+        assert self.wt.profiler.drain()['methods']['go']['calls'] == 2
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,205 @@
+import argparse
+import shutil
+import tempfile
+import threading
+import unittest
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler
+    import httplib
+except ImportError:
+    from http.server import BaseHTTPRequestHandler
+    import http.client as httplib
+
+from PyWebRunner import WebRunner, runner
+from PyWebRunner.proxy import BlockRules, Proxy, ProxyServer, ResponseCache, format_stats
+
+
+class Origin(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    requests = []
+    # Drop kept-alive connections after answering, without saying so.
+    hang_up = False
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.requests.append(self.path)
+        body = 'served {}'.format(self.path).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/css' if '.css' in self.path else 'text/html')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        self.close_connection = self.hang_up
+
+    do_POST = do_GET
+
+
+class TestBlockRules(unittest.TestCase):
+
+    def test_rules(self):
+        rules = BlockRules(['image', 'google-analytics.com', '*/ads/*'])
+        assert rules.blocks('http://example.com/logo.PNG')
+        assert rules.blocks('http://example.com/logo', accept='image/webp,*/*')
+        assert rules.blocks('https://www.google-analytics.com/')
+        assert rules.blocks('http://example.com/ads/banner.html')
+        assert not rules.blocks('http://example.com/app.js')
+        assert not rules.blocks('http://not-google-analytics.com/')
+        assert not BlockRules()
+
+
+class ProxyTestCase(unittest.TestCase):
+
+    def setUp(self):
+        Origin.requests = []
+        Origin.hang_up = False
+        # Threaded, so a proxy keeping a connection open doesn't hold it up.
+        self.origin = ProxyServer(('127.0.0.1', 0), Origin)
+        thread = threading.Thread(target=self.origin.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.base = 'http://127.0.0.1:{}'.format(self.origin.server_port)
+        self.start_proxy(block=['font', '*/analytics/*'])
+
+    def start_proxy(self, **kwargs):
+        self.proxy = Proxy(**kwargs).start()
+        self.conn = httplib.HTTPConnection(self.proxy.host, self.proxy.port, timeout=5)
+
+    def stop_proxy(self):
+        self.conn.close()
+        self.proxy.stop()
+
+    def tearDown(self):
+        self.stop_proxy()
+        self.origin.shutdown()
+        self.origin.server_close()
+
+    def get(self, path, method='GET'):
+        self.conn.request(method, self.base + path)
+        resp = self.conn.getresponse()
+        return resp.status, resp.read()
+
+
+class TestProxy(ProxyTestCase):
+
+    def test_blocks_and_counts(self):
+        assert self.get('/index.html') == (200, b'served /index.html')
+        assert self.get('/fonts/a.woff2') == (204, b'')
+        assert self.get('/analytics/collect?x=1') == (204, b'')
+        assert self.get('/app.js?v=2') == (200, b'served /app.js?v=2')
+        assert Origin.requests == ['/index.html', '/app.js?v=2']
+        assert self.proxy.drain() == {'requests': 4, 'blocked': 2}
+        assert self.proxy.stats == {'requests': 0, 'blocked': 0}
+
+    def test_rules_can_change(self):
+        self.proxy.rules.add(['script'])
+        assert self.get('/app.js')[0] == 204
+
+    def test_blocked_tunnel(self):
+        self.proxy.rules.add(['example.com'])
+        self.conn.request('CONNECT', 'www.example.com:443')
+        assert self.conn.getresponse().status == 403
+
+    def test_block_resources_needs_the_proxy(self):
+        wr = WebRunner()
+        with self.assertRaises(UserWarning):
+            wr.block_resources('image')
+        wr.proxy = self.proxy
+        assert wr.block_resources(['image', 'script']) == 0
+        assert self.get('/app.js')[0] == 204
+
+    def test_only_idempotent_requests_are_resent(self):
+        Origin.hang_up = True
+        assert self.get('/a') == (200, b'served /a')
+        # The proxy finds its connection to the origin closed and opens a new one.
+        assert self.get('/b') == (200, b'served /b')
+        # The origin might have received the POST already. Don't send it twice.
+        assert self.get('/c', method='POST')[0] == 502
+        assert Origin.requests == ['/a', '/b']
+
+
+class TestResponseCache(ProxyTestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        ProxyTestCase.setUp(self)
+        self.restart('replay')
+
+    def tearDown(self):
+        ProxyTestCase.tearDown(self)
+        shutil.rmtree(self.cache_dir)
+
+    def restart(self, mode):
+        # A new proxy and cache over the same directory, like another run.
+        self.stop_proxy()
+        self.start_proxy(cache=ResponseCache(self.cache_dir, mode=mode))
+
+    def test_replay(self):
+        assert self.get('/app.css') == (200, b'served /app.css')
+        assert self.get('/app.css') == (200, b'served /app.css')
+        # Pages are never cached.
+        self.get('/index.html')
+        self.get('/index.html')
+        assert Origin.requests == ['/app.css', '/index.html', '/index.html']
+        assert self.proxy.drain() == {'requests': 4, 'blocked': 0, 'hits': 1, 'misses': 3, 'stored': 1}
+
+        self.restart('replay')
+        assert self.get('/app.css') == (200, b'served /app.css')
+        assert Origin.requests == ['/app.css', '/index.html', '/index.html']
+        assert self.proxy.stats['hits'] == 1
+
+    def test_record_and_pass_through(self):
+        self.get('/app.css')
+        self.restart('record')
+        self.get('/app.css')
+        assert self.proxy.stats['misses'] == self.proxy.stats['stored'] == 1
+        self.restart('pass-through')
+        self.get('/app.css')
+        assert Origin.requests == ['/app.css'] * 3
+        assert self.proxy.stats['stored'] == self.proxy.stats['hits'] == 0
+
+    def test_runner_blocks_in_front_of_the_shared_cache(self):
+        # A worker of webrunner --cache replay --block font
+        runner.ARGS = argparse.Namespace(
+            browser=None, timeout=None, default_offset=None, base_url=None, fast_click=False,
+            fast_fill=False, time_commands=False, step_log=None, profile=False, wait_backend='poll',
+            poll='fixed', launch_profile='default', block='font')
+        runner.PROXY_ADDRESS = self.proxy.address
+        self.addCleanup(setattr, runner, 'PROXY_ADDRESS', None)
+        wt = runner.new_tester()
+        wt._start_proxy()
+        self.addCleanup(wt.proxy.stop)
+        assert wt.block_resources('script') == 0
+
+        own = httplib.HTTPConnection(wt.proxy.host, wt.proxy.port, timeout=5)
+        self.addCleanup(own.close)
+        for path in ('/app.css', '/app.css', '/fonts/a.woff2', '/app.js'):
+            own.request('GET', self.base + path)
+            resp = own.getresponse()
+            resp.read()
+        assert resp.status == 204
+        assert Origin.requests == ['/app.css']
+        assert wt.proxy.drain() == {'requests': 4, 'blocked': 2}
+        assert self.proxy.drain() == {'requests': 2, 'blocked': 0, 'hits': 1, 'misses': 1, 'stored': 1}
+
+        # Tunnels go through both proxies too.
+        tunnel = httplib.HTTPConnection(wt.proxy.host, wt.proxy.port, timeout=5)
+        self.addCleanup(tunnel.close)
+        tunnel.set_tunnel('127.0.0.1', self.origin.server_port)
+        tunnel.request('GET', '/secure')
+        assert tunnel.getresponse().read() == b'served /secure'
+        assert self.proxy.drain()['requests'] == 1
+
+    def test_format_stats(self):
+        stats = {'requests': 10, 'blocked': 2, 'hits': 6, 'misses': 2, 'stored': 2}
+        assert format_stats(stats).splitlines() == [
+            'Proxy: 10 requests, 2 blocked.',
+            'Cache: 6 hits, 2 misses (75.0% hit ratio), 2 responses stored.']
+        with self.assertRaises(ValueError):
+            ResponseCache(self.cache_dir, mode='offline')
+
+
+if __name__ == '__main__':
+    unittest.main()
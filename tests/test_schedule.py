@@ -0,0 +1,51 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from PyWebRunner.schedule import TimingHistory, longest_first, shard
+
+
+class TestSchedule(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'timings.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_history_round_trip(self):
+        history = TimingHistory(self.path)
+        history.record('a.yml', 10)
+        history.record('./a.yml', 20)
+        history.save()
+
+        assert TimingHistory(self.path).get('a.yml') == 15
+
+    def test_longest_first(self):
+        history = TimingHistory(self.path)
+        history.record('short.yml', 1)
+        history.record('long.yml', 600)
+        history.record('medium.yml', 30)
+
+        files = ['short.yml', 'medium.yml', 'new.yml', 'long.yml']
+        assert longest_first(files, history) == ['new.yml', 'long.yml', 'medium.yml', 'short.yml']
+
+    def test_shard_without_history(self):
+        files = ['{}.yml'.format(i) for i in range(20)]
+        shards = [shard(files, i, 3) for i in (1, 2, 3)]
+
+        assert sorted(sum(shards, [])) == sorted(files)
+        assert shard(list(reversed(files)), 2, 3) == list(reversed(shards[1]))
+        # An empty history splits the same way.
+        assert shard(files, 2, 3, TimingHistory(self.path)) == shards[1]
+
+    def test_shard_balanced(self):
+        history = TimingHistory(self.path)
+        for name, seconds in (('a', 60), ('b', 40), ('c', 30), ('d', 20), ('e', 10)):
+            history.record(name, seconds)
+
+        files = ['a', 'b', 'c', 'd', 'e']
+        assert shard(files, 1, 2, history) == ['a', 'd']
+        assert shard(files, 2, 2, history) == ['b', 'c', 'e']
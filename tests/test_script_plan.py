@@ -0,0 +1,109 @@
+import gc
+import os
+import shutil
+import tempfile
+import unittest
+
+from PyWebRunner import WebRunner
+from PyWebRunner import script
+
+
+class Recorder(WebRunner):
+
+    def __init__(self):
+        WebRunner.__init__(self)
+        self.calls = []
+
+    def set_value(self, selector, value):
+        self.calls.append(('set_value', selector, value))
+
+    def set_values(self, values):
+        values.append('mutated')
+        self.calls.append(('set_values', values))
+
+    def refresh(self):
+        self.calls.append(('refresh',))
+
+
+class TestScriptPlan(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        os.environ['WR_CACHE_DIR'] = self.cache_dir
+        script._PLANS.clear()
+        script._INCLUDES.clear()
+
+    def tearDown(self):
+        del os.environ['WR_CACHE_DIR']
+        shutil.rmtree(self.cache_dir)
+
+    def test_compile(self):
+        plan = script.compile_script([
+            'refresh',
+            {'set_value': ['#a', '(( randint|1,2 ))']},
+            {'set_values': [['#a', 'b'], ['#c', '(( vars|x ))']]},
+        ])
+        assert [step.kind for step in plan] == [script.CALL_NONE, script.CALL, script.CALL_LIST]
+        assert plan[1].slots == ((1, None, 'randint|1,2'),)
+        assert plan[2].slots == ((1, 1, 'vars|x'),)
+
+    def test_plans_are_cached_and_reusable(self):
+        commands = [
+            'refresh',
+            {'set_value': ['#a', '(( vars|x ))']},
+            {'set_values': [['#a', 'b']]},
+        ]
+        runner = Recorder()
+        runner.yaml_vars['x'] = ['first']
+        runner.command_script(script=commands)
+        runner.yaml_vars['x'] = ['second']
+        runner.command_script(script=commands)
+
+        assert runner.calls == [
+            ('refresh',),
+            ('set_value', '#a', 'first'),
+            ('set_values', [['#a', 'b'], 'mutated']),
+            ('refresh',),
+            ('set_value', '#a', 'second'),
+            ('set_values', [['#a', 'b'], 'mutated']),
+        ]
+        assert len(script._PLANS) == 1
+        assert len(os.listdir(os.path.join(self.cache_dir, 'plans'))) == 1
+
+    def test_key_order_is_part_of_the_plan(self):
+        first = script.get_plan([{'set_values': {'#b': 1, '#a': 2}}])
+        second = script.get_plan([{'set_values': {'#a': 2, '#b': 1}}])
+        assert list(first[0].args) == ['#b', '#a']
+        assert list(second[0].args) == ['#a', '#b']
+
+    def test_bound_plans_are_forgotten_with_the_plan(self):
+        runner = Recorder()
+        plan = script.compile_script(['refresh'])
+        runner._run_plan(plan)
+        runner._run_plan(plan)
+        assert len(runner._bound_plans) == 1
+        del plan
+        gc.collect()
+        assert len(runner._bound_plans) == 0
+        assert runner.calls == [('refresh',), ('refresh',)]
+
+    def _write(self, name, content):
+        path = os.path.join(self.cache_dir, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def test_nested_includes(self):
+        self._write('login.yml', '- set_value: ["#user", "me"]\n')
+        self._write('setup.yml', '- include: login.yml\n- refresh\n')
+        main = self._write('main.yml', '- include: setup.yml\n- include: setup.yml\n')
+
+        runner = Recorder()
+        runner.command_script(filepath=main)
+        assert runner.calls == [('set_value', '#user', 'me'), ('refresh',)] * 2
+
+    def test_include_cycle(self):
+        self._write('a.yml', '- include: b.yml\n')
+        b = self._write('b.yml', '- include: a.yml\n')
+        with self.assertRaises(script.IncludeCycleError):
+            script.get_file_plan(b)
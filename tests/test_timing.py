@@ -0,0 +1,51 @@
+import unittest
+
+from FakeBrowser import fake_runner
+from PyWebRunner.timing import format_summary, percentile, summarize
+
+
+class TestCommandTiming(unittest.TestCase):
+
+    def setUp(self):
+        self.wt = fake_runner(time_commands=True)
+
+    def test_round_trips(self):
+        self.wt.go('about:blank')
+        self.wt.go('about:blank')
+        records = self.wt.timer.drain()
+        assert [r['verb'] for r in records] == ['go', 'go']
+        assert [r['round_trips'] for r in records] == [1, 1]
+        assert self.wt.timer.records == []
+
+    def test_polls_count_towards_outer_command(self):
+        checks = []
+
+        def ready(browser):
+            checks.append(1)
+            return len(checks) == 3
+
+        self.wt.wait_for(ready, poll_frequency=0.01)
+        record, = self.wt.timer.drain()
+        assert record['verb'] == 'wait_for'
+        assert record['polls'] == 3
+        assert record['ok']
+
+    def test_script_steps(self):
+        self.wt.command_script(script=[{'go': 'about:blank'}, {'wait': 0}])
+        records = self.wt.timer.drain()
+        assert [r['verb'] for r in records] == ['go', 'wait']
+
+    def test_summary(self):
+        records = [{'verb': 'click', 'seconds': s, 'round_trips': 2, 'polls': 1}
+                   for s in (0.1, 0.2, 0.3, 0.4)]
+        row, = summarize(records)
+        assert row['count'] == 4
+        assert row['p50'] == 0.2
+        assert row['max'] == 0.4
+        assert row['round_trips'] == 2
+        assert 'click' in format_summary(records)
+        assert percentile([], 50) is None
+
+
+if __name__ == '__main__':
+    unittest.main()
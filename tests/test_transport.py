@@ -0,0 +1,128 @@
+import json
+import socket
+import threading
+import unittest
+
+from selenium.webdriver.remote.command import Command
+from PyWebRunner.transport import PooledRemoteConnection
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    import httplib
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    import http.client as httplib
+
+
+class StubDriver(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    wbufsize = -1
+    connections = 0
+    # Close the connection after this many responses. (0 keeps it open.)
+    close_after = 0
+    # Number of POSTs to drop without answering.
+    drop = 0
+    posts = 0
+
+    def setup(self):
+        StubDriver.connections += 1
+        self.served = 0
+        BaseHTTPRequestHandler.setup(self)
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.served += 1
+        data = json.dumps({'status': 0, 'value': self.path}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json;charset=UTF-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+        if self.close_after and self.served >= self.close_after:
+            # Drop the connection without telling the client, like an idle timeout.
+            self.close_connection = True
+
+    def do_POST(self):
+        StubDriver.posts += 1
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if StubDriver.drop:
+            StubDriver.drop -= 1
+            self.close_connection = True
+            return
+        self.do_GET()
+
+
+class StubServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class TestPooledRemoteConnection(unittest.TestCase):
+
+    def setUp(self):
+        StubDriver.connections = 0
+        StubDriver.close_after = 0
+        StubDriver.drop = 0
+        StubDriver.posts = 0
+        self.server = StubServer(('127.0.0.1', 0), StubDriver)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.conn = PooledRemoteConnection('http://127.0.0.1:{}'.format(self.server.server_port),
+                                           resolve_ip=False)
+
+    def tearDown(self):
+        self.conn.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def get_title(self):
+        return self.conn.execute(Command.GET_TITLE, {'sessionId': 'abc'})
+
+    def test_reuses_connection(self):
+        for _ in range(5):
+            assert self.get_title()['value'] == '/session/abc/title'
+        assert StubDriver.connections == 1
+        assert self.conn.opened == 1
+
+    def test_reconnects_when_dropped(self):
+        StubDriver.close_after = 1
+        for _ in range(3):
+            assert self.get_title()['value'] == '/session/abc/title'
+        assert StubDriver.connections == 3
+
+    def test_does_not_resend_commands(self):
+        self.get_title()
+        # The driver may have clicked before the connection broke.
+        StubDriver.drop = 1
+        with self.assertRaises((httplib.HTTPException, socket.error)):
+            self.conn.execute(Command.CLICK_ELEMENT, {'sessionId': 'abc', 'id': '1'})
+        assert StubDriver.posts == 1
+
+    def test_threads(self):
+        results = []
+
+        def worker():
+            for _ in range(20):
+                results.append(self.get_title()['value'])
+
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(results) == 80
+        assert self.conn.opened <= 4
+
+    def test_replace_keeps_commands(self):
+        self.conn._commands['launchApp'] = ('POST', '/session/$sessionId/chromium/launch_app')
+        pooled = PooledRemoteConnection.replace(self.conn)
+        assert pooled._url == self.conn._url
+        assert 'launchApp' in pooled._commands
+
+
+if __name__ == '__main__':
+    unittest.main()
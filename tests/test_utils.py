@@ -0,0 +1,24 @@
+import os
+import unittest
+
+from PyWebRunner.utils import env_flag
+
+
+class TestEnvFlag(unittest.TestCase):
+
+    def tearDown(self):
+        os.environ.pop('WR_TEST_FLAG', None)
+
+    def test_unset(self):
+        assert env_flag('WR_TEST_FLAG') is False
+        assert env_flag('WR_TEST_FLAG', True) is True
+
+    def test_off(self):
+        for value in ('', '0', 'false', 'False', 'no', 'OFF'):
+            os.environ['WR_TEST_FLAG'] = value
+            assert env_flag('WR_TEST_FLAG', True) is False, value
+
+    def test_on(self):
+        for value in ('1', 'true', 'yes', 'on'):
+            os.environ['WR_TEST_FLAG'] = value
+            assert env_flag('WR_TEST_FLAG') is True, value
@@ -0,0 +1,168 @@
+import unittest
+
+from selenium.common.exceptions import (NoSuchElementException, StaleElementReferenceException,
+                                        TimeoutException, WebDriverException)
+from selenium.webdriver.remote.webelement import WebElement
+
+from FakeBrowser import FakeBrowser, fake_runner
+from PyWebRunner.WebRunner import RECENT
+from PyWebRunner.poll import Backoff, Fixed, get_strategy
+
+
+class SpinnerBrowser(FakeBrowser):
+    """
+    Fifty spinners. The first check finds them visible, by the second one
+    the spinners in removed are gone from the page, and the rest are hidden.
+    Passing a removed spinner to a script raises.
+    """
+
+    def __init__(self, removed=()):
+        FakeBrowser.__init__(self, matches=50)
+        self.removed = set(removed)
+
+    def execute_script(self, script, elements, key):
+        self.scripts.append((elements and list(elements), key))
+        if elements is not None and any(elem.id in self.removed for elem in elements):
+            raise StaleElementReferenceException()
+        return len(self.scripts) > 1
+
+
+class TestBrowserWaits(unittest.TestCase):
+
+    def runner(self, browser):
+        return fake_runner(browser, wait_backend='browser', timeout=2)
+
+    def test_single_round_trip(self):
+        wt = self.runner(FakeBrowser(async_result=WebElement(None, 'e1')))
+        wt.wait_for_presence('#a')
+        assert wt.browser.async_calls == [('presence', '#a', None, 2000)]
+        assert wt.browser.finds == 0
+        # The element the wait found is reused.
+        assert wt.get_element('#a').id == 'e1'
+
+    def test_timeout(self):
+        wt = self.runner(FakeBrowser(async_result=None))
+        with self.assertRaises(TimeoutException) as raised:
+            wt.wait_for_text('#a', 'hello')
+        assert wt.browser.async_calls == [('text', '#a', 'hello', 2000)]
+        assert raised.exception.msg == 'Timed out waiting for text of #a after 2 seconds.'
+
+    def test_falls_back_to_polling(self):
+        wt = self.runner(FakeBrowser(async_error=WebDriverException('document unloaded')))
+        wt.wait_for_presence('#a')
+        assert wt.browser.finds == 1
+
+    def test_text_on_page(self):
+        wt = self.runner(FakeBrowser(async_result=True))
+        wt.wait_for_text_on_page('Welcome')
+        assert wt.browser.async_calls == [('page_markup', None, 'Welcome', 2000)]
+        wt.wait_for_text_on_page('Welcome', markup=False)
+        assert wt.browser.async_calls[1] == ('page_text', None, 'Welcome', 2000)
+
+    def test_text_on_page_polls_offsets(self):
+        wt = self.runner(FakeBrowser(script_result=lambda browser: len(browser.scripts) - 2))
+        wt.wait_for_text_on_page('Welcome', backend='poll', poll=0.01)
+        # Only the offset comes back: -1 on the first check, 0 on the second.
+        assert wt.browser.scripts == [('Welcome', True), ('Welcome', True)]
+        assert wt.is_text_on_page('Welcome')
+
+    def test_per_call_backend(self):
+        wt = self.runner(FakeBrowser(async_result=True))
+        wt.wait_for_presence('#a', backend='poll')
+        assert wt.browser.async_calls == []
+        assert wt.browser.finds == 1
+
+
+class TestAllInvisible(unittest.TestCase):
+
+    def test_one_check_for_all_matches(self):
+        wt = fake_runner(SpinnerBrowser(), timeout=2)
+        wt.wait_for_all_invisible('.spinner', poll=0.01)
+        # One script per poll. The first keeps the elements in the page, the
+        # second only passes their key, so a removed spinner can't break it.
+        (first, key), (second, same_key) = wt.browser.scripts
+        assert len(first) == 50
+        assert second is None and same_key == key
+        (name, polls, seconds), = wt.wait_polls
+        assert polls == 2
+
+    def test_removed_before_the_first_check(self):
+        wt = fake_runner(SpinnerBrowser(removed=['e1']), timeout=2)
+        wt.wait_for_all_invisible('.spinner', poll=0.01)
+        # The first check drops the removed spinner, one script per element, and keeps the rest.
+        kept = [len(elements) for elements, key in wt.browser.scripts if key is not None]
+        assert kept == [50, 49]
+
+    def test_browser_backend(self):
+        wt = fake_runner(FakeBrowser(async_result=True, matches=50), timeout=2, wait_backend='browser')
+        wt.wait_for_all_invisible('.spinner')
+        (condition, selector, elements, timeout), = wt.browser.async_calls
+        assert condition == 'all_invisible'
+        assert len(elements) == 50
+
+    def test_no_matches(self):
+        wt = fake_runner(FakeBrowser(matches=0), timeout=2)
+        with self.assertRaises(NoSuchElementException):
+            wt.wait_for_all_invisible('.spinner')
+
+
+class TestPolling(unittest.TestCase):
+
+    def test_backoff_intervals(self):
+        intervals = Backoff(start=0.01, maximum=0.05).intervals()
+        assert [next(intervals) for i in range(5)] == [0.01, 0.02, 0.04, 0.05, 0.05]
+
+    def test_get_strategy(self):
+        assert isinstance(get_strategy('backoff'), Backoff)
+        assert get_strategy(None).interval == 0.5
+        assert get_strategy('0.25').interval == 0.25
+        strategy = Fixed(1)
+        assert get_strategy(strategy) is strategy
+        with self.assertRaises(ValueError):
+            get_strategy('sometimes')
+
+    def test_records_polls(self):
+        checks = []
+
+        def ready(browser):
+            checks.append(1)
+            if len(checks) < 3:
+                raise NoSuchElementException()
+            return True
+
+        wt = fake_runner(poll='backoff')
+        wt.wait_for(ready)
+        (name, polls, seconds), = wt.wait_polls
+        assert (name, polls) == ('ready', 3)
+        # 10ms + 20ms, not two half-second sleeps.
+        assert seconds < 0.25
+
+    def test_timeout(self):
+        wt = fake_runner(timeout=0.1)
+        with self.assertRaises(TimeoutException):
+            wt.wait_for(lambda browser: False, poll=0.04)
+        (name, polls, seconds), = wt.wait_polls
+        assert polls >= 2
+        assert seconds >= 0.1
+
+    def test_timeout_message(self):
+        def find_element(by, value):
+            raise NoSuchElementException('no such element', stacktrace=['find_element'])
+
+        wt = fake_runner(timeout=0.1)
+        wt.browser.find_element = find_element
+        with self.assertRaises(TimeoutException) as raised:
+            wt.wait_for_presence('#missing', poll=0.04)
+        # Like WebDriverWait, the last ignored error's stack trace is kept.
+        assert raised.exception.stacktrace == ['find_element']
+        assert raised.exception.msg == 'Timed out waiting for presence of #missing after 0.1 seconds.'
+
+    def test_wait_polls_are_bounded(self):
+        wt = fake_runner()
+        for _ in range(RECENT + 10):
+            wt.wait_for(lambda browser: True)
+        assert len(wt.wait_polls) == RECENT
+
+
+if __name__ == '__main__':
+    unittest.main()